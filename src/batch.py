@@ -0,0 +1,94 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from src.main import read_config, setup_simulation, run_simulation, analyze_results, average_delivery_time_per_step
+from src.utils import events
+
+SELFISHNESS_MODES = {'selfish': [True], 'cooperative': [False], 'both': [True, False]}
+
+
+def run_experiment(config_file: str, seed: int, selfishness: bool, rounds: int) -> dict:
+    """Run a single configuration with a single seed and return its results as a flat row"""
+    events.headless()
+    random.seed(seed)
+
+    started = time.perf_counter()
+    environment = run_simulation(setup_simulation(read_config(config_file)), rounds, selfishness)
+    wall_time = time.perf_counter() - started
+
+    results = analyze_results(environment, verbose=False)
+    row = {
+        'config': os.path.basename(config_file),
+        'seed': seed,
+        'selfishness': selfishness,
+        'rounds': rounds,
+        'wall_time': wall_time,
+        'items_delivered': sum(results['total_items_delivered'].values()),
+        'items_assigned': sum(results['total_items_assigned_to_agents'].values()),
+        'items_awaiting_pickup': results['total_items_awaiting_pickup'],
+        'items_in_transit': results['total_items_in_transit'],
+        'total_costs': sum(results['agent_total_costs'].values()),
+        'bundles_delivered': sum(results['agent_total_bundle_delivered'].values()),
+        'average_delivery_time_per_step': average_delivery_time_per_step(environment, verbose=False),
+    }
+    # Per agent breakdowns are kept as JSON objects, so every run still fits in a single row
+    for name, values in results.items():
+        if isinstance(values, dict):
+            row[f'{name}_per_agent'] = json.dumps(values)
+    return row
+
+
+def experiment_grid(config_files: list[str], seeds: list[int], selfishness_modes: list[bool], rounds: int) \
+        -> list[tuple[str, int, bool, int]]:
+    return [(config_file, seed, selfishness, rounds) for config_file, seed, selfishness in
+            itertools.product(config_files, seeds, selfishness_modes)]
+
+
+def run_batch(config_files: list[str], seeds: list[int], selfishness_modes: list[bool], rounds: int,
+              workers: int = None) -> list[dict]:
+    """Run every configuration x seed x selfishness combination across a process pool. Rows come back in the order
+    of the experiment grid, whatever the order the runs finish in"""
+    experiments = experiment_grid(config_files, seeds, selfishness_modes, rounds)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run_experiment, *zip(*experiments)))
+
+
+def write_rows(rows: list[dict], output: str) -> None:
+    if output.endswith('.parquet'):
+        # pandas (with pyarrow) is only needed for Parquet output
+        import pandas
+        pandas.DataFrame(rows).to_parquet(output, index=False)
+        return
+
+    with open(output, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=list(rows[0].keys()) if rows else [])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main(args):
+    rows = run_batch(args.config_files, args.seeds, SELFISHNESS_MODES[args.selfishness], args.rounds, args.workers)
+    write_rows(rows, args.output)
+    print(f"{len(rows)} runs written to {args.output}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a sweep of configurations, seeds and selfishness modes in "
+                                                 "parallel.")
+    parser.add_argument('config_files', nargs='+', help="Paths to the configuration JSON files.")
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0], help="Random seeds to run every configuration "
+                                                                          "with.")
+    parser.add_argument('--selfishness', choices=SELFISHNESS_MODES.keys(), default='both',
+                        help="Which agent behaviours to run.")
+    parser.add_argument('--rounds', type=int, default=100, help="Number of simulation steps of every run.")
+    parser.add_argument('--workers', type=int, help="Number of worker processes, defaults to the number of cores.")
+    parser.add_argument('--output', default='results.csv', help="CSV or .parquet file to write the results to.")
+    args = parser.parse_args()
+
+    main(args)
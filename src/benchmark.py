@@ -0,0 +1,275 @@
+"""Scaling benchmarks of the hot paths: the auction (Broker.auction_winners and
+TopCongestionAgent.receive_auction_information, also with routed bids), pathfinding (find_shortest_path) and the tick
+loop (Environment.simulation_step).
+
+Every benchmark has a default configuration and sweeps one parameter at a time away from it (grid size, agent count,
+station count, agent capacity and items per auction), which gives one scaling curve per parameter. A configuration is
+timed as the best of a few repeats, and its peak memory is measured in a separate run under tracemalloc. Results can be
+compared against a stored baseline: configurations slower than the baseline by more than the threshold count as
+regressions and make the run fail.
+
+    python -m src.benchmark --output results.json --curves curves --baseline benchmarks/baseline.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+from src.simulation.base.grid import Grid, Obstacle, PickupStation, DeliveryStation, create_empty_board
+from src.simulation.base.item import Item, ItemStatus
+from src.simulation.environments.broker import Broker
+from src.simulation.environments.top_congestion_environment import TopCongestionEnvironment
+from src.simulation.pathfinding import find_shortest_path
+from src.simulation.reactive_agents import TopCongestionAgent
+from src.simulation.routing import RoutePlanner
+from src.utils import events
+
+DEFAULT_THRESHOLD = 0.25
+NOISE_FLOOR = 0.0005  # Slowdowns below half a millisecond are timer noise, whatever their ratio
+DEFAULT_MEMORY_THRESHOLD = 0.25
+MEMORY_NOISE_FLOOR = 16 * 1024  # Growth below 16 KiB comes and goes with interned strings and caches
+
+
+def build_environment(grid: int, agents: int = 1, stations: int = 1, capacity: int = 1, items: int = 0,
+                      seed: int = 0) -> TopCongestionEnvironment:
+    """A square warehouse with a regular pattern of pillars, the pickup stations along the top row, the delivery
+    stations along the bottom row, the agents in between and `items` items waiting at the pickup stations"""
+    random.seed(seed)
+    state = Grid(create_empty_board(grid, grid), [grid, grid])
+
+    def spread(count: int) -> list[int]:
+        return [round((grid - 1) * (index + 1) / (count + 1)) for index in range(count)]
+
+    pickup_stations = [PickupStation([x, 0]) for x in spread(stations)]
+    delivery_stations = [DeliveryStation([x, grid - 1]) for x in spread(stations)]
+    agent_row = grid // 2 - 1
+    occupied = {(x, 0) for x in spread(stations)} | {(x, grid - 1) for x in spread(stations)} | \
+               {(x, agent_row) for x in spread(agents)}
+    for x in range(2, grid - 1, 4):
+        for y in range(2, grid - 1, 4):
+            if (x, y) not in occupied:
+                state.add_board_object(Obstacle([x, y]))
+    for station in pickup_stations + delivery_stations:
+        state.add_board_object(station)
+    for x in spread(agents):
+        state.add_board_object(TopCongestionAgent([x, agent_row], capacity))
+    for index in range(items):
+        source = pickup_stations[index % stations]
+        source.items.append(Item(0, source, delivery_stations[index % stations], ItemStatus.AWAITING_PICKUP))
+
+    return TopCongestionEnvironment(state)
+
+
+def _find_shortest_path(params: dict):
+    state = build_environment(params['grid']).state
+    corner = params['grid'] - 1
+    return lambda: find_shortest_path(state, [0, 0], [corner, corner])
+
+
+def _receive_auction_information(params: dict):
+    state = build_environment(params['grid'], capacity=params['capacity'], items=params['items']).state
+    items = [item for station in state.pickup_stations for item in station.items]
+    return lambda: state.agents[0].receive_auction_information(items, state)
+
+
+def _routed_auction_information(params: dict):
+    state = build_environment(params['grid'], capacity=params['capacity'], items=params['items']).state
+    state.route_planner = RoutePlanner(state)
+    items = [item for station in state.pickup_stations for item in station.items]
+    return lambda: state.agents[0].receive_auction_information(items, state)
+
+
+def _auction_winners(params: dict):
+    environment = build_environment(params['grid'], params['agents'], capacity=params['capacity'],
+                                    items=params['items'])
+    broker = Broker(environment.state)
+    return broker.auction_winners
+
+
+def _simulation_step(params: dict):
+    environment = build_environment(params['grid'], params['agents'], params['stations'], params['capacity'],
+                                    params['items'])
+
+    def run():
+        for _ in range(params['ticks']):
+            environment.simulation_step(False)
+    return run
+
+
+# name: (function returning the callable to time for a configuration, default configuration, swept parameters)
+BENCHMARKS = {
+    'find_shortest_path': (_find_shortest_path, {'grid': 32}, {'grid': [16, 32, 64, 128]}),
+    'receive_auction_information': (
+        _receive_auction_information, {'grid': 32, 'capacity': 2, 'items': 3},
+        {'capacity': [1, 2, 3], 'items': [2, 3, 4, 5]}),
+    'routed_auction_information': (
+        _routed_auction_information, {'grid': 32, 'capacity': 2, 'items': 3},
+        {'capacity': [1, 2, 3], 'items': [2, 3, 4, 5]}),
+    'auction_winners': (
+        _auction_winners, {'grid': 32, 'agents': 2, 'capacity': 2, 'items': 3},
+        {'agents': [1, 2, 3], 'capacity': [1, 2, 3], 'items': [1, 2, 3]}),
+    'simulation_step': (
+        _simulation_step, {'grid': 32, 'agents': 2, 'stations': 2, 'capacity': 2, 'items': 2, 'ticks': 5},
+        {'grid': [16, 32, 64], 'agents': [1, 2, 3], 'stations': [1, 2, 4], 'capacity': [1, 2, 3]}),
+}
+
+
+def configurations(name: str) -> list[tuple[str, dict]]:
+    """The configurations of a benchmark as (swept parameter, configuration), the default one first"""
+    _, defaults, sweeps = BENCHMARKS[name]
+    found = [(None, dict(defaults))]
+    for parameter, values in sweeps.items():
+        for value in values:
+            params = {**defaults, parameter: value}
+            if params != defaults:
+                found.append((parameter, params))
+    return found
+
+
+def key(name: str, params: dict) -> str:
+    return f"{name}[{','.join(f'{parameter}={value}' for parameter, value in sorted(params.items()))}]"
+
+
+def measure(name: str, params: dict, repeats: int = 3) -> dict:
+    setup = BENCHMARKS[name][0]
+    best = float('inf')
+    for _ in range(repeats):
+        run = setup(params)
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+
+    run = setup(params)
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'key': key(name, params), 'benchmark': name, 'params': params, 'seconds': best, 'peak_bytes': peak}
+
+
+def run_suite(names: list[str] = None, repeats: int = 3) -> list[dict]:
+    events.headless()
+    results = []
+    for name in names or BENCHMARKS:
+        for parameter, params in configurations(name):
+            result = measure(name, params, repeats)
+            result['swept'] = parameter
+            results.append(result)
+            print(f"{result['key']:<80}{result['seconds'] * 1000:>12.3f} ms{result['peak_bytes'] / 1024:>12.1f} KiB")
+    return results
+
+
+def compare(results: list[dict], baseline: list[dict], threshold: float = DEFAULT_THRESHOLD,
+            memory_threshold: float = DEFAULT_MEMORY_THRESHOLD) -> list[dict]:
+    """Configurations that got slower than in the baseline by more than `threshold` (0.25 for 25%), or whose peak
+    memory grew by more than `memory_threshold`. Every regression names the figure that regressed"""
+    baseline_results = {entry['key']: entry for entry in baseline}
+    regressions = []
+    for result in results:
+        reference = baseline_results.get(result['key'], {})
+        for figure, limit, noise_floor in (('seconds', threshold, NOISE_FLOOR),
+                                           ('peak_bytes', memory_threshold, MEMORY_NOISE_FLOOR)):
+            value, baseline_value = result.get(figure), reference.get(figure)
+            if value is not None and baseline_value and value > baseline_value * (1 + limit) and \
+                    value - baseline_value > noise_floor:
+                regressions.append({'key': result['key'], 'figure': figure, 'value': value,
+                                    'baseline': baseline_value, 'ratio': value / baseline_value})
+    return regressions
+
+
+def describe(regression: dict) -> str:
+    if regression['figure'] == 'peak_bytes':
+        return (f"peak memory {regression['value'] / 1024:.1f} KiB against {regression['baseline'] / 1024:.1f} KiB "
+                f"({regression['ratio']:.2f}x)")
+    return (f"{regression['value'] * 1000:.3f} ms against {regression['baseline'] * 1000:.3f} ms "
+            f"({regression['ratio']:.2f}x)")
+
+
+def scaling_curves(results: list[dict]) -> dict:
+    """For every benchmark and swept parameter, the (value, seconds, peak bytes) points of its curve"""
+    curves = {}
+    for result in results:
+        _, defaults, sweeps = BENCHMARKS[result['benchmark']]
+        for parameter in sweeps:
+            # The default configuration is a point on every curve of its benchmark
+            if result['swept'] in (parameter, None):
+                curves.setdefault(result['benchmark'], {}).setdefault(parameter, []).append(
+                    (result['params'][parameter], result['seconds'], result['peak_bytes']))
+    for benchmark_curves in curves.values():
+        for points in benchmark_curves.values():
+            points.sort()
+    return curves
+
+
+def plot_curves(curves: dict, directory: str) -> None:
+    # matplotlib is optional, without it the curves are only written as JSON
+    try:
+        import matplotlib
+    except ImportError:
+        print("matplotlib is not installed, the curves are not plotted", file=sys.stderr)
+        return
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    for benchmark, benchmark_curves in curves.items():
+        for parameter, points in benchmark_curves.items():
+            figure, (time_axis, memory_axis) = plt.subplots(1, 2, figsize=(10, 4))
+            values = [point[0] for point in points]
+            time_axis.plot(values, [point[1] * 1000 for point in points], marker='o')
+            time_axis.set(xlabel=parameter, ylabel='wall time (ms)', yscale='log')
+            memory_axis.plot(values, [point[2] / 1024 for point in points], marker='o')
+            memory_axis.set(xlabel=parameter, ylabel='peak memory (KiB)', yscale='log')
+            figure.suptitle(f"{benchmark} by {parameter}")
+            figure.tight_layout()
+            figure.savefig(os.path.join(directory, f"{benchmark}_{parameter}.png"))
+            plt.close(figure)
+
+
+def main(args) -> int:
+    results = run_suite(args.benchmarks, args.repeats)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=1)
+    if args.curves:
+        curves = scaling_curves(results)
+        os.makedirs(args.curves, exist_ok=True)
+        with open(os.path.join(args.curves, 'curves.json'), 'w') as file:
+            json.dump(curves, file, indent=1)
+        plot_curves(curves, args.curves)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold, args.memory_threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression['key']}: {describe(regression)}")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark how the auction, pathfinding and the tick loop scale.")
+    parser.add_argument('benchmarks', nargs='*', help=f"Benchmarks to run out of {', '.join(BENCHMARKS)}, all of "
+                                                      f"them by default.")
+    parser.add_argument('--repeats', type=int, default=3, help="Timed runs per configuration, the best one counts.")
+    parser.add_argument('--output', help="Write the results as JSON to this file, e.g. to store a new baseline.")
+    parser.add_argument('--curves', help="Write the scaling curves as JSON and PNG plots into this directory.")
+    parser.add_argument('--baseline', help="Results of an earlier run to compare against.")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Slowdown against the baseline that counts as a regression, 0.25 for 25%%.")
+    parser.add_argument('--memory-threshold', type=float, default=DEFAULT_MEMORY_THRESHOLD,
+                        help="Growth of the peak memory against the baseline that counts as a regression.")
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    sys.exit(main(args))
@@ -0,0 +1,242 @@
+"""Differential testing of the alternative engines against the reference implementation.
+
+The reference is the plain simulation: every tick stepped by TopCongestionEnvironment, the auction decided by
+Broker.auction_winners and the paths found by find_shortest_path. Every engine in ENGINES runs the same seeded random
+scenarios, and its per-tick states (agent positions, costs, allocations, item statuses, station backlogs) and final
+metrics have to equal those of the reference. Paths found on a reused walkable grid, like the planners' workers do, are
+compared against find_shortest_path as well.
+
+A mismatching scenario is shrunk to a minimal one that still mismatches: as few ticks, agents, stations and obstacles as
+possible. The shrunk scenario is written out as a configuration file for `main.py`.
+
+    python -m src.differential --engines event_driven agent_store --scenarios 50 --ticks 80 --output mismatches
+"""
+
+import argparse
+import json
+import os
+import random
+from typing import Callable, NamedTuple
+
+from src.main import setup_simulation, analyze_results, average_delivery_time_per_step
+from src.scenarios import generate_scenario, LAYOUTS, PLACEMENTS
+from src.simulation.base.environment import Environment
+from src.simulation.pathfinding import find_shortest_path, tsp_path, walkable_grid, path_on
+from src.simulation.planning import PooledPlanner
+from src.simulation.sharding import RegionWorkers
+from src.utils import events
+
+
+class Engine(NamedTuple):
+    # Prepares a freshly set up environment, e.g. by attaching a planner to it
+    setup: Callable[[Environment], None]
+    event_driven: bool = False
+
+
+def _reference(environment: Environment) -> None:
+    pass
+
+
+def _agent_store(environment: Environment) -> None:
+    environment.state.use_agent_store()
+
+
+def _pooled(environment: Environment) -> None:
+    environment.planner = PooledPlanner(environment.state, 2)
+
+
+def _sharded(environment: Environment) -> None:
+    environment.regions = RegionWorkers(environment, 2)
+
+
+REFERENCE = Engine(_reference)
+ENGINES = {
+    'event_driven': Engine(_reference, event_driven=True),
+    'agent_store': Engine(_agent_store),
+    'pooled': Engine(_pooled),
+    'sharded': Engine(_sharded),
+}
+
+
+def random_scenario(seed: int) -> dict:
+    """A small scenario; small enough for the auction, which is exponential in the number of bids, to stay fast"""
+    rng = random.Random(seed)
+    return generate_scenario(rng.randint(6, 16), rng.randint(6, 16), seed=seed, layout=rng.choice(LAYOUTS),
+                             obstacle_density=rng.uniform(0, 0.3), pickup_stations=rng.randint(1, 3),
+                             delivery_stations=rng.randint(1, 3), placement=rng.choice(PLACEMENTS),
+                             agents=rng.randint(1, 3), capacity=rng.randint(1, 2),
+                             arrival_interval=rng.randint(1, 10), arrival_batch=rng.randint(1, 2),
+                             max_items=rng.randint(2, 12))
+
+
+def _item_key(item) -> tuple:
+    # Item ids are random, so items are told apart by what the scenario determines about them
+    return item.created_tick, tuple(item.source.position), tuple(item.destination.position)
+
+
+def capture_state(environment: Environment) -> dict:
+    state = environment.state
+    return {
+        'tick': environment.tick,
+        'items_added': environment.items_added,
+        'agents': [{
+            'position': tuple(agent.position),
+            'total_cost': agent.total_cost,
+            'items': [(_item_key(item), item.status.name, item.pickup_tick, item.delivered_tick)
+                      for item in agent.items],
+            'allocations': [(bid['costs'], [_item_key(item) for item in bid['ordered_bundle']])
+                            for bid in agent.winner_bids],
+        } for agent in state.agents],
+        'stations': [[_item_key(item) for item in station.items] for station in state.pickup_stations],
+    }
+
+
+def final_metrics(environment: Environment) -> dict:
+    return {**analyze_results(environment, verbose=False),
+            'average_delivery_time_per_step': average_delivery_time_per_step(environment, verbose=False)}
+
+
+def run_engine(engine: Engine, scenario: dict, seed: int, ticks: int, selfishness: bool) -> tuple[dict, dict]:
+    """The states after every step the engine took, by tick, and the final metrics"""
+    random.seed(seed)
+    environment = setup_simulation(scenario)
+    engine.setup(environment)
+    states = {}
+    try:
+        while environment.tick < ticks:
+            if not engine.event_driven or not environment.skip_ahead(selfishness, ticks - environment.tick):
+                environment.simulation_step(selfishness)
+            states[environment.tick] = capture_state(environment)
+    finally:
+        if environment.planner is not None:
+            environment.planner.close()
+        if environment.regions is not None:
+            environment.regions.close()
+    return states, final_metrics(environment)
+
+
+def first_difference(reference, other, path: str = '') -> tuple | None:
+    """(path, reference value, other value) of the first place two nested structures differ, None if they are equal"""
+    if isinstance(reference, dict) and isinstance(other, dict) and reference.keys() == other.keys():
+        for key in reference:
+            difference = first_difference(reference[key], other[key], f"{path}.{key}" if path else str(key))
+            if difference is not None:
+                return difference
+        return None
+    if isinstance(reference, list) and isinstance(other, list) and len(reference) == len(other):
+        for index, (left, right) in enumerate(zip(reference, other)):
+            difference = first_difference(left, right, f"{path}[{index}]")
+            if difference is not None:
+                return difference
+        return None
+    return None if reference == other else (path, reference, other)
+
+
+def compare_engine(engine: Engine, scenario: dict, seed: int, ticks: int, selfishness: bool) -> dict | None:
+    """The first mismatch between the engine and the reference on a scenario, None if they agree"""
+    reference_states, reference_metrics = run_engine(REFERENCE, scenario, seed, ticks, selfishness)
+    states, metrics = run_engine(engine, scenario, seed, ticks, selfishness)
+    # Event driven engines do not stop at every tick, they are compared at the ticks they stop at
+    for tick, state in states.items():
+        difference = first_difference(reference_states.get(tick), state)
+        if difference is not None:
+            return {'tick': tick, 'field': difference[0], 'expected': difference[1], 'actual': difference[2]}
+    difference = first_difference(reference_metrics, metrics)
+    if difference is not None:
+        return {'tick': ticks, 'field': f"metrics.{difference[0]}", 'expected': difference[1],
+                'actual': difference[2]}
+    return None
+
+
+def compare_paths(scenario: dict, pairs: int = 20, seed: int = 0) -> dict | None:
+    """The first pair of positions the reused walkable grid finds another path between than find_shortest_path"""
+    state = setup_simulation(scenario).state
+    grid = walkable_grid(state.obstacle_layer)
+    rng = random.Random(seed)
+    free = [(x, y) for x in range(state.obstacle_layer.shape[0]) for y in range(state.obstacle_layer.shape[1])
+            if not state.obstacle_layer[x, y]]
+    for _ in range(pairs):
+        start, goal = rng.sample(free, 2)
+        reference = [(node.x, node.y) for node in tsp_path(state, start, goal)]
+        reused = [(node.x, node.y) for node in path_on(grid, start, goal)]
+        if reference != reused or (len(reference) > 1 and find_shortest_path(state, start, goal) != reference[1]):
+            return {'start': start, 'goal': goal, 'expected': reference, 'actual': reused}
+    return None
+
+
+def _smaller_scenarios(scenario: dict):
+    """Candidates that each drop a part of the scenario, the biggest cuts first"""
+    for kind, minimum in (('agents', 1), ('pickup_stations', 1), ('delivery_stations', 1)):
+        for index in range(len(scenario[kind])):
+            if len(scenario[kind]) > minimum:
+                yield {**scenario, kind: scenario[kind][:index] + scenario[kind][index + 1:]}
+    obstacles = scenario['obstacles']
+    size = len(obstacles)
+    while size >= 1:
+        for start in range(0, len(obstacles), size):
+            yield {**scenario, 'obstacles': obstacles[:start] + obstacles[start + size:]}
+        size //= 2
+
+
+def shrink(engine: Engine, scenario: dict, seed: int, ticks: int, selfishness: bool, mismatch: dict) \
+        -> tuple[dict, int, dict]:
+    """Reduce a mismatching scenario and run length as long as the engine still mismatches"""
+    # States are captured by the tick after each step, so running up to the mismatching tick is enough
+    ticks = mismatch['tick']
+    changed = True
+    while changed:
+        changed = False
+        for candidate in _smaller_scenarios(scenario):
+            candidate_mismatch = compare_engine(engine, candidate, seed, ticks, selfishness)
+            if candidate_mismatch is not None:
+                scenario, mismatch, changed = candidate, candidate_mismatch, True
+                ticks = mismatch['tick']
+                break
+    return scenario, ticks, mismatch
+
+
+def run_differential(engines: list[str], scenarios: int, ticks: int, seed: int = 0, output: str = None,
+                     engine_table: dict = None) -> list[dict]:
+    """Compare every engine against the reference on `scenarios` random scenarios and return the shrunk mismatches"""
+    events.headless()
+    engine_table = engine_table or ENGINES
+    failures = []
+    for scenario_seed in range(seed, seed + scenarios):
+        scenario = random_scenario(scenario_seed)
+        path_mismatch = compare_paths(scenario, seed=scenario_seed)
+        if path_mismatch is not None:
+            failures.append({'engine': 'pathfinding', 'seed': scenario_seed, 'scenario': scenario, **path_mismatch})
+            print(f"scenario {scenario_seed}: pathfinding MISMATCH from {path_mismatch['start']} to "
+                  f"{path_mismatch['goal']}")
+        for name in engines:
+            engine = engine_table[name]
+            selfishness = scenario_seed % 2 == 0
+            mismatch = compare_engine(engine, scenario, scenario_seed, ticks, selfishness)
+            if mismatch is None:
+                print(f"scenario {scenario_seed}: {name} agrees")
+                continue
+            shrunk, shrunk_ticks, mismatch = shrink(engine, scenario, scenario_seed, ticks, selfishness, mismatch)
+            failure = {'engine': name, 'seed': scenario_seed, 'selfishness': selfishness, 'ticks': shrunk_ticks,
+                       'scenario': shrunk, **mismatch}
+            failures.append(failure)
+            print(f"scenario {scenario_seed}: {name} MISMATCH at tick {mismatch['tick']} in {mismatch['field']}: "
+                  f"{mismatch['expected']!r} != {mismatch['actual']!r}, shrunk to {len(shrunk['agents'])} agents, "
+                  f"{len(shrunk['obstacles'])} obstacles and {shrunk_ticks} ticks")
+            if output:
+                os.makedirs(output, exist_ok=True)
+                with open(os.path.join(output, f"{name}_{scenario_seed}.json"), 'w') as file:
+                    json.dump(failure, file, indent=1, default=repr)
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the alternative engines against the reference simulation.")
+    parser.add_argument('--engines', nargs='+', choices=list(ENGINES), default=list(ENGINES),
+                        help="Engines to compare, all of them by default.")
+    parser.add_argument('--scenarios', type=int, default=20, help="Number of random scenarios.")
+    parser.add_argument('--ticks', type=int, default=60, help="Ticks to run every scenario for.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the first scenario.")
+    parser.add_argument('--output', help="Write every shrunk mismatch into this directory.")
+    args = parser.parse_args()
+
+    raise SystemExit(1 if run_differential(args.engines, args.scenarios, args.ticks, args.seed, args.output) else 0)
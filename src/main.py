@@ -1,89 +1,132 @@
 import argparse
 import json
+import os
+from typing import TYPE_CHECKING
 
+from src.simulation.arrivals import arrival_source
 from src.simulation.base.environment import Environment
 from src.simulation.base.grid import Grid, Obstacle, create_empty_board, PickupStation, DeliveryStation
 from src.simulation.base.item import ItemStatus, Item
 from src.simulation.environments.top_congestion_environment import TopCongestionEnvironment
+from src.simulation.maps import load_obstacle_map
+from src.simulation.metrics import MetricsCollector
 from src.simulation.reactive_agents import TopCongestionAgent
+from src.simulation.routing import RoutePlanner
+from src.utils import events, profiling
 
+if TYPE_CHECKING:
+    from src.simulation.checkpoint import Checkpointer
 
-def average_delivery_time_per_step(environment: Environment) -> None:
+BUNDLE_ROUTINGS = ('nearest', 'pdp')
+
+
+def _archived(environment: Environment, counter: str, index: int) -> int:
+    """What the archive of delivered work counted for the agent at `index`, 0 without an archive"""
+    counts = getattr(environment.archive, counter, [])
+    return counts[index] if index < len(counts) else 0
+
+
+def average_delivery_time_per_step(environment: Environment, verbose: bool = True) -> float:
     """Calculate the average delivery time per simulation step for all delivered items"""
     agents = environment.state.agents
     delivery_times = [item.delivered_tick - item.created_tick for agent in agents
                       for item in agent.items if item.status == ItemStatus.DELIVERED]
-    average_delivery_time = sum(delivery_times) / len(delivery_times) if delivery_times else 0
+    delivered = len(delivery_times) + sum(_archived(environment, 'items_delivered', i) for i in range(len(agents)))
+    total_delivery_time = sum(delivery_times) + sum(_archived(environment, 'delivery_ticks', i)
+                                                    for i in range(len(agents)))
+    average_delivery_time = total_delivery_time / delivered if delivered else 0
     average_delivery_time_per_step = average_delivery_time / environment.tick if environment.tick else 0
-    print(f"Average delivery time per step: {average_delivery_time_per_step}")
+    if verbose:
+        print(f"Average delivery time per step: {average_delivery_time_per_step}")
+    return average_delivery_time_per_step
 
 
-def total_items_delivered(environment: Environment) -> None:
+def total_items_delivered(environment: Environment, verbose: bool = True) -> dict[int, int]:
     """Calculate the total number of items delivered by each agent"""
     agents = environment.state.agents
     total_delivered = {}
     for i, agent in enumerate(agents):
-        agent_items_delivered = sum(1 for item in agent.items if item.status == ItemStatus.DELIVERED)
+        agent_items_delivered = sum(1 for item in agent.items if item.status == ItemStatus.DELIVERED) + \
+            _archived(environment, 'items_delivered', i)
         total_delivered[i] = agent_items_delivered
-    print(f"Total items delivered: {total_delivered}")
+    if verbose:
+        print(f"Total items delivered: {total_delivered}")
+    return total_delivered
 
 
-def total_items_awaiting_pickup(environment: Environment) -> None:
+def total_items_awaiting_pickup(environment: Environment, verbose: bool = True) -> int:
     """Calculate the total number of items awaiting pickup at all stations"""
     stations = environment.state.pickup_stations
     total_awaiting_pickup = sum(len(station.items) for station in stations)
-    print(f"Total items awaiting pickup: {total_awaiting_pickup}")
+    if verbose:
+        print(f"Total items awaiting pickup: {total_awaiting_pickup}")
+    return total_awaiting_pickup
 
 
-def total_items_assigned_to_agents(environment: Environment) -> None:
+def total_items_assigned_to_agents(environment: Environment, verbose: bool = True) -> dict[int, int]:
     """Calculate the total number of items assigned to agents at all stations"""
     agents = environment.state.agents
     total_items_assigned = {}
     for i, agent in enumerate(agents):
         agent_items_assigned = sum(1 for item in agent.items if item.status == ItemStatus.ASSIGNED_TO_AGENT)
         total_items_assigned[i] = agent_items_assigned
-    print(f"Total items assigned to agent: {total_items_assigned}")
+    if verbose:
+        print(f"Total items assigned to agent: {total_items_assigned}")
+    return total_items_assigned
 
 
-def total_items_in_transit(environment: Environment) -> None:
+def total_items_in_transit(environment: Environment, verbose: bool = True) -> int:
     """Calculate the total number of items in transit"""
     agents = environment.state.agents
     total_in_transit = sum(1 for agent in agents for item in agent.items if item.status == ItemStatus.IN_TRANSIT)
-    print(f"Total items in transit: {total_in_transit}")
+    if verbose:
+        print(f"Total items in transit: {total_in_transit}")
+    return total_in_transit
 
 
-def agent_total_costs(environment: Environment) -> None:
+def agent_total_costs(environment: Environment, verbose: bool = True) -> dict[int, int]:
     """Calculate the total cost of each agent"""
     agents = environment.state.agents
     costs = {agent_id: agent.total_cost for agent_id, agent in enumerate(agents)}
-    print(f"Agent total costs: {costs}")
+    if verbose:
+        print(f"Agent total costs: {costs}")
+    return costs
 
 
-def agent_total_bundle_delivered(environment: Environment) -> None:
+def agent_total_bundle_delivered(environment: Environment, verbose: bool = True) -> dict[int, int]:
     """Calculate the total number of bundles delivered by each agent"""
     agents = environment.state.agents
     total_bundle_delivered = {}
     for i, agent in enumerate(agents):
-        agent_bundle_delivered = 0
+        agent_bundle_delivered = _archived(environment, 'bundles_delivered', i)
         for winner in agent.winner_bids:
             if all(item.status == ItemStatus.DELIVERED for item in winner['ordered_bundle']):
                 agent_bundle_delivered += 1
         total_bundle_delivered[i] = agent_bundle_delivered
-    print(f"Agent total number of delivered bundles: {total_bundle_delivered}")
+    if verbose:
+        print(f"Agent total number of delivered bundles: {total_bundle_delivered}")
+    return total_bundle_delivered
 
 
-def analyze_results(environment: Environment) -> None:
-    total_items_delivered(environment)
-    total_items_assigned_to_agents(environment)
-    total_items_awaiting_pickup(environment)
-    total_items_in_transit(environment)
-    agent_total_costs(environment)
-    agent_total_bundle_delivered(environment)
+def analyze_results(environment: Environment, verbose: bool = True) -> dict:
+    return {
+        'total_items_delivered': total_items_delivered(environment, verbose),
+        'total_items_assigned_to_agents': total_items_assigned_to_agents(environment, verbose),
+        'total_items_awaiting_pickup': total_items_awaiting_pickup(environment, verbose),
+        'total_items_in_transit': total_items_in_transit(environment, verbose),
+        'agent_total_costs': agent_total_costs(environment, verbose),
+        'agent_total_bundle_delivered': agent_total_bundle_delivered(environment, verbose),
+    }
 
 
 def read_config(file_path):
     with open(file_path, 'r') as file:
         config = json.load(file)
+    # Obstacle maps and arrival traces are found next to the configuration
+    if isinstance(config.get('obstacle_map'), str):
+        config['obstacle_map'] = os.path.join(os.path.dirname(file_path), config['obstacle_map'])
+    if 'path' in config.get('arrivals', {}):
+        config['arrivals']['path'] = os.path.join(os.path.dirname(file_path), config['arrivals']['path'])
     return config
 
 
@@ -93,8 +136,10 @@ def setup_simulation(config) -> Environment:
     board = create_empty_board(grid_size[0], grid_size[1])
     grid = Grid(board, grid_size)
 
-    # Initialize Obstacles
-    for obstacle_coords in config['obstacles']:
+    # Initialize Obstacles, those of an obstacle map in bulk
+    if 'obstacle_map' in config:
+        grid.load_obstacle_map(load_obstacle_map(config['obstacle_map'], grid.board_dimensions()))
+    for obstacle_coords in config.get('obstacles', []):
         obstacle = Obstacle(obstacle_coords)
         grid.add_board_object(obstacle)
 
@@ -109,38 +154,168 @@ def setup_simulation(config) -> Environment:
         grid.add_board_object(delivery_station)
 
     for agent_coords in config['agents']:
-        agent = TopCongestionAgent(agent_coords, 3)
+        agent = TopCongestionAgent(agent_coords, config.get('agent_capacity', 3))
         grid.add_board_object(agent)
 
+    # Bundles are costed by their pickups, nearest first, or along planned pickup and delivery routes
+    routing = config.get('bundle_routing', 'nearest')
+    if routing not in BUNDLE_ROUTINGS:
+        raise ValueError(f"Unknown bundle routing {routing}, expected one of {', '.join(BUNDLE_ROUTINGS)}")
+    if routing == 'pdp':
+        grid.route_planner = RoutePlanner(grid)
+
     for pickup_station in grid.pickup_stations:
         for i in range(1):
             pickup_station.items.append(
                 Item(status=ItemStatus.AWAITING_PICKUP, created_tick=0, source=pickup_station,
                      destination=grid.delivery_stations[i]))
 
-    return TopCongestionEnvironment(grid)
+    environment = TopCongestionEnvironment(grid)
+    arrivals = config.get('arrivals', {})
+    environment.arrival_interval = arrivals.get('interval', environment.arrival_interval)
+    environment.arrival_batch = arrivals.get('batch', environment.arrival_batch)
+    environment.max_items = arrivals.get('max_items', environment.max_items)
+    environment.arrival_source = arrival_source(arrivals)
+
+    return environment
 
 
-def run_simulation(environment: Environment, rounds: int, selfishness: bool) -> Environment:
-    for i in range(rounds):
-        environment.simulation_step(selfishness)
+def run_simulation(environment: Environment, rounds: int, selfishness: bool,
+                   checkpointer: 'Checkpointer' = None, event_driven: bool = False) -> Environment:
+    """Step the environment `rounds` ticks ahead. Event driven runs jump over the ticks in which agents only walk
+    towards their targets, and end in the same state as stepping through every tick"""
+    end_tick = environment.tick + rounds
+    while environment.tick < end_tick:
+        previous_tick = environment.tick
+        if not event_driven or not environment.skip_ahead(selfishness, end_tick - environment.tick):
+            environment.simulation_step(selfishness)
+        if checkpointer is not None:
+            checkpointer.after_step(environment, previous_tick)
 
     return environment
 
 
 def main(args):
-    config = read_config(args.config_file)
-    environment = setup_simulation(config)
-    environment = run_simulation(environment, args.rounds, args.selfishness)
+    if args.headless:
+        events.headless()
+
+    if args.resume:
+        from src.simulation.checkpoint import CheckpointError, METADATA, latest_checkpoint, load_checkpoint
+        checkpoint = latest_checkpoint(args.resume) if not os.path.isfile(
+            os.path.join(args.resume, METADATA)) else args.resume
+        if checkpoint is None:
+            raise CheckpointError(f"No checkpoint found in {args.resume}")
+        environment = load_checkpoint(checkpoint)
+    else:
+        config = read_config(args.config_file)
+        environment = setup_simulation(config)
+    if args.agent_store:
+        environment.state.use_agent_store()
+    if args.bundle_routing is not None:
+        environment.state.route_planner = RoutePlanner(environment.state) if args.bundle_routing == 'pdp' else None
+    if args.archive and environment.archive is None:
+        from src.simulation.archive import Archive
+        environment.archive = Archive(args.archive, args.archive_batch)
+    # The optional subsystems are only imported when asked for, so that short runs start fast
+    checkpointer = recorder = metrics = memory = renderer = server = None
+    if args.checkpoint_dir:
+        from src.simulation.checkpoint import Checkpointer
+        checkpointer = Checkpointer(args.checkpoint_dir, args.checkpoint_interval)
+    if args.trace:
+        from src.simulation.trace import TraceRecorder
+        recorder = TraceRecorder(args.trace, environment, args.keyframe_interval)
+    if args.metrics:
+        metrics = MetricsCollector(args.metrics, environment)
+    if args.memory:
+        from src.simulation.memory import MemoryTracker
+        memory = MemoryTracker(args.memory, environment, args.memory_interval)
+    profiler = profiling.enable(profiling.Profiler(args.profile_ticks)) if args.profile or args.profile_ticks else None
+    if args.display:
+        from src.simulation.rendering import Renderer
+        renderer = Renderer(environment.state, args.display_fps)
+    if args.metrics_port is not None:
+        from src.simulation.exposition import MetricsServer
+        server = MetricsServer(environment, args.metrics_port, args.metrics_host)
+    if args.shards > 1:
+        from src.simulation.sharding import RegionWorkers
+        environment.regions = RegionWorkers(environment, args.shards)
+    elif args.decision_workers > 1:
+        from src.simulation.planning import PooledPlanner
+        environment.planner = PooledPlanner(environment.state, args.decision_workers)
+    try:
+        # The number of rounds counts from the start of the run, also when resuming it from a checkpoint
+        environment = run_simulation(environment, args.rounds - environment.tick, args.selfishness, checkpointer,
+                                     args.event_driven)
+    finally:
+        if recorder is not None:
+            recorder.close()
+        if metrics is not None:
+            metrics.close()
+        if memory is not None:
+            memory.close()
+        if server is not None:
+            server.close()
+        if renderer is not None:
+            renderer.close(args.display_linger)
+        if profiler is not None:
+            profiling.disable()
+            profiler.close()
+        if environment.planner is not None:
+            environment.planner.close()
+        if environment.regions is not None:
+            environment.regions.close()
+        if environment.arrival_source is not None:
+            environment.arrival_source.close()
+        if environment.archive is not None:
+            environment.archive.close()
     analyze_results(environment)
+    if profiler is not None:
+        print(profiler.report())
+    if memory is not None:
+        print(memory.report())
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Run a simulation based on a JSON configuration.")
-    parser.add_argument('config_file', help="Path to the configuration JSON file.")
-    parser.add_argument('--display', action='store_true', help="Display the grid after each step of the simulation.")
+    parser.add_argument('config_file', nargs='?', help="Path to the configuration JSON file.")
+    parser.add_argument('--display', action='store_true', help="Display the run in a window drawn by a separate "
+                                                                "process.")
+    parser.add_argument('--display-fps', type=float, default=20, help="Frame rate of the display; the ticks in "
+                                                                        "between frames are not drawn.")
+    parser.add_argument('--display-linger', type=float, default=0, help="Seconds the window stays open after the "
+                                                                         "run, unless it is closed before.")
     parser.add_argument('--rounds', type=int, default=100, help="Number of simulation steps to run.")
     parser.add_argument('--selfishness', type=bool, help="Whether the agents should act selfishly or not.")
+    parser.add_argument('--event-driven', action='store_true', help="Skip over ticks in which agents only walk.")
+    parser.add_argument('--decision-workers', type=int, default=1, help="Number of worker processes the agents' "
+                                                                          "decisions are computed in.")
+    parser.add_argument('--shards', type=int, default=1, help="Number of grid regions whose agents are owned, "
+                                                                "decided on and enacted by a worker process each.")
+    parser.add_argument('--agent-store', action='store_true', help="Keep the agent positions in arrays and enact the "
+                                                                   "moves of a tick at once.")
+    parser.add_argument('--bundle-routing', choices=BUNDLE_ROUTINGS, help="Cost bundles by their pickups, nearest "
+                                                                          "first, or along a planned pickup and "
+                                                                          "delivery route; overrides the "
+                                                                          "configuration.")
+    parser.add_argument('--headless', action='store_true', help="Switch off console output and log files.")
+    parser.add_argument('--trace', help="Record a binary trace of the run to this file, see replay.py.")
+    parser.add_argument('--metrics', help="Stream per-tick metrics as JSON lines to this file.")
+    parser.add_argument('--metrics-port', type=int, help="Serve live metrics in the Prometheus text format on this "
+                                                         "port, at /metrics.")
+    parser.add_argument('--metrics-host', default='127.0.0.1', help="Address the metrics endpoint listens on.")
+    parser.add_argument('--profile', action='store_true', help="Time the phases of every tick and report a breakdown.")
+    parser.add_argument('--profile-ticks', help="Also stream the per-tick phase times and counters to this file.")
+    parser.add_argument('--memory', help="Sample memory use and object counts, and stream them to this file.")
+    parser.add_argument('--memory-interval', type=int, default=100, help="Ticks between memory samples.")
+    parser.add_argument('--keyframe-interval', type=int, default=1000, help="Ticks between trace keyframes.")
+    parser.add_argument('--archive', help="Move delivered items and bundles out of the live state into an archive in "
+                                          "this directory.")
+    parser.add_argument('--archive-batch', type=int, default=1024, help="Archived rows written to disk at once.")
+    parser.add_argument('--checkpoint-dir', help="Save checkpoints of the full state into this directory.")
+    parser.add_argument('--checkpoint-interval', type=int, default=1000, help="Ticks between checkpoints.")
+    parser.add_argument('--resume', help="Resume from a checkpoint, or from the latest one in a checkpoint directory.")
     args = parser.parse_args()
+    if args.config_file is None and args.resume is None:
+        parser.error("a configuration file is required unless resuming from a checkpoint")
 
     main(args)
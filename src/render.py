@@ -0,0 +1,27 @@
+import argparse
+import os
+
+from src.simulation.rendering import render_frames, encode_video
+
+
+def main(args):
+    frames = render_frames(args.trace_file, args.frames, args.start, args.end, args.step, args.workers)
+    print(f"Rendered {frames} frames into {args.frames}")
+    if args.video:
+        encode_video(args.frames, args.video, args.fps)
+        print(f"Encoded {args.video}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Render a recorded simulation into frames and a video.")
+    parser.add_argument('trace_file', help="Path to the trace recorded with main.py --trace.")
+    parser.add_argument('--frames', default='frames', help="Directory to write the PNG frames into.")
+    parser.add_argument('--video', help="Encode the frames into this video file with ffmpeg, e.g. run.mp4.")
+    parser.add_argument('--start', type=int, default=0, help="First tick to render.")
+    parser.add_argument('--end', type=int, help="Tick to stop rendering before, the end of the trace by default.")
+    parser.add_argument('--step', type=int, default=1, help="Render every n-th tick.")
+    parser.add_argument('--fps', type=float, default=20, help="Frame rate of the video.")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Worker processes rendering frames.")
+    args = parser.parse_args()
+
+    main(args)
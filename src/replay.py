@@ -0,0 +1,33 @@
+import argparse
+
+from src.main import analyze_results
+from src.simulation.environments.top_congestion_environment import TopCongestionEnvironment
+from src.simulation.trace import TraceReader
+from src.utils import events
+
+
+def replay(trace_file: str, tick: int) -> TopCongestionEnvironment:
+    """Rebuild the environment at the start of the given tick from a recorded trace"""
+    state = TraceReader(trace_file).state_at(tick)
+    environment = TopCongestionEnvironment(state.grid)
+    environment.tick = state.tick
+    environment.items_added = state.items_added
+    return environment
+
+
+def main(args):
+    events.headless()
+    environment = replay(args.trace_file, args.tick)
+    print(f"State at tick {environment.tick}")
+    for agent in environment.state.agents:
+        print(f"Agent {agent.id} at position {agent.position}")
+    analyze_results(environment)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rebuild the state of a recorded simulation at a given tick.")
+    parser.add_argument('trace_file', help="Path to the trace recorded with main.py --trace.")
+    parser.add_argument('--tick', type=int, required=True, help="Tick to rebuild the state at.")
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,182 @@
+"""Seeded generator of synthetic scenarios, written as configuration files that `setup_simulation` reads.
+
+A scenario is built from its parameters and a seed alone, so the same command always gives the same layout. Obstacles
+follow one of the LAYOUTS; afterwards every free cell outside the largest connected area is blocked as well, and
+stations and agents are only placed inside that area, so that every station can be reached from every agent.
+
+    python -m src.scenarios --width 1000 --height 1000 --agents 2000 --layout racks --seed 7 --output large.json \
+        --obstacle-map large.npy
+"""
+
+import argparse
+import json
+import os
+from collections import deque
+
+import numpy as np
+
+from src.simulation.maps import encode_rle, layer_from_positions, save_obstacle_map
+
+LAYOUTS = ('racks', 'aisles', 'random')
+PLACEMENTS = ('edges', 'clustered', 'random')
+CROSS_AISLE_INTERVAL = 10  # Rows between the cross aisles cutting through racks and aisles
+
+
+def _racks(width: int, height: int, density: float, rng: np.random.Generator) -> np.ndarray:
+    """Blocks of racks two cells deep, with an aisle between every two blocks and cross aisles every few rows"""
+    blocked = np.zeros((width, height), dtype=bool)
+    period = max(3, round(2 / density)) if density > 0 else width
+    for x in range(1, width - 2, period):
+        blocked[x:x + 2, 1:height - 1] = True
+    blocked[:, ::CROSS_AISLE_INTERVAL] = False
+    blocked[:, -2:] = False
+    return blocked
+
+
+def _aisles(width: int, height: int, density: float, rng: np.random.Generator) -> np.ndarray:
+    """Single shelves, with the spacing of the aisles between them set by the density"""
+    blocked = np.zeros((width, height), dtype=bool)
+    period = max(2, round(1 / density)) if density > 0 else width
+    blocked[1:width - 1:period, 1:height - 1] = True
+    blocked[:, ::CROSS_AISLE_INTERVAL] = False
+    blocked[:, -2:] = False
+    return blocked
+
+
+def _random(width: int, height: int, density: float, rng: np.random.Generator) -> np.ndarray:
+    return rng.random((width, height)) < density
+
+
+def largest_open_area(blocked: np.ndarray) -> np.ndarray:
+    """Mask of the largest 4-connected area of free cells"""
+    width, height = blocked.shape
+    free = ~blocked.ravel()
+    labels = np.full(free.shape, -1, dtype=np.int64)
+    best_label, best_size = -1, 0
+    for start in np.flatnonzero(free):
+        if labels[start] >= 0:
+            continue
+        labels[start] = start
+        size = 1
+        queue = deque([start])
+        while queue:
+            cell = queue.popleft()
+            x, y = divmod(cell, height)
+            for neighbour, inside in ((cell - height, x > 0), (cell + height, x < width - 1),
+                                      (cell - 1, y > 0), (cell + 1, y < height - 1)):
+                if inside and free[neighbour] and labels[neighbour] < 0:
+                    labels[neighbour] = start
+                    size += 1
+                    queue.append(neighbour)
+        if size > best_size:
+            best_label, best_size = start, size
+    return (labels == best_label).reshape(blocked.shape)
+
+
+def _place_at_edge(cells: np.ndarray, count: int, top: bool) -> np.ndarray:
+    """`count` cells spread along the top (or bottom) edge of the open area"""
+    rows = cells[:, 1] if top else -cells[:, 1]
+    order = np.lexsort((cells[:, 0], rows))
+    for row_count in range(1, len(cells) + 1):
+        # Take as few rows from the edge as needed to have enough cells, then spread the stations over them by x
+        candidates = order[np.isin(rows[order], np.unique(rows)[:row_count])]
+        if len(candidates) >= count:
+            candidates = candidates[np.argsort(cells[candidates, 0], kind='stable')]
+            return candidates[np.linspace(0, len(candidates) - 1, count).round().astype(int)]
+    raise ValueError(f"Not enough open cells for {count} stations")
+
+
+def _place_clustered(cells: np.ndarray, count: int, rng: np.random.Generator) -> np.ndarray:
+    """The `count` cells nearest to a random centre"""
+    centre = cells[rng.integers(len(cells))]
+    distances = np.abs(cells - centre).sum(axis=1)
+    return np.argsort(distances, kind='stable')[:count]
+
+
+def generate_scenario(width: int, height: int, seed: int = 0, layout: str = 'racks', obstacle_density: float = 0.2,
+                      pickup_stations: int = 3, delivery_stations: int = 5, placement: str = 'edges', agents: int = 3,
+                      capacity: int = 3, arrival_interval: int = 1, arrival_batch: int = 3,
+                      max_items: int = 150) -> dict:
+    """A scenario configuration, as read by `setup_simulation`"""
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout {layout}, expected one of {', '.join(LAYOUTS)}")
+    if placement not in PLACEMENTS:
+        raise ValueError(f"Unknown placement {placement}, expected one of {', '.join(PLACEMENTS)}")
+    rng = np.random.default_rng(seed)
+
+    blocked = {'racks': _racks, 'aisles': _aisles, 'random': _random}[layout](width, height, obstacle_density, rng)
+    open_area = largest_open_area(blocked)
+    cells = np.argwhere(open_area)
+    if len(cells) < pickup_stations + delivery_stations + agents:
+        raise ValueError(f"The largest open area has {len(cells)} cells, too few for {pickup_stations} + "
+                         f"{delivery_stations} stations and {agents} agents; lower the obstacle density")
+
+    if placement == 'edges':
+        pickup_indices = _place_at_edge(cells, pickup_stations, top=True)
+        delivery_indices = _place_at_edge(cells, delivery_stations, top=False)
+    elif placement == 'clustered':
+        pickup_indices = _place_clustered(cells, pickup_stations, rng)
+        delivery_indices = _place_clustered(cells, delivery_stations, rng)
+    else:
+        pickup_indices, delivery_indices = np.split(
+            rng.choice(len(cells), pickup_stations + delivery_stations, replace=False), [pickup_stations])
+
+    # Agents start on distinct cells away from the stations; a delivery station may share a cell with a pickup one
+    taken = np.zeros(len(cells), dtype=bool)
+    taken[pickup_indices] = True
+    taken[delivery_indices] = True
+    free_indices = np.flatnonzero(~taken)
+    if len(free_indices) < agents:
+        raise ValueError(f"Not enough open cells left for {agents} agents")
+    agent_indices = rng.choice(free_indices, agents, replace=False)
+
+    return {
+        'grid_size': [width, height],
+        # Pockets cut off from the open area are blocked too, so that no agent or station can end up in them
+        'obstacles': np.argwhere(~open_area).tolist(),
+        'pickup_stations': cells[pickup_indices].tolist(),
+        'delivery_stations': cells[delivery_indices].tolist(),
+        'agents': cells[agent_indices].tolist(),
+        'agent_capacity': capacity,
+        'arrivals': {'interval': arrival_interval, 'batch': arrival_batch, 'max_items': max_items},
+        'generator': {'seed': seed, 'layout': layout, 'obstacle_density': obstacle_density, 'placement': placement},
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic scenario configuration.")
+    parser.add_argument('--width', type=int, default=50, help="Width of the grid.")
+    parser.add_argument('--height', type=int, default=50, help="Height of the grid.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the generator; equal seeds give equal scenarios.")
+    parser.add_argument('--layout', choices=LAYOUTS, default='racks', help="Shape of the obstacles.")
+    parser.add_argument('--obstacle-density', type=float, default=0.2, help="Share of the cells to block, about.")
+    parser.add_argument('--pickup-stations', type=int, default=3, help="Number of pickup stations.")
+    parser.add_argument('--delivery-stations', type=int, default=5, help="Number of delivery stations.")
+    parser.add_argument('--placement', choices=PLACEMENTS, default='edges',
+                        help="Pickup stations along the top and delivery stations along the bottom (edges), each "
+                             "kind around a random spot (clustered), or anywhere (random).")
+    parser.add_argument('--agents', type=int, default=3, help="Number of agents.")
+    parser.add_argument('--capacity', type=int, default=3, help="Items an agent can carry at once.")
+    parser.add_argument('--arrival-interval', type=int, default=1, help="Ticks between two arrivals of items.")
+    parser.add_argument('--arrival-batch', type=int, default=3, help="Items arriving at once.")
+    parser.add_argument('--max-items', type=int, default=150, help="Items arriving over the whole run.")
+    parser.add_argument('--output', required=True, help="Configuration file to write.")
+    parser.add_argument('--obstacle-map',
+                        help="Write the obstacles into this .npy or .pbm file, referenced by the configuration, "
+                             "instead of listing them.")
+    parser.add_argument('--rle', action='store_true',
+                        help="Run-length encode the obstacles in the configuration instead of listing them.")
+    args = parser.parse_args()
+
+    scenario = generate_scenario(args.width, args.height, args.seed, args.layout, args.obstacle_density,
+                                 args.pickup_stations, args.delivery_stations, args.placement, args.agents,
+                                 args.capacity, args.arrival_interval, args.arrival_batch, args.max_items)
+    if args.obstacle_map or args.rle:
+        layer = layer_from_positions(scenario.pop('obstacles'), (args.width, args.height))
+        if args.obstacle_map:
+            save_obstacle_map(layer, args.obstacle_map)
+            scenario['obstacle_map'] = os.path.relpath(args.obstacle_map, os.path.dirname(os.path.abspath(args.output)))
+        else:
+            scenario['obstacle_map'] = {'rle': encode_rle(layer)}
+    with open(args.output, 'w') as file:
+        json.dump(scenario, file)
@@ -0,0 +1,148 @@
+"""Append-only archive of delivered work.
+
+Delivered items stay in `agent.items` and winning bids in `agent.winner_bids` for the rest of a run, so the live state
+and the scans over it grow with the run length. An Archive set as an Environment's `archive` moves them out after every
+tick: each fully delivered bundle leaves `winner_bids` together with its items, and delivered items outside any bundle
+leave `agent.items`. Per agent counters of what was archived stay in memory, and the rows themselves go to disk.
+
+An archive is a directory with one raw little-endian file per column of its `items` and `bundles` tables, appended to
+in batches of `batch_size` rows. Rows are only written outside snapshots, so rollouts never leave anything on disk.
+Checkpoints store how many rows were written, and reopening an archive at those counts cuts off what came after."""
+
+import os
+
+import numpy as np
+
+from src.simulation.base import snapshots
+from src.simulation.base.grid import Grid
+from src.simulation.base.item import ItemStatus
+
+TABLES = {
+    'items': {'id': np.dtype('V16'), 'agent': np.dtype('<i4'), 'bundle': np.dtype('<i8'),
+              'source': np.dtype('<i4'), 'destination': np.dtype('<i4'), 'created_tick': np.dtype('<i8'),
+              'pickup_tick': np.dtype('<i8'), 'delivered_tick': np.dtype('<i8'), 'priority': np.dtype('<i4')},
+    'bundles': {'agent': np.dtype('<i4'), 'costs': np.dtype('<i8'), 'size': np.dtype('<i4'),
+                'completed_tick': np.dtype('<i8')},
+}
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def _column_path(path: str, table: str, column: str) -> str:
+    return os.path.join(path, f"{table}.{column}")
+
+
+def _delivered(item) -> bool:
+    return item.status == ItemStatus.DELIVERED
+
+
+class Archive:
+    """Archives the delivered work of a run into the directory `path`. `rows` are the rows of each table already on
+    disk, which a new archive starts without"""
+
+    def __init__(self, path: str, batch_size: int = 1024, rows: dict[str, int] = None,
+                 items_delivered: list[int] = None, bundles_delivered: list[int] = None,
+                 delivery_ticks: list[int] = None):
+        self.path = os.path.abspath(path)
+        self.batch_size = batch_size
+        self.rows = {table: 0 for table in TABLES} if rows is None else dict(rows)
+        # Counters per agent, by index into the agents of the grid
+        self.items_delivered = list(items_delivered or [])
+        self.bundles_delivered = list(bundles_delivered or [])
+        self.delivery_ticks = list(delivery_ticks or [])  # Sum of the ticks from creation to delivery
+        # Rows not written yet, kept in lists so that snapshots roll them back
+        self._items = []
+        self._bundles = []
+
+        os.makedirs(self.path, exist_ok=True)
+        for table, columns in TABLES.items():
+            for column, dtype in columns.items():
+                column_path = _column_path(self.path, table, column)
+                size = self.rows[table] * dtype.itemsize
+                if os.path.exists(column_path) and os.path.getsize(column_path) < size:
+                    raise ArchiveError(f"{column_path} holds fewer than the {self.rows[table]} rows expected")
+                with open(column_path, 'ab') as file:
+                    file.truncate(size)
+
+    @property
+    def pending(self) -> int:
+        return len(self._items) + len(self._bundles)
+
+    def collect(self, state: Grid) -> int:
+        """Move the delivered work of every agent out of the live state and return how many items were archived"""
+        archived = 0
+        stations = None
+        for index, agent in enumerate(state.agents):
+            if not any(_delivered(item) for item in agent.items):
+                continue
+            if stations is None:
+                stations = {id(station): station_index for stations_of_kind in
+                            (state.pickup_stations, state.delivery_stations)
+                            for station_index, station in enumerate(stations_of_kind)}
+            snapshots.touch(self)
+            snapshots.touch(agent)
+            for counter in (self.items_delivered, self.bundles_delivered, self.delivery_ticks):
+                counter.extend([0] * (index + 1 - len(counter)))
+
+            completed = [bid for bid in agent.winner_bids if all(_delivered(item) for item in bid['ordered_bundle'])]
+            done = {id(bid) for bid in completed}
+            bundles = {}
+            for bid in completed:
+                bundle = self.rows['bundles'] + len(self._bundles)
+                self._bundles.append((index, bid['costs'], len(bid['ordered_bundle']),
+                                      max(item.delivered_tick for item in bid['ordered_bundle'])))
+                self.bundles_delivered[index] += 1
+                bundles.update((id(item), bundle) for item in bid['ordered_bundle'])
+            open_items = {id(item) for bid in agent.winner_bids if id(bid) not in done
+                          for item in bid['ordered_bundle']}
+
+            # Delivered items of bundles still under way wait for the rest of their bundle
+            leaving = [item for item in agent.items if _delivered(item) and id(item) not in open_items]
+            for item in leaving:
+                self._items.append((item.id.bytes, index, bundles.get(id(item), -1),
+                                    stations.get(id(item.source), -1), stations.get(id(item.destination), -1),
+                                    item.created_tick, -1 if item.pickup_tick is None else item.pickup_tick,
+                                    item.delivered_tick, item.priority))
+                self.items_delivered[index] += 1
+                self.delivery_ticks[index] += item.delivered_tick - item.created_tick
+            left = {id(item) for item in leaving}
+            agent.items[:] = [item for item in agent.items if id(item) not in left]
+            agent.winner_bids[:] = [bid for bid in agent.winner_bids if id(bid) not in done]
+            archived += len(leaving)
+
+        if self.pending >= self.batch_size and not snapshots.journaling():
+            self.flush()
+        return archived
+
+    def flush(self) -> None:
+        """Append the pending rows to the column files"""
+        for table, pending in (('items', self._items), ('bundles', self._bundles)):
+            if not pending:
+                continue
+            records = np.array(pending, dtype=list(TABLES[table].items()))
+            for column in TABLES[table]:
+                with open(_column_path(self.path, table, column), 'ab') as file:
+                    file.write(np.ascontiguousarray(records[column]).tobytes())
+            self.rows[table] += len(pending)
+            pending.clear()
+
+    def config(self) -> dict:
+        """The arguments that reopen the archive where it is now, after writing what is pending"""
+        if self.pending and snapshots.journaling():
+            raise ArchiveError("The archive cannot be saved while an open snapshot holds unwritten rows")
+        self.flush()
+        return {'path': self.path, 'batch_size': self.batch_size, 'rows': dict(self.rows),
+                'items_delivered': list(self.items_delivered), 'bundles_delivered': list(self.bundles_delivered),
+                'delivery_ticks': list(self.delivery_ticks)}
+
+    def close(self) -> None:
+        self.flush()
+
+
+def read_archive(path: str) -> dict[str, dict[str, np.ndarray]]:
+    """The columns of both tables of the archive in `path`"""
+    return {table: {column: np.fromfile(_column_path(path, table, column), dtype=dtype)
+                    for column, dtype in columns.items()}
+            for table, columns in TABLES.items()}
@@ -0,0 +1,288 @@
+"""Pluggable sources of item arrivals.
+
+By default an Environment generates `arrival_batch` items every `arrival_interval` ticks at a random pair of stations.
+An ArrivalSource set as its `arrival_source` replaces that: the environment asks it for the tick of the next arrival
+(event driven runs skip ahead up to it) and takes the arrivals of every tick from it, each an Arrival of `count` items
+from the pickup station at index `source` to the delivery station at index `destination`.
+
+Built in are PoissonArrivals and BurstyArrivals, which draw from the `random` module like the rest of the simulation,
+and TraceArrivals, which replays recorded orders from a CSV file (`tick,source,destination[,count]` rows) or a binary
+file of fixed size records. Traces are read lazily from where the last tick ended, so streams of millions of orders are never
+held in memory. Sources keep their progress in plain attributes, which snapshots roll back and `config()` saves for
+checkpoints, and are built from the `arrivals` entry of a configuration by `arrival_source`."""
+
+import csv
+import math
+import os
+import random
+from abc import ABC, abstractmethod
+from typing import Iterable, NamedTuple
+
+import numpy as np
+
+from src.simulation.base import snapshots
+
+BINARY_MAGIC = b'ARRV'
+BINARY_VERSION = 1
+# A header of the magic and the version, then one record per order, sorted by tick
+BINARY_HEADER = np.dtype([('magic', 'S4'), ('version', '<u4')])
+BINARY_RECORD = np.dtype([('tick', '<i8'), ('source', '<i4'), ('destination', '<i4'), ('count', '<i4')])
+BINARY_EXTENSIONS = ('.bin', '.arrivals')
+
+
+class ArrivalError(Exception):
+    pass
+
+
+class Arrival(NamedTuple):
+    tick: int
+    source: int  # Index of the pickup station
+    destination: int  # Index of the delivery station
+    count: int = 1
+
+
+class ArrivalSource(ABC):
+    @abstractmethod
+    def next_tick(self, tick: int) -> int | None:
+        """The first tick from `tick` on at which items arrive, None once no more will"""
+        pass
+
+    @abstractmethod
+    def take(self, tick: int, pickup_stations: int, delivery_stations: int) -> list[Arrival]:
+        """Remove and return the arrivals of `tick`, given the number of stations of each kind"""
+        pass
+
+    @abstractmethod
+    def config(self) -> dict:
+        """The `arrivals` configuration entry that rebuilds the source where it is now"""
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class _RandomArrivals(ArrivalSource):
+    """Arrivals of single items at random times, between uniformly chosen stations, until `max_items` arrived.
+    `next_time` is the continuous time of the next arrival, which arrives at the tick it falls into"""
+
+    def __init__(self, max_items: int = None, next_time: float = None, produced: int = 0, start: float = 0):
+        self.max_items = max_items
+        self.produced = produced
+        self.next_time = next_time if next_time is not None else self._after(start)
+
+    @abstractmethod
+    def _after(self, time: float) -> float:
+        """The time of the first arrival after `time`"""
+        pass
+
+    def next_tick(self, tick: int) -> int | None:
+        if self.max_items is not None and self.produced >= self.max_items or math.isinf(self.next_time):
+            return None
+        return max(tick, math.floor(self.next_time))
+
+    def take(self, tick: int, pickup_stations: int, delivery_stations: int) -> list[Arrival]:
+        if self.next_tick(tick) != tick:
+            return []
+        snapshots.touch(self)
+        arrivals = []
+        while self.next_time < tick + 1 and (self.max_items is None or self.produced < self.max_items):
+            arrivals.append(Arrival(tick, random.randrange(pickup_stations), random.randrange(delivery_stations)))
+            self.produced += 1
+            self.next_time = self._after(max(self.next_time, tick))
+        return arrivals
+
+
+class PoissonArrivals(_RandomArrivals):
+    """Items arrive one by one at `rate` items per tick on average, with exponentially distributed gaps"""
+
+    def __init__(self, rate: float, **kwargs):
+        if rate <= 0:
+            raise ArrivalError(f"The arrival rate has to be positive, not {rate}")
+        self.rate = rate
+        super().__init__(**kwargs)
+
+    def _after(self, time: float) -> float:
+        return time + random.expovariate(self.rate)
+
+    def config(self) -> dict:
+        return {'type': 'poisson', 'rate': self.rate, 'max_items': self.max_items, 'next_time': self.next_time,
+                'produced': self.produced}
+
+
+class BurstyArrivals(_RandomArrivals):
+    """A Poisson process switching between a calm and a burst rate (a two state Markov modulated Poisson process).
+    Calm and burst phases last `calm_ticks` and `burst_ticks` on average, exponentially distributed"""
+
+    def __init__(self, calm_rate: float, burst_rate: float, calm_ticks: float, burst_ticks: float,
+                 in_burst: bool = False, phase_end: float = None, **kwargs):
+        if min(calm_rate, burst_rate) < 0 or max(calm_rate, burst_rate) <= 0 or min(calm_ticks, burst_ticks) <= 0:
+            raise ArrivalError("Bursty arrivals need non-negative rates, one of them positive, and positive phase "
+                               "lengths")
+        self.calm_rate = calm_rate
+        self.burst_rate = burst_rate
+        self.calm_ticks = calm_ticks
+        self.burst_ticks = burst_ticks
+        self.in_burst = in_burst
+        self.phase_end = phase_end if phase_end is not None else random.expovariate(1 / calm_ticks)
+        super().__init__(**kwargs)
+
+    def _after(self, time: float) -> float:
+        while True:
+            rate = self.burst_rate if self.in_burst else self.calm_rate
+            arrival = time + random.expovariate(rate) if rate > 0 else math.inf
+            if arrival < self.phase_end:
+                return arrival
+            time = self.phase_end
+            self.in_burst = not self.in_burst
+            self.phase_end = time + random.expovariate(1 / (self.burst_ticks if self.in_burst else self.calm_ticks))
+
+    def config(self) -> dict:
+        return {'type': 'bursty', 'calm_rate': self.calm_rate, 'burst_rate': self.burst_rate,
+                'calm_ticks': self.calm_ticks, 'burst_ticks': self.burst_ticks, 'max_items': self.max_items,
+                'in_burst': self.in_burst, 'phase_end': self.phase_end, 'next_time': self.next_time,
+                'produced': self.produced}
+
+
+class _CsvReader:
+    """Reads the orders of a CSV file one by one from a byte offset, skipping a header and blank lines"""
+
+    def __init__(self, path: str):
+        self.file = open(path, 'rb')
+
+    def read(self, offset: int) -> tuple[Arrival | None, int]:
+        """The order starting at `offset` and the offset after it, None at the end of the file"""
+        self.file.seek(offset)
+        while True:
+            line = self.file.readline()
+            if not line:
+                return None, offset
+            offset += len(line)
+            row = line.split(b',')
+            if not row[0].strip().lstrip(b'-').isdigit():
+                continue  # Blank line or header
+            return Arrival(*(int(value) for value in row[:4])), offset
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class _BinaryReader:
+    """Reads the records of a binary trace, memory-mapped, by index"""
+
+    def __init__(self, path: str):
+        header = np.fromfile(path, BINARY_HEADER, 1)
+        if len(header) == 0 or header['magic'][0] != BINARY_MAGIC:
+            raise ArrivalError(f"{path} is not a binary arrival trace")
+        if header['version'][0] != BINARY_VERSION:
+            raise ArrivalError(f"Arrival trace version {header['version'][0]} is not supported")
+        size = os.path.getsize(path) - BINARY_HEADER.itemsize
+        self.records = np.memmap(path, BINARY_RECORD, 'r', BINARY_HEADER.itemsize, (size // BINARY_RECORD.itemsize,)) \
+            if size >= BINARY_RECORD.itemsize else np.zeros(0, BINARY_RECORD)
+
+    def read(self, offset: int) -> tuple[Arrival | None, int]:
+        if offset >= len(self.records):
+            return None, offset
+        tick, source, destination, count = self.records[offset].tolist()
+        return Arrival(tick, source, destination, count), offset + 1
+
+    def close(self) -> None:
+        self.records = None
+
+
+def _is_binary(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in BINARY_EXTENSIONS
+
+
+class TraceArrivals(ArrivalSource):
+    """Replays the orders of a trace file, sorted by tick. `offset` is where the next unread order starts: a byte
+    offset into CSV files, a record index into binary ones. Only the next order is held in memory"""
+
+    def __init__(self, path: str, offset: int = 0):
+        self.path = os.path.abspath(path)
+        self._reader = _BinaryReader(self.path) if _is_binary(self.path) else _CsvReader(self.path)
+        self.offset = offset
+        self._peeked = None  # (offset, order read from it, offset after it)
+
+    def _peek(self) -> Arrival | None:
+        # Snapshots can roll the offset back, so what was read ahead is only valid for the offset it was read at
+        if self._peeked is None or self._peeked[0] != self.offset:
+            arrival, end = self._reader.read(self.offset)
+            self._peeked = (self.offset, arrival, end)
+        return self._peeked[1]
+
+    def next_tick(self, tick: int) -> int | None:
+        arrival = self._peek()
+        return None if arrival is None else max(tick, arrival.tick)
+
+    def take(self, tick: int, pickup_stations: int, delivery_stations: int) -> list[Arrival]:
+        arrivals = []
+        arrival = self._peek()
+        while arrival is not None and arrival.tick <= tick:
+            if not (0 <= arrival.source < pickup_stations and 0 <= arrival.destination < delivery_stations):
+                raise ArrivalError(f"Order {arrival} of {self.path} refers to a station that does not exist")
+            # Orders of ticks already passed, e.g. before the run started or out of order, arrive now
+            arrivals.append(arrival._replace(tick=tick))
+            snapshots.touch(self)
+            self.offset = self._peeked[2]
+            arrival = self._peek()
+        return arrivals
+
+    def config(self) -> dict:
+        return {'type': 'trace', 'path': self.path, 'offset': self.offset}
+
+    def close(self) -> None:
+        self._reader.close()
+
+
+def read_arrivals(path: str) -> Iterable[Arrival]:
+    """Stream every order of a trace file"""
+    reader = _BinaryReader(path) if _is_binary(path) else _CsvReader(path)
+    offset = 0
+    try:
+        while True:
+            arrival, offset = reader.read(offset)
+            if arrival is None:
+                return
+            yield arrival
+    finally:
+        reader.close()
+
+
+def write_arrivals(path: str, arrivals: Iterable[Arrival], chunk_size: int = 1 << 16) -> int:
+    """Write orders, sorted by tick, as CSV or, for .bin and .arrivals files, as binary records. Returns how many"""
+    written = 0
+    if not _is_binary(path):
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(Arrival._fields)
+            for arrival in arrivals:
+                writer.writerow(arrival)
+                written += 1
+        return written
+
+    with open(path, 'wb') as file:
+        file.write(np.array([(BINARY_MAGIC, BINARY_VERSION)], BINARY_HEADER).tobytes())
+        chunk = []
+        for arrival in arrivals:
+            chunk.append(tuple(arrival))
+            if len(chunk) == chunk_size:
+                file.write(np.array(chunk, BINARY_RECORD).tobytes())
+                written += len(chunk)
+                chunk = []
+        if chunk:
+            file.write(np.array(chunk, BINARY_RECORD).tobytes())
+            written += len(chunk)
+    return written
+
+
+SOURCES = {'poisson': PoissonArrivals, 'bursty': BurstyArrivals, 'trace': TraceArrivals}
+
+
+def arrival_source(config: dict) -> ArrivalSource | None:
+    """The source an `arrivals` configuration entry describes, None for the built-in interval arrivals"""
+    kind = config.get('type', 'interval')
+    if kind == 'interval':
+        return None
+    if kind not in SOURCES:
+        raise ArrivalError(f"Unknown arrival type {kind}, expected interval or one of {', '.join(SOURCES)}")
+    return SOURCES[kind](**{key: value for key, value in config.items() if key != 'type'})
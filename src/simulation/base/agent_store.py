@@ -0,0 +1,90 @@
+"""Struct-of-arrays storage of agent positions.
+
+Once a Grid uses an AgentStore, the positions of all its agents live in one (agents, 2) array next to an occupancy layer
+counting the agents per cell, and Agent.position becomes a view into that array. The moves of a whole tick are then
+applied as a handful of array operations, instead of a board cell update per agent. Snapshots journal the cells the
+store writes, not its arrays."""
+
+import numpy as np
+
+from src.simulation.base import snapshots
+
+
+class AgentStore:
+    # Rows past the number of agents are spare capacity, so that adding agents one by one stays linear
+    cell_journaled = ('_positions', '_list_positions', 'occupancy')
+
+    def __init__(self, dimensions: tuple[int, int], capacity: int = 16):
+        self.size = 0
+        self._positions = np.zeros((capacity, 2), dtype=np.int64)
+        # Agents keep the container type of their position (a list once moved, whatever they were placed with before),
+        # since code comparing positions against stations depends on it
+        self._list_positions = np.zeros(capacity, dtype=bool)
+        self.occupancy = np.zeros(dimensions, dtype=np.int32)
+
+    @property
+    def positions(self) -> np.ndarray:
+        return self._positions[:self.size]
+
+    @property
+    def list_positions(self) -> np.ndarray:
+        return self._list_positions[:self.size]
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _reserve(self, size: int) -> None:
+        if size > len(self._positions):
+            capacity = max(size, 2 * len(self._positions))
+            positions = np.zeros((capacity, 2), dtype=np.int64)
+            positions[:self.size] = self.positions
+            list_positions = np.zeros(capacity, dtype=bool)
+            list_positions[:self.size] = self.list_positions
+            # New arrays, the journaled attributes bring the old ones back
+            self._positions, self._list_positions = positions, list_positions
+
+    def add(self, position) -> int:
+        """Add an agent at the given position and return its index"""
+        return self.add_all([position])[0]
+
+    def add_all(self, positions: list) -> range:
+        """Add agents at the given positions at once and return their indices"""
+        snapshots.touch(self)
+        start = self.size
+        self._reserve(start + len(positions))
+        if positions:
+            self._positions[start:start + len(positions)] = [list(position) for position in positions]
+            self._list_positions[start:start + len(positions)] = [isinstance(position, list) for position in positions]
+            new = self._positions[start:start + len(positions)]
+            snapshots.touch_cells(self.occupancy, (new[:, 0], new[:, 1]))
+            np.add.at(self.occupancy, (new[:, 0], new[:, 1]), 1)
+        self.size = start + len(positions)
+        return range(start, self.size)
+
+    def position_of(self, index: int):
+        position = self._positions[index].tolist()
+        return position if self._list_positions[index] else tuple(position)
+
+    def set_position(self, index: int, position) -> None:
+        x, y = self._positions[index]
+        cells = ([x, position[0]], [y, position[1]])
+        snapshots.touch_cells(self.occupancy, cells)
+        snapshots.touch_cells(self._positions, index)
+        snapshots.touch_cells(self._list_positions, index)
+        self.occupancy[x, y] -= 1
+        self.occupancy[position[0], position[1]] += 1
+        self._positions[index] = position
+        self._list_positions[index] = isinstance(position, list)
+
+    def move(self, indices: np.ndarray, directions: np.ndarray) -> None:
+        """Move the agents at `indices` by the (dx, dy) rows of `directions`, each agent at most once"""
+        old = self._positions[indices]
+        new = old + directions
+        snapshots.touch_cells(self.occupancy, (np.concatenate([old[:, 0], new[:, 0]]),
+                                               np.concatenate([old[:, 1], new[:, 1]])))
+        snapshots.touch_cells(self._positions, indices)
+        snapshots.touch_cells(self._list_positions, indices)
+        np.subtract.at(self.occupancy, (old[:, 0], old[:, 1]), 1)
+        np.add.at(self.occupancy, (new[:, 0], new[:, 1]), 1)
+        self._positions[indices] = new
+        self._list_positions[indices] = True
@@ -1,18 +1,36 @@
 from abc import ABC, abstractmethod
+from src.simulation.base import snapshots
 from src.simulation.base.grid import Grid
 from src.simulation.base.intentions import Intention
-from src.simulation.environments.broker import Broker
-from src.utils import logging_utils
+from src.simulation.environments.broker import Broker, auction_pending
+from src.simulation.pathfinding import tsp_path
+from src.utils import events, logging_utils, profiling
 from src.simulation.base.item import Item, ItemStatus
+from src.simulation.environments.common import AGENT_MOVED
 import random
 
-# setup logger
-logger = logging_utils.setup_logger('EnvironmentLogger', 'environment.log')
+# declare the logger, which is set up with its first record
+logging_utils.declare_logger('EnvironmentLogger', 'environment.log')
+
+SEPARATOR = '-------------------------------------------------------------------------------------------'
+
+ITEMS_GENERATING = events.EventType('items_generating', 'EnvironmentLogger',
+                                    "Generating items for pickup station {pickup_station_id} and delivery station "
+                                    "{delivery_station_id}")
+ITEMS_GENERATED = events.EventType('items_generated', 'EnvironmentLogger',
+                                   "{count} items added to pickup station {pickup_station_id}")
+ILLEGAL_INTENTION = events.EventType('illegal_intention', 'EnvironmentLogger', "Illegal intention detected: {error}",
+                                     level=events.ERROR, console=False)
+TICK_STARTED = events.EventType('tick_started', 'EnvironmentLogger',
+                                SEPARATOR + "\nSimulation step started at tick {tick}", log=False)
+TICK_COMPLETED = events.EventType('tick_completed', 'EnvironmentLogger', "Simulation step completed at tick {tick}")
+TICKS_SKIPPED = events.EventType('ticks_skipped', 'EnvironmentLogger',
+                                 "Skipped ahead from tick {from_tick} to tick {to_tick}")
 
 
 def generate_items(pickup_station, delivery_station, created_tick, max_items):
-    logger.info(f"Generating items for pickup station {pickup_station.id} and delivery station {delivery_station.id}")
-    print(f"Generating items for pickup station {pickup_station.id} and delivery station {delivery_station.id}")
+    events.emit(ITEMS_GENERATING, pickup_station_id=pickup_station.id, delivery_station_id=delivery_station.id)
+    snapshots.touch(pickup_station)
     for _ in range(max_items):
         item = Item(
             status=ItemStatus.AWAITING_PICKUP,
@@ -21,16 +39,24 @@ def generate_items(pickup_station, delivery_station, created_tick, max_items):
             destination=delivery_station
         )
         pickup_station.items.append(item)
-    logger.info(f"{max_items} items added to pickup station {pickup_station.id}")
-    print(f"{max_items} items added to pickup station {pickup_station.id}")
+    events.emit(ITEMS_GENERATED, count=max_items, pickup_station_id=pickup_station.id)
+
+
+def _get_intentions(state: Grid, selfishness: bool, planner=None) -> list[Intention]:
+    """Ask every busy agent for its intention. A planner, e.g. a planning.PooledPlanner, computes the next steps of
+    the agents up front, all at once"""
+    agents = [agent for agent in state.agents if agent.is_assigned_item or agent.is_carrying_item]
+    next_nodes = planner.next_nodes(agents, selfishness) if planner is not None else {}
+    return [agent.make_intention(state, selfishness, next_nodes.get(agent.id)) for agent in agents]
 
 
-def _get_intentions(state: Grid, selfishness: bool) -> list[Intention]:
-    list_of_intentions = []
-    for agent in state.agents:
-        if agent.is_assigned_item or agent.is_carrying_item:
-            list_of_intentions.append(agent.make_intention(state, selfishness))
-    return list_of_intentions
+def _end_tick(tick: int, ticks: int = 1) -> None:
+    """Hand the figures of the tick that just ended to the active profiler. Those of rollouts on snapshots are dropped,
+    as their ticks are undone"""
+    if snapshots.journaling():
+        profiling.active.discard_tick()
+    else:
+        profiling.active.end_tick(tick, ticks)
 
 
 class Environment(ABC):
@@ -38,6 +64,18 @@ class Environment(ABC):
         self.state = state
         self.tick = 0
         self.items_added = 0
+        self.planner = None
+        # A sharding.RegionWorkers whose worker processes own the agents of their regions and enact their intentions
+        self.regions = None
+        # Every `arrival_interval` ticks, `arrival_batch` new items arrive at a random pickup station, until
+        # `max_items` have arrived
+        self.arrival_interval = 1
+        self.arrival_batch = 3
+        self.max_items = 150
+        # An arrivals.ArrivalSource replacing the arrivals above, e.g. a recorded stream of orders
+        self.arrival_source = None
+        # An archive.Archive that delivered items and bundles are moved into after every tick
+        self.archive = None
 
     @abstractmethod
     def _illegal_intentions(self, intentions: list[Intention], state: Grid) -> None:
@@ -57,36 +95,132 @@ class Environment(ABC):
         situation, the Environment will always prefer one of them and realise its wish."""
 
         broker = Broker(state)
-        broker.assign_items_to_agents()
+        with profiling.phase('assignment'):
+            broker.assign_items_to_agents()
+
+        if self.regions is not None:
+            # The regions enact the intentions of their agents themselves, here they are only merged into the state
+            with profiling.phase('regions'):
+                consistent_intentions = self.regions.step(state, tick, selfishness)
+        else:
+            consistent_intentions = self._consistent_intentions(state, selfishness)
+        with profiling.phase('enactment'):
+            state = self._enact_valid_intentions(consistent_intentions, state, tick)
 
-        new_intentions = _get_intentions(state, selfishness)
+        return state
+
+    def _consistent_intentions(self, state: Grid, selfishness: bool) -> list[Intention]:
+        """The intentions of the busy agents in the state, validated and without the ones that lost a conflict"""
+        with profiling.phase('intention_generation'):
+            new_intentions = _get_intentions(state, selfishness, self.planner)
+        profiling.count('intentions', len(new_intentions))
 
         try:
-            self._illegal_intentions(new_intentions, state)
+            with profiling.phase('validation'):
+                self._illegal_intentions(new_intentions, state)
         except Exception as e:
-            logger.error(f"Illegal intention detected: {e}")
+            events.emit(ILLEGAL_INTENTION, error=e)
             raise
 
-        inconsistent_intentions = self._contradicting_intentions(new_intentions, state)
-        consistent_intentions = [intention for intention in new_intentions if intention
-                                 not in inconsistent_intentions]
-        state = self._enact_valid_intentions(consistent_intentions, state, tick)
-
-        return state
-
-    def simulation_step(self, selfishness: bool) -> Grid:
-        print('-------------------------------------------------------------------------------------------')
-        print(f"Simulation step started at tick {self.tick}")
-
-        if self.items_added < 150 and self.tick != 0:
+        with profiling.phase('conflict_resolution'):
+            # Intentions hash by identity, so filtering against a set keeps this single pass linear
+            inconsistent_intentions = set(self._contradicting_intentions(new_intentions, state))
+            return [intention for intention in new_intentions if intention not in inconsistent_intentions]
+
+    def snapshot(self) -> snapshots.Snapshot:
+        """Open a copy-on-write snapshot of the current state. Restoring it rolls back everything that changed since,
+        which lets short what-if rollouts run from the current tick and then be discarded"""
+        return snapshots.Snapshot(self)
+
+    def rollout(self, ticks: int, selfishness: bool) -> snapshots.Snapshot:
+        """Step the simulation ahead inside a new snapshot. The caller inspects the resulting state and restores the
+        returned snapshot (or uses it as a context manager) to return to the current tick"""
+        snapshot = self.snapshot()
+        for _ in range(ticks):
+            self.simulation_step(selfishness)
+        return snapshot
+
+    def _next_arrival_tick(self) -> int | None:
+        """The first tick from the current one on at which new items arrive, None once no more will"""
+        if self.arrival_source is not None:
+            return self.arrival_source.next_tick(self.tick)
+        if self.items_added >= self.max_items:
+            return None
+        tick = max(self.tick, 1)
+        return -(-tick // self.arrival_interval) * self.arrival_interval
+
+    def _generate_arrivals(self) -> None:
+        if self.arrival_source is None:
             pickup_station = random.choice(self.state.pickup_stations)
             delivery_station = random.choice(self.state.delivery_stations)
-            generate_items(pickup_station, delivery_station, self.tick, 3)
-            self.items_added += 3
-        self.state = self._process_intentions(self.state, self.tick, selfishness)
-        logger.info(f"Simulation step completed at tick {self.tick}")
-        print(f"Simulation step completed at tick {self.tick}")
-        print('-------------------------------------------------------------------------------------------')
+            generate_items(pickup_station, delivery_station, self.tick, self.arrival_batch)
+            self.items_added += self.arrival_batch
+            return
+        for arrival in self.arrival_source.take(self.tick, len(self.state.pickup_stations),
+                                                len(self.state.delivery_stations)):
+            generate_items(self.state.pickup_stations[arrival.source],
+                           self.state.delivery_stations[arrival.destination], self.tick, arrival.count)
+            self.items_added += arrival.count
+
+    def skip_ahead(self, selfishness: bool, max_ticks: int) -> int:
+        """Jump over ticks in which nothing but walking happens and return how many were skipped, 0 when the current
+        tick has to be simulated step by step.
+
+        Ticks can be skipped while no items arrive, the broker has nothing to assign and no agent reaches its target
+        station, so no decision, pickup, delivery or conflict can occur. A* returns the remainder of its own path when
+        asked again from a node on it, so every busy agent walks along the path planned now and ends up where stepping
+        tick by tick would have taken it. Without busy agents the simulation is drained and skips up to `max_ticks`"""
+        with profiling.phase('skip'):
+            skipped = self._skip_ahead(selfishness, max_ticks)
+        if skipped and profiling.active is not None:
+            _end_tick(self.tick - 1, skipped)
+        return skipped
+
+    def _skip_ahead(self, selfishness: bool, max_ticks: int) -> int:
+        next_arrival = self._next_arrival_tick()
+        if next_arrival is not None:
+            max_ticks = min(max_ticks, next_arrival - self.tick)
+        if max_ticks <= 0 or auction_pending(self.state):
+            return 0
+
+        paths = []
+        for agent in self.state.agents:
+            if agent.is_assigned_item or agent.is_carrying_item:
+                target = agent.target_position(selfishness)
+                if target == agent.position:
+                    return 0
+                path = tsp_path(self.state, agent.position, target)
+                max_ticks = min(max_ticks, len(path) - 1)
+                paths.append((agent, path))
+        if max_ticks <= 0:
+            return 0
+
+        from_tick = self.tick
+        for agent, path in paths:
+            new_x, new_y = path[max_ticks].x, path[max_ticks].y
+            self.state.move_agent(agent, new_x, new_y)
+            events.emit(AGENT_MOVED, agent_id=agent.id, position=(new_x, new_y))
+        self.tick += max_ticks
+        # The cells every moving agent stood on at the end of each skipped tick
+        events.emit(TICKS_SKIPPED, from_tick=from_tick, to_tick=self.tick,
+                    paths={agent.id: path[1:max_ticks + 1] for agent, path in paths})
+
+        return max_ticks
+
+    def simulation_step(self, selfishness: bool) -> Grid:
+        with profiling.phase('tick'):
+            events.emit(TICK_STARTED, tick=self.tick)
+
+            if self._next_arrival_tick() == self.tick:
+                with profiling.phase('arrivals'):
+                    self._generate_arrivals()
+            self.state = self._process_intentions(self.state, self.tick, selfishness)
+            if self.archive is not None:
+                with profiling.phase('archiving'):
+                    self.archive.collect(self.state)
+            events.emit(TICK_COMPLETED, tick=self.tick)
+        if profiling.active is not None:
+            _end_tick(self.tick)
         self.tick += 1
 
         return self.state
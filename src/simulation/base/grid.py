@@ -1,11 +1,21 @@
 from abc import ABC, abstractmethod
+import itertools
 import uuid
 
+import numpy as np
+
+from src.simulation.base import snapshots
+from src.simulation.base.agent_store import AgentStore
 from src.simulation.base.intentions import Intention
-from src.utils import logging_utils
+from src.utils import events, logging_utils
+
+# declare the logger, which is set up with its first record
+logging_utils.declare_logger('GridLogger', 'grid.log')
+
+BOARD_OBJECT_ADDED = events.EventType('board_object_added', 'GridLogger', "Added {obj} to grid at position {position}")
 
-# setup logger
-logger = logging_utils.setup_logger('GridLogger', 'grid.log')
+# Versions of obstacle layers, never handed out twice, so that a version a snapshot restores stands for that map only
+_map_versions = itertools.count()
 
 
 def create_empty_board(dim_x: int, dim_y: int) -> list[list[list['BoardObject']]]:
@@ -23,6 +33,7 @@ class BoardObject(ABC):
         self.position = None
 
     def set_position(self, position: tuple[int, int]):
+        snapshots.touch(self)
         self.position = position
 
     def get_position(self) -> tuple[int, int]:
@@ -51,19 +62,39 @@ class PickupStation(BoardObject, ABC):
 
 class Agent(BoardObject, ABC):
     def __init__(self, position: tuple[int, int], capacity: int = 1):
+        self.store = None
+        self.store_index = None
         super().__init__()
         self.set_position(position)
         self.items = []
         self.capacity = capacity
         self.total_cost = 0
         self.winner_bids = []
+        self.route = []  # Stops of the route planned by the grid's route planner, if it has one
+
+    @property
+    def position(self):
+        if self.store is not None:
+            return self.store.position_of(self.store_index)
+        return self._position
+
+    @position.setter
+    def position(self, position):
+        if self.store is not None:
+            self.store.set_position(self.store_index, position)
+        else:
+            self._position = position
 
     @abstractmethod
-    def make_intention(self, grid: 'Grid', selfishness: bool) -> Intention:
+    def make_intention(self, grid: 'Grid', selfishness: bool, next_node: tuple[int, int] = None) -> Intention:
+        """`next_node` is the next step towards the agent's target when it was already planned elsewhere"""
         pass
 
 
 class Grid:
+    # Board-sized layers, which snapshots journal cell by cell instead of copying them whole
+    cell_journaled = ('obstacle_layer', 'pickup_layer', 'delivery_layer', 'map_layer')
+
     def __init__(self, board: list[list[list[BoardObject]]],
                  grid_size: [int, int],
                  pickup_stations: list[PickupStation] = None,
@@ -76,32 +107,132 @@ class Grid:
         self.agents = agents if agents is not None else []
         self.board = board
         self.grid_size = grid_size
+        self.agent_store = None
+        # A routing.RoutePlanner planning the pickup and delivery routes of the agents' bundles, None to pick up the
+        # items of a bundle nearest first
+        self.route_planner = None
+        # Obstacles loaded in bulk from an obstacle map, which only exist as this layer (see load_obstacle_map)
+        self.map_layer = None
+        self._map_obstacles = {}
+
+        # Boolean layers mirroring the static objects on the board, so that checks over many positions can run as
+        # single array operations instead of scanning the objects of every cell
+        dimensions = self.board_dimensions()
+        self.obstacle_layer = np.zeros(dimensions, dtype=bool)
+        self.pickup_layer = np.zeros(dimensions, dtype=bool)
+        self.delivery_layer = np.zeros(dimensions, dtype=bool)
+        # Changes with every change of the obstacle layer, for what is computed from the map to tell when it is stale
+        self.map_version = next(_map_versions)
+        for x, column in enumerate(self.board):
+            for y, cell in enumerate(column):
+                if cell:
+                    self._refresh_layers_at(x, y)
 
     def board_dimensions(self) -> tuple[int, int]:
         return len(self.board), len(self.board[0])
 
+    def _map_changed(self):
+        snapshots.touch(self)
+        self.map_version = next(_map_versions)
+
+    def _refresh_layers_at(self, x: int, y: int):
+        cell = self.board[x][y]
+        for layer in (self.obstacle_layer, self.pickup_layer, self.delivery_layer):
+            snapshots.touch_cells(layer, (x, y))
+        blocked = any(isinstance(board_object, Obstacle) for board_object in cell) or \
+            (self.map_layer is not None and self.map_layer[x, y])
+        if blocked != self.obstacle_layer[x, y]:
+            self._map_changed()
+        self.obstacle_layer[x, y] = blocked
+        self.pickup_layer[x, y] = any(isinstance(board_object, PickupStation) for board_object in cell)
+        self.delivery_layer[x, y] = any(isinstance(board_object, DeliveryStation) for board_object in cell)
+
+    def load_obstacle_map(self, layer: np.ndarray):
+        """Block every cell that is True in `layer`, of the board's dimensions, in one go. No Obstacle objects are
+        created and no events emitted for them; obstacle_at materializes one on demand"""
+        layer = np.asarray(layer)
+        if layer.dtype != bool:
+            layer = layer != 0
+        if layer.shape != self.board_dimensions():
+            raise InvalidGrid(f"Obstacle map of shape {layer.shape} does not fit a board of {self.board_dimensions()}")
+        self._map_changed()
+        snapshots.touch_cells(self.obstacle_layer, np.nonzero(layer))
+        self.map_layer = layer if self.map_layer is None else self.map_layer | layer
+        self.obstacle_layer |= layer
+
+    def obstacle_at(self, position: tuple[int, int]) -> Obstacle | None:
+        """The obstacle blocking a cell, None if it is free. Cells blocked by the obstacle map get an Obstacle, which
+        is kept off the board, the first time one is asked for"""
+        x, y = position
+        obstacle = next((obj for obj in self.board[x][y] if isinstance(obj, Obstacle)), None)
+        if obstacle is None and self.map_layer is not None and self.map_layer[x, y]:
+            obstacle = self._map_obstacles.get((x, y))
+            if obstacle is None:
+                obstacle = self._map_obstacles[(x, y)] = Obstacle((x, y))
+        return obstacle
+
+    def use_agent_store(self) -> AgentStore:
+        """Move the positions of the agents into an AgentStore. From then on, agents are tracked by the store and its
+        occupancy layer instead of the board cells, which only hold the static objects"""
+        if self.agent_store is None:
+            snapshots.touch(self)
+            self.agent_store = AgentStore(self.board_dimensions(), max(len(self.agents), 16))
+            for agent in self.agents:
+                self.remove_board_object(agent, agent.position)
+            indices = self.agent_store.add_all([agent.position for agent in self.agents])
+            for agent, index in zip(self.agents, indices):
+                self._attach_to_store(agent, index)
+        return self.agent_store
+
+    def _attach_to_store(self, agent: Agent, index: int = None):
+        snapshots.touch(agent)
+        agent.store_index = self.agent_store.add(agent.position) if index is None else index
+        agent.store = self.agent_store
+        del agent._position
+
     def add_board_object(self, obj: BoardObject):
         x, y = obj.position
-        self.board[x][y].append(obj)
+        if isinstance(obj, Agent) and self.agent_store is not None:
+            self._attach_to_store(obj)
+        else:
+            snapshots.touch_list(self.board[x][y])
+            self.board[x][y].append(obj)
 
         # Check the type of the object and add it to the appropriate list
+        # Only the list and the layer cell that change are journaled, not the whole grid
         if isinstance(obj, PickupStation):
-            self.pickup_stations.append(obj)
+            objects, layer = self.pickup_stations, self.pickup_layer
         elif isinstance(obj, DeliveryStation):
-            self.delivery_stations.append(obj)
+            objects, layer = self.delivery_stations, self.delivery_layer
         elif isinstance(obj, Agent):
-            self.agents.append(obj)
+            objects, layer = self.agents, None
         elif isinstance(obj, Obstacle):
-            self.obstacles.append(obj)
+            objects, layer = self.obstacles, self.obstacle_layer
         else:
             raise InvalidGrid(f"Object {obj} of type {type(obj)} is not a valid board object")
+        snapshots.touch_list(objects)
+        objects.append(obj)
+        if layer is not None:
+            snapshots.touch_cells(layer, (x, y))
+            if layer is self.obstacle_layer and not layer[x, y]:
+                self._map_changed()
+            layer[x, y] = True
+
+        events.emit(BOARD_OBJECT_ADDED, obj=obj, position=obj.position)
 
-        logger.info(f"Added {obj} to grid at position {obj.position}")
-        print(f"Added {obj} to grid at position {obj.position}")
+    def move_agent(self, agent: Agent, new_x: int, new_y: int):
+        if self.agent_store is None:
+            self.remove_board_object(agent, agent.position)
+            snapshots.touch_list(self.board[new_x][new_y])
+            self.board[new_x][new_y].append(agent)
+        agent.update_position([new_x, new_y])
 
     def remove_board_object(self, obj: BoardObject, position: tuple[int, int]):
         x, y = position
+        snapshots.touch_list(self.board[x][y])
         self.board[x][y].remove(obj)
+        if not isinstance(obj, Agent):
+            self._refresh_layers_at(x, y)
 
     def get_most_crowded_pickup_station(self):
         pickup_stations_sorted_by_crowd = sorted(self.pickup_stations, key=lambda station: len(station.items),
@@ -109,6 +240,15 @@ class Grid:
         most_crowded_station = pickup_stations_sorted_by_crowd[0] if pickup_stations_sorted_by_crowd else None
         return most_crowded_station
 
+    def get_agent_indices_by_id(self) -> dict:
+        return {agent.id: index for index, agent in enumerate(self.agents)}
+
+    def get_pickup_stations_by_position(self) -> dict:
+        return {tuple(station.position): station for station in self.pickup_stations}
+
+    def get_pickup_stations_by_id(self) -> dict:
+        return {station.id: station for station in self.pickup_stations}
+
     def get_agent_index_by_id(self, agent_id):
         return next((index for index, agent in enumerate(self.agents) if agent.id == agent_id), None)
 
@@ -1,9 +1,18 @@
 from abc import ABC
 
-from src.utils import logging_utils
+from src.utils import events, logging_utils
 
-# setup logger
-logger = logging_utils.setup_logger('IntentionsLogger', 'intentions.log')
+# declare the logger, which is set up with its first record
+logging_utils.declare_logger('IntentionsLogger', 'intentions.log')
+
+INTENTION_CREATED = events.EventType('intention_created', 'IntentionsLogger',
+                                     "Intention initialized by agent {agent_id}")
+PICKUP_CREATED = events.EventType('pickup_created', 'IntentionsLogger',
+                                  "Pickup intention initialized by agent {agent_id} for item {item_id}")
+DELIVER_CREATED = events.EventType('deliver_created', 'IntentionsLogger',
+                                   "Delivery intention initialized by agent {agent_id} for item {item_id}")
+MOVE_CREATED = events.EventType('move_created', 'IntentionsLogger',
+                                "Move intention initialized by agent {agent_id} to direction {direction}")
 
 
 class Intention(ABC):
@@ -12,8 +21,7 @@ class Intention(ABC):
 
     def __init__(self, agent_id: int):
         self.agent_id = agent_id
-        logger.info(f"Intention initialized by agent {agent_id}")
-        print(f"Intention initialized by agent {agent_id}")
+        events.emit(INTENTION_CREATED, agent_id=agent_id)
 
 
 class Pickup(Intention):
@@ -23,8 +31,7 @@ class Pickup(Intention):
         """:param int | None item_id: None means that the agent wants to pick up any item"""
         super().__init__(agent_id)
         self.item_id = item_id
-        logger.info(f"Pickup intention initialized by agent {agent_id} for item {item_id}")
-        print(f"Pickup intention initialized by agent {agent_id} for item {item_id}")
+        events.emit(PICKUP_CREATED, agent_id=agent_id, item_id=item_id)
 
 
 class Deliver(Intention):
@@ -34,8 +41,7 @@ class Deliver(Intention):
         """:param int | None item_id: None means that the agent wants to pick up any item"""
         super().__init__(agent_id)
         self.item_id = item_id
-        logger.info(f"Delivery intention initialized by agent {agent_id} for item {item_id}")
-        print(f"Delivery intention initialized by agent {agent_id} for item {item_id}")
+        events.emit(DELIVER_CREATED, agent_id=agent_id, item_id=item_id)
 
 
 class Move(Intention):
@@ -53,5 +59,4 @@ class Move(Intention):
         if direction not in self.ALLOWED_MOVES:
             raise ValueError(f"Invalid move direction: {direction}. Allowed directions are {self.ALLOWED_MOVES}")
         self.direction = direction
-        logger.info(f"Move intention initialized by agent {agent_id} to direction {direction}")
-        print(f"Move intention initialized by agent {agent_id} to direction {direction}")
+        events.emit(MOVE_CREATED, agent_id=agent_id, direction=direction)
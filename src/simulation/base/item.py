@@ -2,8 +2,17 @@ from enum import Enum, auto
 
 import uuid
 
+from src.simulation.base import snapshots
 from src.simulation.base.grid import PickupStation, DeliveryStation
-from src.utils import logging_utils
+from src.utils import events, logging_utils
+
+# declare the logger, which is set up with its first record
+logging_utils.declare_logger('ItemLogger', 'item.log')
+
+ITEM_CREATED = events.EventType('item_created', 'ItemLogger', "Item created with tick {created_tick}, source {source}, "
+                                                              "destination {destination}, status {status}")
+ITEM_PICKED_UP = events.EventType('item_picked_up', 'ItemLogger', "Item {item_id} picked up at tick {tick}")
+ITEM_DELIVERED = events.EventType('item_delivered', 'ItemLogger', "Item {item_id} delivered at tick {tick}")
 
 
 class ItemStatus(Enum):
@@ -28,17 +37,15 @@ class Item:
         self.status = status
         self.priority = priority
 
-        self.logger = logging_utils.setup_logger("ItemLogger", "item.log")
-        self.logger.info(f"Item created with tick {created_tick}, source {source}, destination {destination}, status {status}")
-        print(f"Item created with tick {created_tick}, source {source}, destination {destination}, status {status}")
+        events.emit(ITEM_CREATED, item_id=self.id, created_tick=created_tick, source=source, destination=destination,
+                    status=status)
 
     def set_status(self, status: ItemStatus, tick: int):
+        snapshots.touch(self)
         self.status = status
         if status == ItemStatus.IN_TRANSIT:
             self.pickup_tick = tick
-            self.logger.info(f"Item {self.id} picked up at tick {tick}")
-            print(f"Item {self.id} picked up at tick {tick}")
+            events.emit(ITEM_PICKED_UP, item_id=self.id, agent_id=self.agent_id, tick=tick)
         elif status == ItemStatus.DELIVERED:
             self.delivered_tick = tick
-            self.logger.info(f"Item {self.id} delivered at tick {tick}")
-            print(f"Item {self.id} delivered at tick {tick}")
+            events.emit(ITEM_DELIVERED, item_id=self.id, agent_id=self.agent_id, tick=tick)
@@ -0,0 +1,120 @@
+"""Copy-on-write snapshots of the simulation state.
+
+Items are shared between pickup stations, agents and winning bids, so the state cannot be split into independent copies
+cheaply. Instead, a snapshot journals every object the first time it is mutated after the snapshot was taken, and
+restoring the snapshot writes back only those objects. Taking a snapshot is O(1) and restoring it is proportional to what
+changed since, independently of the board size.
+
+Journaling an object copies its arrays, which for board-sized layers would cost O(board) for a single changed cell.
+Classes name such arrays in `cell_journaled`: touch() leaves them out, and the cells written to them are journaled one
+by one with touch_cells() instead."""
+
+import random
+
+import numpy as np
+
+_journals = []
+
+
+class _Journal:
+    def __init__(self):
+        self.saved_objects = {}
+        self.saved_lists = {}
+        self.saved_cells = []
+
+    def save_object(self, obj):
+        if id(obj) in self.saved_objects:
+            return
+        attributes = obj.__dict__.copy()
+        # Lists are saved once, when first journaled either on their own or with an object holding them
+        for value in attributes.values():
+            if isinstance(value, list):
+                self.save_list(value)
+        skipped = getattr(obj, 'cell_journaled', ())
+        copies = {name: value.copy() for name, value in attributes.items() if hasattr(value, 'copy')
+                  and not isinstance(value, (list, dict)) and name not in skipped}
+        self.saved_objects[id(obj)] = (obj, attributes, copies)
+
+    def save_cells(self, array, index):
+        self.saved_cells.append((array, index, np.array(array[index])))
+
+    def save_list(self, lst: list):
+        if id(lst) not in self.saved_lists:
+            self.saved_lists[id(lst)] = (lst, list(lst))
+
+    def restore(self):
+        for lst, contents in self.saved_lists.values():
+            lst[:] = contents
+        for obj, attributes, copies in self.saved_objects.values():
+            obj.__dict__.clear()
+            obj.__dict__.update(attributes)
+            obj.__dict__.update(copies)
+        # Latest first, so that a cell written several times ends up with its oldest value
+        for array, index, values in reversed(self.saved_cells):
+            array[index] = values
+
+
+def touch(obj) -> None:
+    """Record the current attributes of an object before it is mutated, if any snapshot is open"""
+    for journal in _journals:
+        journal.save_object(obj)
+
+
+def touch_cells(array, index) -> None:
+    """Record the current values of the cells of an array at `index` (anything the array can be indexed with) before
+    they are written, if any snapshot is open"""
+    for journal in _journals:
+        journal.save_cells(array, index)
+
+
+def touch_list(lst: list) -> None:
+    """Record the current contents of a list (e.g. a board cell) before it is mutated, if any snapshot is open"""
+    for journal in _journals:
+        journal.save_list(lst)
+
+
+def journaling() -> bool:
+    """Whether any snapshot is open, so that changes made now may still be rolled back"""
+    return bool(_journals)
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class Snapshot:
+    """A point in the history of an Environment that can be restored. Snapshots nest: only the most recent open snapshot
+    can be restored or released"""
+
+    def __init__(self, environment):
+        self.environment = environment
+        self._journal = _Journal()
+        self._journal.save_object(environment)
+        self._random_state = random.getstate()
+        _journals.append(self._journal)
+
+    @property
+    def is_open(self) -> bool:
+        return self._journal in _journals
+
+    def _close(self):
+        if not _journals or _journals[-1] is not self._journal:
+            raise SnapshotError("Only the most recent open snapshot can be closed")
+        _journals.pop()
+
+    def restore(self) -> None:
+        """Undo every change made since the snapshot was taken and close it"""
+        self._close()
+        self._journal.restore()
+        random.setstate(self._random_state)
+
+    def release(self) -> None:
+        """Keep the changes made since the snapshot was taken and close it"""
+        self._close()
+
+    def __enter__(self) -> 'Snapshot':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.is_open:
+            self.restore()
@@ -0,0 +1,293 @@
+"""Checkpoints of the full simulation state.
+
+A checkpoint is a directory of columnar NumPy arrays (one .npy file per column, loaded memory-mapped) next to a small
+JSON file with the scalars. Object references are stored as indices into the columns of the referenced objects and list
+memberships in CSR form (offsets + flat indices), so saving and loading are proportional to the live state. Restoring
+a checkpoint and stepping on produces the same run as never having stopped."""
+
+import importlib
+import json
+import os
+import random
+import shutil
+import uuid
+
+import numpy as np
+
+from src.simulation.archive import Archive
+from src.simulation.arrivals import arrival_source
+from src.simulation.base.environment import Environment
+from src.simulation.base.grid import Grid, Obstacle, PickupStation, DeliveryStation, create_empty_board
+from src.simulation.base.item import Item, ItemStatus
+from src.simulation.routing import RoutePlanner, Stop
+
+METADATA = 'checkpoint.json'
+VERSION = 1
+
+TUPLE = 0
+LIST = 1
+
+
+class CheckpointError(Exception):
+    pass
+
+
+def _class_path(cls) -> str:
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+def _import_class(path: str):
+    module, name = path.rsplit('.', 1)
+    return getattr(importlib.import_module(module), name)
+
+
+def _ids(objects) -> np.ndarray:
+    return np.frombuffer(b''.join(obj.id.bytes for obj in objects), dtype=np.uint8).reshape(-1, 16)
+
+
+def _positions(objects) -> tuple[np.ndarray, np.ndarray]:
+    positions = np.array([list(obj.position) for obj in objects], dtype=np.int64).reshape(-1, 2)
+    # Moved agents hold lists and configured objects whatever the config held, keep the type so comparisons behave
+    kinds = np.array([LIST if isinstance(obj.position, list) else TUPLE for obj in objects], dtype=np.uint8)
+    return positions, kinds
+
+
+def _csr(lists: list[list[int]]) -> tuple[np.ndarray, np.ndarray]:
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(indices) for indices in lists])
+    flat = np.array([index for indices in lists for index in indices], dtype=np.int64)
+    return offsets, flat
+
+
+def _split(offsets: np.ndarray, flat: np.ndarray) -> list[list[int]]:
+    offsets, flat = offsets.tolist(), flat.tolist()
+    return [flat[start:end] for start, end in zip(offsets, offsets[1:])]
+
+
+def _optional(values) -> np.ndarray:
+    return np.array([-1 if value is None else value for value in values], dtype=np.int64)
+
+
+def save_checkpoint(environment: Environment, path: str) -> None:
+    """Write the state of the environment to the directory `path`. A previous checkpoint there is moved aside before the
+    new one takes its place and deleted after, so that a crash in between leaves one of them to load"""
+    state = environment.state
+
+    items = {}
+    for station in state.pickup_stations:
+        for item in station.items:
+            items.setdefault(id(item), item)
+    for agent in state.agents:
+        for item in agent.items:
+            items.setdefault(id(item), item)
+        for bid in agent.winner_bids:
+            for item in bid['ordered_bundle']:
+                items.setdefault(id(item), item)
+        for stop in agent.route:
+            if not stop.done:
+                items.setdefault(id(stop.item), stop.item)
+    items = list(items.values())
+    item_indices = {id(item): index for index, item in enumerate(items)}
+
+    agent_indices = {agent.id: index for index, agent in enumerate(state.agents)}
+    pickup_indices = {id(station): index for index, station in enumerate(state.pickup_stations)}
+    delivery_indices = {id(station): index for index, station in enumerate(state.delivery_stations)}
+    agent_classes = sorted({_class_path(type(agent)) for agent in state.agents})
+
+    columns = {
+        'obstacle_ids': _ids(state.obstacles),
+        'pickup_ids': _ids(state.pickup_stations),
+        'delivery_ids': _ids(state.delivery_stations),
+        'agent_ids': _ids(state.agents),
+        'agent_class': np.array([agent_classes.index(_class_path(type(agent))) for agent in state.agents],
+                                dtype=np.uint8),
+        'agent_capacity': np.array([agent.capacity for agent in state.agents], dtype=np.int64),
+        'agent_total_cost': np.array([agent.total_cost for agent in state.agents], dtype=np.int64),
+        'item_ids': _ids(items),
+        'item_created_tick': np.array([item.created_tick for item in items], dtype=np.int64),
+        'item_pickup_tick': _optional(item.pickup_tick for item in items),
+        'item_delivered_tick': _optional(item.delivered_tick for item in items),
+        'item_agent': _optional(agent_indices.get(item.agent_id) for item in items),
+        'item_source': _optional(pickup_indices.get(id(item.source)) for item in items),
+        'item_destination': _optional(delivery_indices.get(id(item.destination)) for item in items),
+        'item_status': np.array([item.status.value for item in items], dtype=np.uint8),
+        'item_priority': np.array([item.priority for item in items], dtype=np.int64),
+        'bid_agent': np.array([agent_index for agent_index, agent in enumerate(state.agents)
+                               for _ in agent.winner_bids], dtype=np.int64),
+        'bid_costs': np.array([bid['costs'] for agent in state.agents for bid in agent.winner_bids], dtype=np.int64),
+    }
+    for name, objects in (('obstacle', state.obstacles), ('pickup', state.pickup_stations),
+                          ('delivery', state.delivery_stations), ('agent', state.agents)):
+        columns[f'{name}_position'], columns[f'{name}_position_kind'] = _positions(objects)
+    if state.map_layer is not None:
+        columns['obstacle_map'] = np.asarray(state.map_layer)
+    columns['pickup_items_offsets'], columns['pickup_items'] = _csr(
+        [[item_indices[id(item)] for item in station.items] for station in state.pickup_stations])
+    columns['agent_items_offsets'], columns['agent_items'] = _csr(
+        [[item_indices[id(item)] for item in agent.items] for agent in state.agents])
+    # The stops still to be served, as twice the index of their item, plus one for pickups
+    columns['agent_route_offsets'], columns['agent_route'] = _csr(
+        [[2 * item_indices[id(stop.item)] + stop.pickup for stop in agent.route if not stop.done]
+         for agent in state.agents])
+    columns['bid_items_offsets'], columns['bid_items'] = _csr(
+        [[item_indices[id(item)] for item in bid['ordered_bundle']] for agent in state.agents
+         for bid in agent.winner_bids])
+
+    version, internal_state, gauss_next = random.getstate()
+    columns['random_state'] = np.array(internal_state, dtype=np.int64)
+
+    metadata = {
+        'version': VERSION,
+        'environment_class': _class_path(type(environment)),
+        'agent_classes': agent_classes,
+        'tick': environment.tick,
+        'items_added': environment.items_added,
+        'arrivals': {'interval': environment.arrival_interval, 'batch': environment.arrival_batch,
+                     'max_items': environment.max_items},
+        'arrival_source': environment.arrival_source.config() if environment.arrival_source is not None else None,
+        'archive': environment.archive.config() if environment.archive is not None else None,
+        'route_planner': state.route_planner is not None,
+        'grid_size': list(state.grid_size),
+        'dimensions': list(state.board_dimensions()),
+        'random_version': version,
+        'random_gauss_next': gauss_next,
+    }
+
+    temporary_path = f"{path}.tmp"
+    shutil.rmtree(temporary_path, ignore_errors=True)
+    os.makedirs(temporary_path)
+    for name, column in columns.items():
+        np.save(os.path.join(temporary_path, f"{name}.npy"), column)
+    with open(os.path.join(temporary_path, METADATA), 'w') as file:
+        json.dump(metadata, file)
+
+    previous_path = f"{path}.old"
+    shutil.rmtree(previous_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, previous_path)
+    os.replace(temporary_path, path)
+    shutil.rmtree(previous_path, ignore_errors=True)
+
+
+def load_checkpoint(path: str) -> Environment:
+    """Rebuild the environment saved in `path` and restore the random number generator to where it was. When saving
+    over `path` was interrupted, the previous checkpoint moved aside is loaded"""
+    if not os.path.exists(path) and os.path.exists(f"{path}.old"):
+        path = f"{path}.old"
+    try:
+        with open(os.path.join(path, METADATA)) as file:
+            metadata = json.load(file)
+    except FileNotFoundError:
+        raise CheckpointError(f"{path} is not a checkpoint")
+    if metadata['version'] != VERSION:
+        raise CheckpointError(f"Checkpoint version {metadata['version']} is not supported")
+
+    def column(name) -> np.ndarray:
+        return np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+
+    def restore(cls, name, *args):
+        ids = column(f'{name}_ids')
+        positions = column(f'{name}_position').tolist()
+        kinds = column(f'{name}_position_kind').tolist()
+        objects = []
+        for index, (position, kind) in enumerate(zip(positions, kinds)):
+            obj = (cls[index] if isinstance(cls, list) else cls)(position if kind == LIST else tuple(position), *args)
+            obj.id = uuid.UUID(bytes=ids[index].tobytes())
+            objects.append(obj)
+        return objects
+
+    dim_x, dim_y = metadata['dimensions']
+    grid = Grid(create_empty_board(dim_x, dim_y), metadata['grid_size'])
+    if os.path.exists(os.path.join(path, 'obstacle_map.npy')):
+        grid.load_obstacle_map(column('obstacle_map'))
+
+    agent_classes = [_import_class(class_path) for class_path in metadata['agent_classes']]
+    obstacles = restore(Obstacle, 'obstacle')
+    pickup_stations = restore(PickupStation, 'pickup')
+    delivery_stations = restore(DeliveryStation, 'delivery')
+    agents = restore([agent_classes[index] for index in column('agent_class').tolist()], 'agent')
+    for obj in obstacles + pickup_stations + delivery_stations + agents:
+        grid.add_board_object(obj)
+
+    item_ids = column('item_ids')
+    items = []
+    for index, (created, pickup, delivered, agent, source, destination, status, priority) in enumerate(zip(
+            column('item_created_tick').tolist(), column('item_pickup_tick').tolist(),
+            column('item_delivered_tick').tolist(), column('item_agent').tolist(), column('item_source').tolist(),
+            column('item_destination').tolist(), column('item_status').tolist(), column('item_priority').tolist())):
+        item = Item(created, pickup_stations[source] if source >= 0 else None,
+                    delivery_stations[destination] if destination >= 0 else None, ItemStatus(status), priority)
+        item.id = uuid.UUID(bytes=item_ids[index].tobytes())
+        item.pickup_tick = pickup if pickup >= 0 else None
+        item.delivered_tick = delivered if delivered >= 0 else None
+        item.agent_id = agents[agent].id if agent >= 0 else None
+        items.append(item)
+
+    for station, indices in zip(pickup_stations, _split(column('pickup_items_offsets'), column('pickup_items'))):
+        station.items = [items[index] for index in indices]
+    for agent, capacity, total_cost, indices in zip(agents, column('agent_capacity').tolist(),
+                                                    column('agent_total_cost').tolist(),
+                                                    _split(column('agent_items_offsets'), column('agent_items'))):
+        agent.capacity = capacity
+        agent.total_cost = total_cost
+        agent.items = [items[index] for index in indices]
+    for agent_index, costs, indices in zip(column('bid_agent').tolist(), column('bid_costs').tolist(),
+                                           _split(column('bid_items_offsets'), column('bid_items'))):
+        agent = agents[agent_index]
+        agent.winner_bids.append({'ordered_bundle': [items[index] for index in indices], 'costs': costs,
+                                  'agent': agent})
+    if os.path.exists(os.path.join(path, 'agent_route.npy')):
+        for agent, stops in zip(agents, _split(column('agent_route_offsets'), column('agent_route'))):
+            agent.route = [Stop(items[stop // 2], bool(stop % 2)) for stop in stops]
+    if metadata.get('route_planner'):
+        grid.route_planner = RoutePlanner(grid)
+
+    environment = _import_class(metadata['environment_class'])(grid)
+    environment.tick = metadata['tick']
+    environment.items_added = metadata['items_added']
+    # Checkpoints from before arrivals were configurable keep the defaults
+    arrivals = metadata.get('arrivals', {})
+    environment.arrival_interval = arrivals.get('interval', environment.arrival_interval)
+    environment.arrival_batch = arrivals.get('batch', environment.arrival_batch)
+    environment.max_items = arrivals.get('max_items', environment.max_items)
+    if metadata.get('arrival_source') is not None:
+        environment.arrival_source = arrival_source(metadata['arrival_source'])
+    if metadata.get('archive') is not None:
+        # Reopening the archive drops the rows written after the checkpoint
+        environment.archive = Archive(**metadata['archive'])
+    random.setstate((metadata['random_version'], tuple(column('random_state').tolist()),
+                     metadata['random_gauss_next']))
+
+    return environment
+
+
+class Checkpointer:
+    """Saves a checkpoint of the environment every `interval` ticks into `directory`/tick_<tick>, keeping the latest
+    `keep` of them"""
+
+    def __init__(self, directory: str, interval: int, keep: int = 2):
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+
+    def after_step(self, environment: Environment, previous_tick: int = None) -> None:
+        """Save when the step from `previous_tick` (by default the tick before) crossed a multiple of the interval,
+        event driven runs can jump over the multiple itself"""
+        previous_tick = environment.tick - 1 if previous_tick is None else previous_tick
+        if environment.tick // self.interval > previous_tick // self.interval:
+            save_checkpoint(environment, os.path.join(self.directory, f"tick_{environment.tick:012d}"))
+            for stale in checkpoints(self.directory)[:-self.keep]:
+                shutil.rmtree(stale)
+
+
+def checkpoints(directory: str) -> list[str]:
+    """The checkpoints in `directory` by tick, including one moved aside by an interrupted save over it"""
+    names = [name for name in os.listdir(directory) if name.startswith('tick_') and not name.endswith('.tmp')]
+    found = {name.removesuffix('.old'): name for name in sorted(names, reverse=True)}
+    return [os.path.join(directory, found[name]) for name in sorted(found)]
+
+
+def latest_checkpoint(directory: str) -> str | None:
+    found = checkpoints(directory) if os.path.isdir(directory) else []
+    return found[-1] if found else None
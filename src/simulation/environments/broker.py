@@ -1,9 +1,28 @@
+from src.simulation.base import snapshots
 from src.simulation.base.grid import Grid
 from src.simulation.base.item import ItemStatus
-from src.utils import logging_utils
+from src.utils import events, logging_utils, profiling
 import itertools
 
-logger = logging_utils.setup_logger('BrokerLogger', 'broker.log')
+logging_utils.declare_logger('BrokerLogger', 'broker.log')
+
+NO_ITEMS_FOR_AUCTION = events.EventType('no_items_for_auction', 'BrokerLogger', "No more items available for auction.")
+NO_AGENT_CAPACITY = events.EventType('no_agent_capacity', 'BrokerLogger', "No more agents with available capacity.")
+ASSIGNMENT_STARTED = events.EventType('assignment_started', 'BrokerLogger', "Assigning items to agents", console=False)
+ITEM_PROCESSING = events.EventType('item_processing', 'BrokerLogger', "Processing item with id: {item_id} at index: "
+                                                                      "{index}", console=False)
+AUCTION_WON = events.EventType('auction_won', 'BrokerLogger', "Agent {agent_id} won a bundle of {size} items for "
+                                                               "{costs}", level=events.DEBUG)
+ITEM_ASSIGNED = events.EventType('item_assigned', 'BrokerLogger', "Item {item_id} assigned to agent {agent_id}")
+ASSIGNMENT_FINISHED = events.EventType('assignment_finished', 'BrokerLogger', "Finished assign_items_to_agents method",
+                                       console=False)
+
+
+def auction_pending(state: Grid) -> bool:
+    """Whether a Broker created on this state would assign anything, i.e. there are unassigned items waiting and an
+    agent with room for them"""
+    return any(agent.current_capacity > 0 for agent in state.agents) and any(
+        item.status == ItemStatus.AWAITING_PICKUP for station in state.pickup_stations for item in station.items)
 
 
 class Broker:
@@ -12,8 +31,10 @@ class Broker:
         self.agents = state.agents
         self.total_agents_current_capacity = sum(agent.current_capacity for agent in self.agents)
         self.items_available_for_auction = self._get_all_items_available_for_auction()
-        self.bids = self.announce_items()
-        self.winners = self.auction_winners()
+        with profiling.phase('bidding'):
+            self.bids = self.announce_items()
+        with profiling.phase('winner_determination'):
+            self.winners = self.auction_winners()
 
 
     @property
@@ -26,6 +47,7 @@ class Broker:
             # Check if the agent's current capacity is greater than 0
             if agent.current_capacity > 0:
                 bids.append(agent.receive_auction_information(self.items_available_for_auction, self.state))
+        profiling.count('bids', sum(len(agent_bids) for agent_bids in bids))
         return bids
 
     def auction_winners(self):
@@ -35,6 +57,7 @@ class Broker:
         # Generate all combinations of bids
         bid_combinations = [combo for r in range(1, len(flat_data_bids) + 1) for combo in
                             itertools.combinations(flat_data_bids, r)]
+        profiling.count('bid_combinations', len(bid_combinations))
 
         # Filter combinations to those that include all items exactly once
         valid_combinations = []
@@ -64,31 +87,35 @@ class Broker:
 
     def assign_items_to_agents(self):
         if not self.items_available_for_auction:
-            logger.info("No more items available for auction.")
-            print("No more items available for auction.")
+            events.emit(NO_ITEMS_FOR_AUCTION)
             return
 
         if not self.agents_with_available_capacity:
-            logger.info("No more agents with available capacity.")
-            print("No more agents with available capacity.")
+            events.emit(NO_AGENT_CAPACITY)
             return
 
-        logger.info("Assigning items to agents")
+        events.emit(ASSIGNMENT_STARTED)
 
         for winner in self.winners:
             agent = winner['agent']
+            snapshots.touch(agent)
+            # Bids costed on a planned route come with it, the agent drives it from now on
+            route = winner.pop('route', None)
+            if route is not None:
+                agent.route = route
             agent.winner_bids.append(winner)
+            events.emit(AUCTION_WON, agent_id=agent.id, size=len(winner['ordered_bundle']), costs=winner['costs'])
             for index, item in enumerate(winner['ordered_bundle']):
-                logger.info(f"Processing item with id: {item.id} at index: {index}")
+                events.emit(ITEM_PROCESSING, item_id=item.id, index=index)
+                snapshots.touch(item)
                 agent.items.append(item)
                 item.priority = index + 1  # Set the priority of the item
                 item.agent_id = agent.id
                 item.status = ItemStatus.ASSIGNED_TO_AGENT
 
-                logger.info(f"Item {item.id} assigned to agent {agent.id}")
-                print(f"Item {item.id} assigned to agent {agent.id}")
+                events.emit(ITEM_ASSIGNED, item_id=item.id, agent_id=agent.id, priority=item.priority)
 
-        logger.info("Finished assign_items_to_agents method")
+        events.emit(ASSIGNMENT_FINISHED)
 
     def _get_all_items_available_for_auction(self):
         all_items = [item for station in self.state.pickup_stations for item in station.items if
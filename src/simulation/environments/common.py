@@ -1,8 +1,14 @@
 import random
 from collections import defaultdict
 
+import numpy as np
+
 from src.simulation.base.grid import Grid, InvalidGrid, PickupStation
-from src.simulation.base.intentions import Move, Intention, Pickup
+from src.simulation.base.intentions import Move, Intention, Pickup, Deliver
+from src.utils import events
+
+AGENT_MOVED = events.EventType('agent_moved', 'EnvironmentLogger', "Agent {agent_id} moved to {position}",
+                               level=events.DEBUG)
 
 
 class IllegalIntention(Exception):
@@ -25,6 +31,70 @@ class UnsupportedIntention(IllegalIntention):
     pass
 
 
+class IntentionBatch:
+    """Columnar view of the intentions of a single tick, so that validity checks can run as single array operations
+    against the board layers instead of per-intention lookups"""
+
+    OTHER = 0
+    MOVE = 1
+    PICKUP = 2
+    DELIVER = 3
+
+    def __init__(self, intentions: list[Intention], state: Grid):
+        self.intentions = intentions
+        agent_indices = state.get_agent_indices_by_id()
+        size = len(intentions)
+
+        self.agent_index = np.empty(size, dtype=np.int64)
+        self.kind = np.zeros(size, dtype=np.int8)
+        self.dx = np.zeros(size, dtype=np.int64)
+        self.dy = np.zeros(size, dtype=np.int64)
+        self.item_id = np.empty(size, dtype=object)
+        self.x = np.empty(size, dtype=np.int64)
+        self.y = np.empty(size, dtype=np.int64)
+
+        for row, intention in enumerate(intentions):
+            agent_index = agent_indices[intention.agent_id]
+            self.agent_index[row] = agent_index
+            if state.agent_store is None:
+                self.x[row], self.y[row] = state.agents[agent_index].position
+            if isinstance(intention, Move):
+                self.kind[row] = self.MOVE
+                self.dx[row], self.dy[row] = intention.direction
+            elif isinstance(intention, Pickup):
+                self.kind[row] = self.PICKUP
+                self.item_id[row] = intention.item_id
+            elif isinstance(intention, Deliver):
+                self.kind[row] = self.DELIVER
+                self.item_id[row] = intention.item_id
+        if state.agent_store is not None:
+            # Agents are added to the store in the order of the grid, so their indices are the same
+            positions = state.agent_store.positions[self.agent_index]
+            self.x, self.y = positions[:, 0], positions[:, 1]
+
+    def __len__(self) -> int:
+        return len(self.intentions)
+
+    @property
+    def new_x(self) -> np.ndarray:
+        return self.x + self.dx
+
+    @property
+    def new_y(self) -> np.ndarray:
+        return self.y + self.dy
+
+    def first(self, mask: np.ndarray) -> int | None:
+        """Row of the first intention selected by the mask, or None if the mask is empty"""
+        rows = np.flatnonzero(mask)
+        return int(rows[0]) if len(rows) > 0 else None
+
+
+def as_intention_batch(intentions: list[Intention] | IntentionBatch, state: Grid) -> IntentionBatch:
+    if isinstance(intentions, IntentionBatch):
+        return intentions
+    return IntentionBatch(intentions, state)
+
+
 def find_position_after_move(move_intention: Move, state: Grid) -> tuple[int, int]:
     agent = state.get_agent_index_by_id(move_intention.agent_id)
     agent_position = state.agents[agent].position
@@ -33,26 +103,54 @@ def find_position_after_move(move_intention: Move, state: Grid) -> tuple[int, in
     return x + move_intention.direction[0], y + move_intention.direction[1]
 
 
-def check_for_out_of_bounds_moves(intentions: list[Intention], state: Grid) -> None:
-    move_intentions = filter(lambda intention: isinstance(intention, Move), intentions)
+def in_bounds_mask(batch: IntentionBatch, state: Grid) -> np.ndarray:
+    """Mask of the intentions whose position after the move still lies on the board"""
     dim_x, dim_y = state.board_dimensions()
+    new_x, new_y = batch.new_x, batch.new_y
+    return (new_x >= 0) & (new_x < dim_x) & (new_y >= 0) & (new_y < dim_y)
+
 
-    for move_intention in move_intentions:
-        new_x, new_y = find_position_after_move(move_intention, state)
-        # Check if the new position is out of bounds
-        if new_x < 0 or new_x >= dim_x or new_y < 0 or new_y >= dim_y:
-            raise IllegalMove(f"Agent {move_intention.agent_id} tried to move out of bounds")
+def check_for_out_of_bounds_moves(intentions: list[Intention] | IntentionBatch, state: Grid) -> None:
+    batch = as_intention_batch(intentions, state)
+    out_of_bounds = (batch.kind == IntentionBatch.MOVE) & ~in_bounds_mask(batch, state)
+
+    row = batch.first(out_of_bounds)
+    if row is not None:
+        raise IllegalMove(f"Agent {batch.intentions[row].agent_id} tried to move out of bounds")
 
 
 def enact_move_intention(move_intention: Move, state: Grid) -> Grid:
     new_x, new_y = find_position_after_move(move_intention, state)
-    # Remove the agent from its current position
     agent_index = state.get_agent_index_by_id(move_intention.agent_id)
-    x, y = state.agents[agent_index].position
-    state.remove_board_object(state.agents[agent_index], (x, y))
-    # Add the agent to its new position
-    state.board[new_x][new_y].append(state.agents[agent_index])
-    state.agents[agent_index].update_position([new_x, new_y])
+    state.move_agent(state.agents[agent_index], new_x, new_y)
+    events.emit(AGENT_MOVED, agent_id=move_intention.agent_id, position=(new_x, new_y))
+
+    return state
+
+
+def enact_move_intentions(move_intentions: list[Move], state: Grid) -> Grid:
+    """Enact all moves of a tick at once. With an AgentStore this is a single update of the position arrays, otherwise
+    the moves are enacted one by one"""
+    if state.agent_store is None:
+        agent_indices = state.get_agent_indices_by_id()
+        for move_intention in move_intentions:
+            agent = state.agents[agent_indices[move_intention.agent_id]]
+            x, y = agent.position
+            new_x, new_y = x + move_intention.direction[0], y + move_intention.direction[1]
+            state.move_agent(agent, new_x, new_y)
+            events.emit(AGENT_MOVED, agent_id=move_intention.agent_id, position=(new_x, new_y))
+        return state
+
+    agent_indices = state.get_agent_indices_by_id()
+    # Agents are added to the store in the order of the grid, so their indices are the same
+    indices = np.fromiter((agent_indices[move_intention.agent_id] for move_intention in move_intentions),
+                          dtype=np.int64, count=len(move_intentions))
+    directions = np.array([move_intention.direction for move_intention in move_intentions], dtype=np.int64)
+    state.agent_store.move(indices, directions)
+    # The events are only built when a sink listens to them, e.g. a trace recorder
+    if events.bus.enabled_for(AGENT_MOVED.level):
+        for move_intention, (new_x, new_y) in zip(move_intentions, state.agent_store.positions[indices].tolist()):
+            events.emit(AGENT_MOVED, agent_id=move_intention.agent_id, position=(new_x, new_y))
 
     return state
 
@@ -61,11 +159,13 @@ def group_intentions_by_item_to_pickup(to_group: list[Pickup], state: Grid) -> \
         dict[int, dict[int | None, list[Pickup]]]:
     """Group pickup intentions by pickup station id and item id inside the pickup station"""
     grouped_intentions = defaultdict(lambda: defaultdict(list))
+    # Resolve agents and stations through hashed lookups built once, instead of a scan per intention
+    agent_indices = state.get_agent_indices_by_id()
+    pickup_stations_by_position = state.get_pickup_stations_by_position()
 
     for intention in to_group:
-        agent_index = state.get_agent_index_by_id(intention.agent_id)
-        agent = state.agents[agent_index]
-        pickup_station = agent.is_on_pickup_station(state)
+        agent = state.agents[agent_indices[intention.agent_id]]
+        pickup_station = pickup_stations_by_position.get(tuple(agent.position))
         if pickup_station is None:
             raise IllegalPickup(f"Pickup station from location {agent.position} not found in grid")
 
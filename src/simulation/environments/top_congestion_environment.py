@@ -1,14 +1,26 @@
+import numpy as np
+
+from src.simulation.base import snapshots
 from src.simulation.base.environment import Environment
-from src.simulation.base.grid import Grid, Obstacle, PickupStation, DeliveryStation
+from src.simulation.base.grid import Grid, PickupStation
 from src.simulation.base.intentions import Intention, Move, Pickup, Deliver
 from src.simulation.base.item import ItemStatus
 from src.simulation.environments.common import IllegalIntention, IllegalMove, IllegalPickup, IllegalDelivery, \
-    UnsupportedIntention, find_position_after_move, check_for_out_of_bounds_moves, group_intentions_by_item_to_pickup, \
-    shuffle_grouped_pickup_intentions, enact_move_intention
-from src.utils import logging_utils
+    UnsupportedIntention, IntentionBatch, as_intention_batch, in_bounds_mask, check_for_out_of_bounds_moves, \
+    group_intentions_by_item_to_pickup, shuffle_grouped_pickup_intentions, enact_move_intentions
+from src.utils import events, logging_utils
+
+# declare the logger, which is set up with its first record
+logging_utils.declare_logger('TopCongestionEnvironmentLogger', 'top_congestion_environment.log')
 
-# setup logger
-logger = logging_utils.setup_logger('TopCongestionEnvironmentLogger', 'top_congestion_environment.log')
+ITEM_DELIVERED_BY_AGENT = events.EventType('item_delivered_by_agent', 'TopCongestionEnvironmentLogger',
+                                           "Item {item_id} delivered by agent {agent_id}")
+ITEM_PICKED_UP_BY_AGENT = events.EventType('item_picked_up_by_agent', 'TopCongestionEnvironmentLogger',
+                                           "Item {item} picked up by agent {agent_id}")
+AGENT_PAID = events.EventType('agent_paid', 'TopCongestionEnvironmentLogger', "Agent {agent_id} paid {costs}",
+                              level=events.DEBUG)
+ILLEGAL_INTENTION = events.EventType('illegal_intention', 'TopCongestionEnvironmentLogger',
+                                     "Illegal intention detected: {error}", level=events.ERROR, console=False)
 
 
 def get_item_index_by_id(items_list, item_id):
@@ -21,37 +33,39 @@ def get_item_index_by_id(items_list, item_id):
     return None
 
 
-def check_for_collisions_with_obstacles(intentions: list[Intention], state: Grid) -> None:
-    move_intentions = filter(lambda intention: isinstance(intention, Move), intentions)
+def check_for_collisions_with_obstacles(intentions: list[Intention] | IntentionBatch, state: Grid) -> None:
+    batch = as_intention_batch(intentions, state)
+    in_bounds = (batch.kind == IntentionBatch.MOVE) & in_bounds_mask(batch, state)
+    new_x, new_y = batch.new_x[in_bounds], batch.new_y[in_bounds]
+    collisions = np.zeros(len(batch), dtype=bool)
+    collisions[in_bounds] = state.obstacle_layer[new_x, new_y]
 
-    for move_intention in move_intentions:
-        new_x, new_y = find_position_after_move(move_intention, state)
-        if any((isinstance(board_object, Obstacle) for board_object in state.board[new_x][new_y])):
-            raise IllegalMove(f"Agent {move_intention.agent_id} tried to move into an {state.board[new_x][new_y]} "
-                              f"in position {(new_x, new_y)}")
+    row = batch.first(collisions)
+    if row is not None:
+        new_x, new_y = int(batch.new_x[row]), int(batch.new_y[row])
+        raise IllegalMove(f"Agent {batch.intentions[row].agent_id} tried to move into an {state.board[new_x][new_y]} "
+                          f"in position {(new_x, new_y)}")
 
 
-def check_for_pickups_from_outside_station(intentions: list[Intention], state: Grid) -> None:
-    pickup_intentions = filter(lambda intention: isinstance(intention, Pickup), intentions)
+def check_for_pickups_from_outside_station(intentions: list[Intention] | IntentionBatch, state: Grid) -> None:
+    batch = as_intention_batch(intentions, state)
+    pickups = batch.kind == IntentionBatch.PICKUP
+    outside_station = pickups & ~state.pickup_layer[batch.x, batch.y]
 
-    for pickup_intention in pickup_intentions:
-        agent_index = state.get_agent_index_by_id(pickup_intention.agent_id)
-        agent_position = state.agents[agent_index].position
-        x, y = agent_position
-        if not any((isinstance(board_object, PickupStation) for board_object in state.board[x][y])):
-            raise IllegalPickup(f"Agent {pickup_intention.agent_id} tried to pick up an item from a non-pickup station")
+    row = batch.first(outside_station)
+    if row is not None:
+        raise IllegalPickup(f"Agent {batch.intentions[row].agent_id} tried to pick up an item from a non-pickup station")
 
 
-def check_for_deliveries_from_outside_station(intentions: list[Intention], state: Grid) -> None:
-    deliver_intentions = filter(lambda intention: isinstance(intention, Deliver), intentions)
+def check_for_deliveries_from_outside_station(intentions: list[Intention] | IntentionBatch, state: Grid) -> None:
+    batch = as_intention_batch(intentions, state)
+    deliveries = batch.kind == IntentionBatch.DELIVER
+    outside_station = deliveries & ~state.delivery_layer[batch.x, batch.y]
 
-    for deliver_intention in deliver_intentions:
-        agent_index = state.get_agent_index_by_id(deliver_intention.agent_id)
-        agent_position = state.agents[agent_index].position
-        x, y = agent_position
-        if not any((isinstance(board_object, DeliveryStation) for board_object in state.board[x][y])):
-            raise IllegalDelivery(f"Agent {deliver_intention.agent_id} tried to deliver an item to a non-delivery "
-                                  f"station")
+    row = batch.first(outside_station)
+    if row is not None:
+        raise IllegalDelivery(f"Agent {batch.intentions[row].agent_id} tried to deliver an item to a non-delivery "
+                              f"station")
 
 
 def check_if_intentions_come_from_unique_agents(intentions: list[Intention]) -> None:
@@ -77,12 +91,12 @@ def overflowing_pickups(grouped_intentions: dict[int, dict[int | None, list[Pick
     """Find intentions to pick up any item that won't be served, as there are not enough items in the pickup station
     (giving away concrete items had priority)"""
     overflow_intentions = []
+    pickup_stations_by_id = state.get_pickup_stations_by_id()
 
     for pickup_station_id, item_intentions in grouped_intentions.items():
         number_of_concrete_item_requests = len(item_intentions.keys()) if None not in item_intentions.keys() \
             else len(item_intentions.keys()) - 1
-        pickup_station_index = state.get_pickup_station_index_by_id(pickup_station_id)
-        number_of_awaiting_items = len(state.pickup_stations[pickup_station_index].items)
+        number_of_awaiting_items = len(pickup_stations_by_id[pickup_station_id].items)
         number_of_freely_available_items = number_of_awaiting_items - number_of_concrete_item_requests
 
         if len(item_intentions[None]) > number_of_freely_available_items:
@@ -100,16 +114,18 @@ def _enact_deliver_intention(deliver_intention: Deliver, state: Grid, tick: int)
         raise IllegalDelivery(f"Agent {deliver_intention.agent_id} tried to deliver an item that it does not have")
 
     item_to_deliver.set_status(ItemStatus.DELIVERED, tick)
+    snapshots.touch(agent)
     # Check in winner_bids of agent if all the items in the ordered_bundle have been delivered
     # If so, pay the agent with the costs specified in the winner_bid
     for winner_bid in agent.winner_bids:
-        ### First find the bid that contains the item
+        ### First find the bid that contains the item, every item is won in one bid only
         if item_to_deliver in winner_bid['ordered_bundle']:
             if all(item.status == ItemStatus.DELIVERED for item in winner_bid['ordered_bundle']):
                 agent.total_cost += winner_bid['costs']
+                events.emit(AGENT_PAID, agent_id=agent.id, costs=winner_bid['costs'])
+            break
 
-    logger.info(f"Item {item_to_deliver.id} delivered by agent {deliver_intention.agent_id}")
-    print(f"Item {item_to_deliver.id} delivered by agent {deliver_intention.agent_id}")
+    events.emit(ITEM_DELIVERED_BY_AGENT, item_id=item_to_deliver.id, agent_id=deliver_intention.agent_id)
 
     return state
 
@@ -121,14 +137,14 @@ def _enact_pickup_intention(pickup_intention: Pickup, state: Grid, tick: int) ->
                            state.board[agent_position[0]][agent_position[1]]
                            if isinstance(board_object, PickupStation)))
     item_index = get_item_index_by_id(pickup_station.items, pickup_intention.item_id)
+    snapshots.touch(pickup_station)
     try:
         item = pickup_station.items.pop(item_index)
     except IndexError:
         raise IllegalPickup(f"Agent {pickup_intention.agent_id} tried to pick up an item that is not in the pickup "
                             f"station")
     item.set_status(ItemStatus.IN_TRANSIT, tick)
-    logger.info(f"Item {item} picked up by agent {pickup_intention.agent_id}")
-    print(f"Item {item} picked up by agent {pickup_intention.agent_id}")
+    events.emit(ITEM_PICKED_UP_BY_AGENT, item=item, agent_id=pickup_intention.agent_id)
 
     return state
 
@@ -136,12 +152,14 @@ def _enact_pickup_intention(pickup_intention: Pickup, state: Grid, tick: int) ->
 class TopCongestionEnvironment(Environment):
     def _illegal_intentions(self, intentions: list[Intention], state: Grid) -> None:
         try:
-            check_for_out_of_bounds_moves(intentions, state)
-            check_for_collisions_with_obstacles(intentions, state)
-            check_for_pickups_from_outside_station(intentions, state)
-            check_for_deliveries_from_outside_station(intentions, state)
+            # Collect the intentions of the tick into columns once, every check then runs against the board layers
+            batch = IntentionBatch(intentions, state)
+            check_for_out_of_bounds_moves(batch, state)
+            check_for_collisions_with_obstacles(batch, state)
+            check_for_pickups_from_outside_station(batch, state)
+            check_for_deliveries_from_outside_station(batch, state)
         except Exception as e:
-            logger.error(f"Illegal intention detected: {e}")  # log error message
+            events.emit(ILLEGAL_INTENTION, error=e)
             raise
 
     def _contradicting_intentions(self, intentions: list[Intention], state: Grid) -> list[Intention]:
@@ -158,14 +176,17 @@ class TopCongestionEnvironment(Environment):
         return contradicting_intentions
 
     def _enact_valid_intentions(self, consistent_intentions: list[Intention], state: Grid, tick: int) -> Grid:
+        # Every agent has a single intention, so its move does not affect the others' pickups and deliveries, and all
+        # moves can be enacted together
+        move_intentions = []
         for intention in consistent_intentions:
             if isinstance(intention, Pickup):
                 state = _enact_pickup_intention(intention, state, tick)
             elif isinstance(intention, Deliver):
                 state = _enact_deliver_intention(intention, state, tick)
             elif isinstance(intention, Move):
-                state = enact_move_intention(intention, state)
+                move_intentions.append(intention)
             else:
                 raise UnsupportedIntention(f"Intention {intention} is not supported")
 
-        return state
+        return enact_move_intentions(move_intentions, state) if move_intentions else state
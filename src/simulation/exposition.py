@@ -0,0 +1,176 @@
+"""Live metrics of a run over HTTP, in the Prometheus text format.
+
+A MetricsServer serves `GET /metrics` from a background thread. The tick loop never waits for it: after every tick the
+simulation thread only publishes the handful of plain figures of the tick by swapping a single reference. The item
+counts and the latency histograms are only copied when the endpoint is scraped, under a lock the simulation thread
+holds just while it passes an event on to the collector. Events of rollouts on snapshots are ignored.
+
+The figures come from a MetricsCollector (backlog, items in transit and delivered, delivery latencies) and from the
+active Profiler (auction solve time, bids); when no profiler is active, the server enables its own."""
+
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.simulation.base import snapshots
+from src.simulation.base.environment import Environment, TICK_COMPLETED, TICKS_SKIPPED
+from src.simulation.base.item import ItemStatus
+from src.simulation.metrics import MetricsCollector, Histogram
+from src.utils import events, profiling
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+QUANTILES = (0.5, 0.9, 0.99)
+RATE_WINDOW = 100  # Ticks the ticks per second are averaged over
+
+
+def _quantiles(name: str, help_text: str, counts, total: int) -> list[str]:
+    histogram = Histogram(counts, total)
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} summary"]
+    for quantile in QUANTILES:
+        value = histogram.percentile(quantile * 100)
+        lines.append(f'{name}{{quantile="{quantile}"}} {value if value is not None else "NaN"}')
+    lines.append(f"{name}_sum {total}")
+    lines.append(f"{name}_count {int(counts.sum())}")
+    return lines
+
+
+def render(snapshot: dict) -> str:
+    """The snapshot of a run in the Prometheus text exposition format"""
+    lines = []
+
+    def metric(name: str, kind: str, help_text: str, value, labels: list[tuple[str, object]] = None) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if labels is None:
+            lines.append(f"{name} {value}")
+        else:
+            lines.extend(f'{name}{{{label}}} {labelled}' for label, labelled in labels)
+
+    metric('simulation_tick', 'gauge', "Current tick of the simulation.", snapshot['tick'])
+    metric('simulation_ticks_per_second', 'gauge', f"Ticks per second over the last {RATE_WINDOW} ticks.",
+           round(snapshot['ticks_per_second'], 3))
+    metric('simulation_auction_seconds_total', 'counter', "Time spent bidding and determining auction winners.",
+           snapshot['auction_seconds'])
+    metric('simulation_auction_last_seconds', 'gauge', "Time the auction of the last tick took.",
+           snapshot['auction_last_seconds'])
+    metric('simulation_bids_total', 'counter', "Bids generated by the agents.", snapshot['bids'])
+    metric('simulation_bid_combinations_total', 'counter', "Bid combinations evaluated by the broker.",
+           snapshot['bid_combinations'])
+    metric('simulation_pickup_backlog_items', 'gauge', "Items waiting at each pickup station.", None,
+           [(f'station="{index}"', backlog) for index, backlog in enumerate(snapshot['backlog'])])
+    metric('simulation_items_in_transit', 'gauge', "Items picked up and not delivered yet.", snapshot['in_transit'])
+    metric('simulation_items_delivered_total', 'counter', "Items delivered.", snapshot['delivered'])
+    lines.extend(_quantiles('simulation_delivery_time_ticks', "Ticks from the creation of an item to its delivery.",
+                            *snapshot['delivery_time']))
+    lines.extend(_quantiles('simulation_waiting_time_ticks', "Ticks from the creation of an item to its assignment.",
+                            *snapshot['waiting_time']))
+    return '\n'.join(lines) + '\n'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render(self.server.metrics_server.figures()).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are not worth a line on the console each
+        pass
+
+
+class MetricsServer(events.Sink):
+    """Serves the live metrics of a run of `environment` on http://`host`:`port`/metrics. Port 0 picks a free port,
+    which is then found in `port`"""
+
+    def __init__(self, environment: Environment, port: int = 9100, host: str = '127.0.0.1'):
+        super().__init__(events.INFO)
+        self.environment = environment
+        # Fed by the server, under the lock scrapes read it with
+        self.collector = MetricsCollector(None, environment, attach=False)
+        self._lock = threading.Lock()
+        self.profiler = None
+        if profiling.active is None:
+            self.profiler = profiling.enable(profiling.Profiler())
+
+        self.auction_seconds = 0.0
+        self.auction_last_seconds = 0.0
+        self.bids = 0
+        self.bid_combinations = 0
+        # The collector counts from now on, e.g. a run resumed from a checkpoint may already have items in transit
+        self._in_transit_before = sum(1 for agent in environment.state.agents for item in agent.items
+                                      if item.status == ItemStatus.IN_TRANSIT)
+        self._tick_times = deque(maxlen=RATE_WINDOW)
+        self._publish(environment.tick, 0)
+        events.bus.add_sink(self)
+
+        self.http = ThreadingHTTPServer((host, port), _Handler)
+        self.http.daemon_threads = True
+        self.http.metrics_server = self
+        self.host, self.port = self.http.server_address[:2]
+        self.thread = threading.Thread(target=self.http.serve_forever, name='metrics-server', daemon=True)
+        self.thread.start()
+
+    def handle(self, event: events.Event) -> None:
+        if snapshots.journaling():
+            return
+        with self._lock:
+            self.collector.handle(event)
+        if event.type is TICK_COMPLETED:
+            # The profiler folds the figures of a tick into its totals only after the tick completed
+            profiler = profiling.active
+            if profiler is not None:
+                phases, counters = profiler.tick_phases, profiler.tick_counters
+                self.auction_last_seconds = phases.get('bidding', 0) + phases.get('winner_determination', 0)
+                self.auction_seconds += self.auction_last_seconds
+                self.bids += counters.get('bids', 0)
+                self.bid_combinations += counters.get('bid_combinations', 0)
+            self._publish(event['tick'] + 1, 1)
+        elif event.type is TICKS_SKIPPED:
+            self._publish(event['to_tick'], event['to_tick'] - event['from_tick'])
+
+    def _publish(self, tick: int, ticks: int) -> None:
+        now = time.perf_counter()
+        if ticks:
+            self._tick_times.append((now, ticks))
+        elapsed = now - self._tick_times[0][0] if self._tick_times else 0
+        counted = sum(ticks for _, ticks in self._tick_times) - (self._tick_times[0][1] if self._tick_times else 0)
+
+        # Replaced as a whole, so the server thread never sees a half updated snapshot
+        self.snapshot = {
+            'tick': tick,
+            'ticks_per_second': counted / elapsed if elapsed > 0 else 0.0,
+            'auction_seconds': self.auction_seconds,
+            'auction_last_seconds': self.auction_last_seconds,
+            'bids': self.bids,
+            'bid_combinations': self.bid_combinations,
+        }
+
+    def figures(self) -> dict:
+        """The figures of the run for a scrape: the snapshot of the last tick and the current counts of the collector"""
+        collector = self.collector
+        with self._lock:
+            return {
+                **self.snapshot,
+                'backlog': list(collector.backlog),
+                'in_transit': self._in_transit_before + collector.totals['picked_up'] - collector.totals['delivered'],
+                'delivered': collector.totals['delivered'],
+                'delivery_time': (collector.delivery_time.counts.copy(), collector.delivery_time.total),
+                'waiting_time': (collector.waiting_time.counts.copy(), collector.waiting_time.total),
+            }
+
+    def close(self) -> None:
+        if self in events.bus.sinks:
+            events.bus.remove_sink(self)
+        self.collector.close()
+        if self.profiler is not None and profiling.active is self.profiler:
+            profiling.disable()
+        self.http.shutdown()
+        self.http.server_close()
+        self.thread.join()
@@ -0,0 +1,171 @@
+"""Compact formats for large obstacle layouts.
+
+Listing every obstacle in the configuration creates one Obstacle per blocked cell, which is slow and heavy for large
+warehouses. An obstacle map instead is read straight into a boolean layer of the grid's size, blocked cells True, which
+the grid takes as its walkability layer (see Grid.load_obstacle_map). The map is given in the configuration as
+
+    "obstacle_map": "warehouse.npy"         a boolean array of shape (width, height), memory-mapped
+    "obstacle_map": "warehouse.pbm"         a bitmap image, dark pixels are blocked (also .pgm and, through matplotlib,
+                                            .png and the other formats it reads)
+    "obstacle_map": {"rle": ["12.3#", ...]} run-length encoded rows, see decode_rle
+
+Images and RLE rows are read top to bottom, row y of the image being the cells (x, y) of the grid."""
+
+import os
+import re
+
+import numpy as np
+
+BLOCKED = '#'
+FREE = '.'
+NETPBM_EXTENSIONS = ('.pbm', '.pgm', '.pnm')
+
+_RUN = re.compile(r'(\d*)([.#])')
+_ROW = re.compile(r'(?:\d*[.#])*')
+_HEADER_TOKEN = re.compile(rb'(?:\s+|#[^\n]*\n)*([^\s#]+)')
+
+
+class MapError(Exception):
+    pass
+
+
+def encode_rle(layer: np.ndarray) -> list[str]:
+    """One string per row of the layer, each a sequence of runs like `12.` (12 free cells) or `3#` (3 blocked ones).
+    Runs of a single cell leave the count out, and the free cells ending a row are dropped"""
+    rows = []
+    for row in np.asarray(layer, dtype=bool).T:
+        changes = np.flatnonzero(np.diff(row.astype(np.int8))) + 1
+        starts = np.concatenate(([0], changes))
+        ends = np.concatenate((changes, [len(row)]))
+        runs = [(end - start, BLOCKED if row[start] else FREE) for start, end in zip(starts, ends)]
+        if runs and runs[-1][1] == FREE:
+            runs.pop()
+        rows.append(''.join(f"{length if length > 1 else ''}{symbol}" for length, symbol in runs))
+    return rows
+
+
+def decode_rle(rows: list[str], dimensions: tuple[int, int]) -> np.ndarray:
+    """The layer of the given (width, height) encoded by `rows`; rows shorter than the width end in free cells"""
+    width, height = dimensions
+    if len(rows) != height:
+        raise MapError(f"The map has {len(rows)} rows, the grid is {height} cells high")
+    layer = np.zeros((width, height), dtype=bool)
+    for y, row in enumerate(rows):
+        row = row.replace(' ', '')
+        if _ROW.fullmatch(row) is None:
+            raise MapError(f"Row {y} of the map is malformed: {row!r}")
+        x = 0
+        for match in _RUN.finditer(row):
+            length = int(match.group(1) or 1)
+            if match.group(2) == BLOCKED:
+                layer[x:x + length, y] = True
+            x += length
+        if x > width:
+            raise MapError(f"Row {y} of the map is {x} cells long, the grid is {width} cells wide")
+    return layer
+
+
+def _read_netpbm(path: str) -> np.ndarray:
+    """Blocked pixels of a PBM or PGM image, by (row, column)"""
+    with open(path, 'rb') as file:
+        data = file.read()
+
+    def header(count: int) -> tuple[list[bytes], int]:
+        tokens, position = [], 0
+        while len(tokens) < count:
+            match = _HEADER_TOKEN.match(data, position)
+            if match is None:
+                raise MapError(f"{path} is not a valid PBM or PGM image")
+            tokens.append(match.group(1))
+            position = match.end()
+        # A single whitespace separates the header from the pixels
+        return tokens, position + 1
+
+    magic = data[:2]
+    if magic in (b'P1', b'P4'):
+        (_, width, height), position = header(3)
+        width, height = int(width), int(height)
+        if magic == b'P4':
+            # Rows are padded to whole bytes, 1 bits are black
+            raster = np.frombuffer(data, np.uint8, height * -(-width // 8), position).reshape(height, -1)
+            return np.unpackbits(raster, axis=1)[:, :width].astype(bool)
+        digits = re.sub(rb'[^01]', b'', re.sub(rb'#[^\n]*', b'', data[position - 1:]))
+        return (np.frombuffer(digits, np.uint8, width * height) == ord('1')).reshape(height, width)
+    if magic in (b'P2', b'P5'):
+        (_, width, height, maximum), position = header(4)
+        width, height, maximum = int(width), int(height), int(maximum)
+        if magic == b'P5':
+            pixels = np.frombuffer(data, np.uint8 if maximum < 256 else '>u2', width * height, position)
+        else:
+            pixels = np.array(re.sub(rb'#[^\n]*', b'', data[position - 1:]).split()[:width * height], dtype=np.int64)
+        return (pixels < maximum / 2).reshape(height, width)
+    raise MapError(f"{path} is not a PBM or PGM image")
+
+
+def _read_image(path: str) -> np.ndarray:
+    """Blocked pixels of any image matplotlib reads, by (row, column)"""
+    # matplotlib is only needed for images other than PBM and PGM
+    import matplotlib.image
+
+    pixels = matplotlib.image.imread(path)
+    if pixels.ndim == 3:
+        pixels = pixels[..., :3].mean(axis=2)
+    if np.issubdtype(pixels.dtype, np.integer):
+        pixels = pixels / np.iinfo(pixels.dtype).max
+    return pixels < 0.5
+
+
+def read_obstacle_map(path: str) -> np.ndarray:
+    """The layer stored in a file. `.npy` files are memory-mapped rather than read"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.npy':
+        layer = np.load(path, mmap_mode='r')
+        return layer if layer.dtype == bool else layer != 0
+    if extension in NETPBM_EXTENSIONS:
+        return _read_netpbm(path).T
+    return _read_image(path).T
+
+
+def load_obstacle_map(spec, dimensions: tuple[int, int]) -> np.ndarray:
+    """The layer of the `obstacle_map` entry of a configuration, checked against the (width, height) of the grid"""
+    if isinstance(spec, dict) and 'rle' in spec:
+        return decode_rle(spec['rle'], dimensions)
+    if not isinstance(spec, str):
+        raise MapError(f"Unknown obstacle map {spec!r}, expected a file or {{'rle': [...]}}")
+    layer = read_obstacle_map(spec)
+    if layer.shape != tuple(dimensions):
+        width, height = layer.shape
+        raise MapError(f"The map {spec} is {width}x{height}, the grid is {dimensions[0]}x{dimensions[1]}")
+    return layer
+
+
+def save_obstacle_map(layer: np.ndarray, path: str) -> None:
+    """Write a layer as `.npy` or as a binary PBM image"""
+    layer = np.asarray(layer, dtype=bool)
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.npy':
+        np.save(path, layer)
+    elif extension == '.pbm':
+        width, height = layer.shape
+        with open(path, 'wb') as file:
+            file.write(f"P4\n{width} {height}\n".encode())
+            file.write(np.packbits(layer.T, axis=1).tobytes())
+    else:
+        raise MapError(f"Obstacle maps are saved as .npy or .pbm, not {extension or path}")
+
+
+def layer_from_positions(positions, dimensions: tuple[int, int]) -> np.ndarray:
+    layer = np.zeros(dimensions, dtype=bool)
+    if len(positions):
+        x, y = np.asarray(positions).T
+        layer[x, y] = True
+    return layer
+
+
+def pack_layer(layer: np.ndarray) -> bytes:
+    return np.packbits(layer, axis=None).tobytes()
+
+
+def unpack_layer(data: bytes, dimensions: tuple[int, int]) -> np.ndarray:
+    return np.unpackbits(np.frombuffer(data, np.uint8), count=dimensions[0] * dimensions[1]).astype(bool) \
+        .reshape(dimensions)
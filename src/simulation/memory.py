@@ -0,0 +1,160 @@
+"""Memory growth tracking of long runs.
+
+A MemoryTracker samples the heap every `interval` ticks: the memory traced by tracemalloc, the number of live objects of
+the kinds that pile up in a run (items, intentions, winning bids, items kept by the agents, log handlers), the live
+workload (items not delivered yet) and the allocation sites that grew the most since the previous sample. Every sample
+is appended as one JSON line. A leak is suspected when a count has grown and never gone down over the last `window`
+samples while the workload stayed flat, i.e. memory is retained by work that is already done.
+
+Tracing allocations slows a run down several times, so this is meant for dedicated runs."""
+
+import gc
+import json
+import logging
+import tracemalloc
+from collections import deque
+
+from src.simulation.base import snapshots
+from src.simulation.base.environment import Environment, TICK_COMPLETED, TICKS_SKIPPED
+from src.simulation.base.intentions import Intention
+from src.simulation.base.item import Item, ItemStatus
+from src.utils import events
+
+MEMORY_LEAK_SUSPECTED = events.EventType('memory_leak_suspected', 'EnvironmentLogger',
+                                         "Possible leak: {name} grew to {count} over the last {window} samples while "
+                                         "the live workload stayed at {workload} items", level=events.WARNING)
+
+LEAK_WINDOW = 5
+
+
+def count_objects(environment: Environment) -> dict:
+    """Live objects of the kinds that can pile up over a run"""
+    counts = {'items': 0, 'intentions': 0}
+    for obj in gc.get_objects():
+        if isinstance(obj, Item):
+            counts['items'] += 1
+        elif isinstance(obj, Intention):
+            counts['intentions'] += 1
+    agents = environment.state.agents
+    counts['winner_bids'] = sum(len(agent.winner_bids) for agent in agents)
+    counts['agent_items'] = sum(len(agent.items) for agent in agents)
+    loggers = [logging.getLogger()] + [logger for logger in logging.Logger.manager.loggerDict.values()
+                                       if isinstance(logger, logging.Logger)]
+    counts['log_handlers'] = sum(len(logger.handlers) for logger in loggers)
+    return counts
+
+
+def live_workload(environment: Environment) -> int:
+    """Items in the system that are not delivered yet"""
+    state = environment.state
+    return sum(len(station.items) for station in state.pickup_stations) + \
+        sum(1 for agent in state.agents for item in agent.items if item.status != ItemStatus.DELIVERED)
+
+
+def _flat(values: list[int], tolerance: float) -> bool:
+    """Whether the second half of the values is on average no higher than the first half, give or take"""
+    half = len(values) // 2
+    before, after = sum(values[:half]) / half, sum(values[-half:]) / half
+    return after <= before + max(1, tolerance * before)
+
+
+def suspected_leaks(samples, window: int = LEAK_WINDOW, tolerance: float = 0.1) -> list[str]:
+    """Counts that never went down and grew over the last `window` samples, while the workload stayed flat"""
+    recent = list(samples)[-window:]
+    if len(recent) < max(window, 2) or not _flat([sample['workload'] for sample in recent], tolerance):
+        return []
+    return [name for name in recent[0]['objects']
+            if recent[-1]['objects'][name] > recent[0]['objects'][name] and
+            all(later['objects'][name] >= earlier['objects'][name] for earlier, later in zip(recent, recent[1:]))]
+
+
+class MemoryTracker(events.Sink):
+    """Samples the memory of a run of `environment` every `interval` ticks and streams the samples to `path`. The
+    ticks of rollouts on snapshots are not sampled"""
+
+    def __init__(self, path: str, environment: Environment, interval: int = 100, top: int = 10,
+                 window: int = LEAK_WINDOW):
+        super().__init__(events.INFO)
+        self.environment = environment
+        self.interval = interval
+        self.top = top
+        self.window = window
+        self.file = open(path, 'w', buffering=1)
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+
+        # Only the samples the leak check looks at are kept, so that the tracker does not grow itself
+        self.samples = deque(maxlen=window)
+        self.leaks = set()
+        self._snapshot = None
+        self._last_tick = None
+        events.bus.add_sink(self)
+        self.sample(environment.tick)
+
+    def handle(self, event: events.Event) -> None:
+        if snapshots.journaling():
+            return
+        if event.type is TICK_COMPLETED:
+            self._after(event['tick'])
+        elif event.type is TICKS_SKIPPED:
+            self._after(event['to_tick'] - 1)
+
+    def _after(self, tick: int) -> None:
+        if tick // self.interval > self._last_tick // self.interval:
+            self.sample(tick)
+
+    def _snapshot_now(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+
+    def sample(self, tick: int) -> dict:
+        snapshot = self._snapshot_now()
+        growth = []
+        if self._snapshot is not None:
+            for stat in snapshot.compare_to(self._snapshot, 'lineno'):
+                if stat.size_diff > 0:
+                    growth.append({'site': str(stat.traceback[0]), 'size_diff': stat.size_diff,
+                                   'count_diff': stat.count_diff})
+            growth = sorted(growth, key=lambda entry: -entry['size_diff'])[:self.top]
+        self._snapshot = snapshot
+
+        current, peak = tracemalloc.get_traced_memory()
+        sample = {
+            'tick': tick,
+            'traced_bytes': current,
+            'peak_bytes': peak,
+            'workload': live_workload(self.environment),
+            'objects': count_objects(self.environment),
+            'growth': growth,
+        }
+        self.samples.append(sample)
+        self._last_tick = tick
+
+        sample['suspected_leaks'] = suspected_leaks(self.samples, self.window)
+        for name in sample['suspected_leaks']:
+            if name not in self.leaks:
+                self.leaks.add(name)
+                events.emit(MEMORY_LEAK_SUSPECTED, name=name, count=sample['objects'][name], window=self.window,
+                            workload=sample['workload'])
+        self.file.write(json.dumps(sample) + '\n')
+        return sample
+
+    def report(self) -> str:
+        last = self.samples[-1]
+        leaks = ', '.join(sorted(self.leaks)) or 'none'
+        return f"Memory at tick {last['tick']}: {last['traced_bytes'] / 2 ** 20:.1f} MiB traced " \
+               f"({last['peak_bytes'] / 2 ** 20:.1f} MiB peak), suspected leaks: {leaks}"
+
+    def close(self) -> None:
+        if self in events.bus.sinks:
+            events.bus.remove_sink(self)
+            # The end of the run is always sampled
+            if self._last_tick < self.environment.tick - 1:
+                self.sample(self.environment.tick - 1)
+        if self._started_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        if not self.file.closed:
+            self.file.close()
@@ -0,0 +1,215 @@
+"""Streaming metrics of a simulation run.
+
+A MetricsCollector listens on the event bus and keeps the metrics up to date as the run goes, instead of rescanning every
+agent's items at the end like the functions in main.py. After every tick it appends one JSON line with the throughput of
+the tick, the backlog of every pickup station, the utilization of the agents and the running percentiles of the item
+latencies, so that long runs can be watched while they run. Memory stays constant in the length of the run: the latencies
+go into fixed-size histograms, and only the items still in the system are tracked."""
+
+import json
+
+import numpy as np
+
+from src.simulation.base import snapshots
+from src.simulation.base.environment import Environment, TICK_COMPLETED, TICKS_SKIPPED
+from src.simulation.base.item import ItemStatus, ITEM_CREATED, ITEM_PICKED_UP, ITEM_DELIVERED
+from src.simulation.environments.broker import ITEM_ASSIGNED
+from src.utils import events
+
+EXACT = 16  # Values below are counted exactly, larger ones in 16 buckets per power of two (a relative error below 7%)
+BUCKETS = EXACT + 60 * EXACT
+
+PERCENTILES = (50, 95, 99)
+
+
+def _bucket(value: int) -> int:
+    if value < EXACT:
+        return max(value, 0)
+    exponent = value.bit_length() - 1
+    return EXACT + (exponent - 4) * EXACT + (value >> (exponent - 4)) - EXACT
+
+
+def _lower_bound(bucket: int) -> int:
+    if bucket < EXACT:
+        return bucket
+    exponent, sub_bucket = divmod(bucket - EXACT, EXACT)
+    return (EXACT + sub_bucket) << exponent
+
+
+class Histogram:
+    """Log-bucketed histogram of non-negative integers (durations in ticks). Histograms of different runs or workers
+    merge by adding up their buckets"""
+
+    def __init__(self, counts: np.ndarray = None, total: int = 0):
+        self.counts = counts if counts is not None else np.zeros(BUCKETS, dtype=np.int64)
+        self.total = total  # Exact sum of the recorded values
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum())
+
+    def record(self, value: int) -> None:
+        self.counts[_bucket(value)] += 1
+        self.total += value
+
+    def merge(self, other: 'Histogram') -> 'Histogram':
+        self.counts += other.counts
+        self.total += other.total
+        return self
+
+    def percentile(self, percentile: float) -> int | None:
+        """Lower bound of the bucket holding the given percentile (nearest rank), None while empty"""
+        count = self.count
+        if not count:
+            return None
+        rank = max(int(np.ceil(percentile / 100 * count)), 1)
+        return _lower_bound(int(np.searchsorted(np.cumsum(self.counts), rank)))
+
+    def percentiles(self) -> dict:
+        return {f'p{percentile}': self.percentile(percentile) for percentile in PERCENTILES}
+
+    def to_dict(self) -> dict:
+        buckets = np.flatnonzero(self.counts)
+        return {'buckets': buckets.tolist(), 'counts': self.counts[buckets].tolist(), 'total': self.total}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Histogram':
+        histogram = cls()
+        histogram.counts[data['buckets']] = data['counts']
+        histogram.total = data.get('total', 0)
+        return histogram
+
+
+class MetricsCollector(events.Sink):
+    """Collects the metrics of a run of `environment` and streams one JSON line per tick to `path`, if given. Events
+    of rollouts on snapshots are left out, as their ticks are undone. An unattached collector gets its events passed
+    on by its owner instead of the event bus"""
+
+    def __init__(self, path: str | None, environment: Environment, attach: bool = True):
+        super().__init__(events.INFO)
+        self.environment = environment
+        state = environment.state
+        # Line buffered, so every tick is on disk as soon as it is written
+        self.file = open(path, 'w', buffering=1) if path else None
+
+        self.waiting_time = Histogram()  # From the creation of an item until an agent is assigned to it
+        self.pickup_latency = Histogram()  # From the assignment until the agent picked it up
+        self.delivery_time = Histogram()  # From the creation until the delivery, end to end
+
+        self._station_indices = {station.id: index for index, station in enumerate(state.pickup_stations)}
+        self.backlog = [len(station.items) for station in state.pickup_stations]
+        self._agent_indices = state.get_agent_indices_by_id()
+        self.load = [sum(1 for item in agent.items if item.status != ItemStatus.DELIVERED) for agent in state.agents]
+        self.busy_agents = sum(1 for load in self.load if load)
+
+        # Items still in the system: id -> [created tick, assigned tick, pickup station index]
+        self.items = {}
+        for index, station in enumerate(state.pickup_stations):
+            for item in station.items:
+                self.items[item.id] = [item.created_tick, None, index]
+        for agent in state.agents:
+            for item in agent.items:
+                if item.status != ItemStatus.DELIVERED:
+                    self.items.setdefault(item.id, [item.created_tick, None, None])
+
+        self.totals = {'created': 0, 'assigned': 0, 'picked_up': 0, 'delivered': 0}
+        self._tick_counts = dict.fromkeys(self.totals, 0)
+        self._handlers = {
+            ITEM_CREATED: self._on_created,
+            ITEM_ASSIGNED: self._on_assigned,
+            ITEM_PICKED_UP: self._on_picked_up,
+            ITEM_DELIVERED: self._on_delivered,
+            TICK_COMPLETED: self._on_tick,
+            TICKS_SKIPPED: self._on_skip,
+        }
+        if attach:
+            events.bus.add_sink(self)
+
+    def handle(self, event: events.Event) -> None:
+        if snapshots.journaling():
+            return
+        handler = self._handlers.get(event.type)
+        if handler is not None:
+            handler(event.fields)
+
+    def _count(self, name: str) -> None:
+        self.totals[name] += 1
+        self._tick_counts[name] += 1
+
+    def _on_created(self, fields):
+        station = self._station_indices.get(getattr(fields['source'], 'id', None))
+        self.items[fields['item_id']] = [fields['created_tick'], None, station]
+        if station is not None:
+            self.backlog[station] += 1
+        self._count('created')
+
+    def _on_assigned(self, fields):
+        agent = self._agent_indices.get(fields['agent_id'])
+        if agent is not None:
+            self.load[agent] += 1
+            if self.load[agent] == 1:
+                self.busy_agents += 1
+        item = self.items.get(fields['item_id'])
+        if item is not None:
+            item[1] = self.environment.tick
+            self.waiting_time.record(self.environment.tick - item[0])
+        self._count('assigned')
+
+    def _on_picked_up(self, fields):
+        item = self.items.get(fields['item_id'])
+        if item is not None:
+            if item[1] is not None:
+                self.pickup_latency.record(fields['tick'] - item[1])
+            if item[2] is not None:
+                self.backlog[item[2]] -= 1
+        self._count('picked_up')
+
+    def _on_delivered(self, fields):
+        agent = self._agent_indices.get(fields['agent_id'])
+        if agent is not None:
+            self.load[agent] -= 1
+            if self.load[agent] == 0:
+                self.busy_agents -= 1
+        item = self.items.pop(fields['item_id'], None)
+        if item is not None:
+            self.delivery_time.record(fields['tick'] - item[0])
+        self._count('delivered')
+
+    def _write_row(self, tick: int, ticks: int) -> None:
+        if self.file is None:
+            self._tick_counts = dict.fromkeys(self.totals, 0)
+            return
+        row = {
+            'tick': tick,
+            'ticks': ticks,
+            **self._tick_counts,
+            'backlog': self.backlog,
+            'utilization': self.busy_agents / len(self.load) if self.load else 0,
+            'waiting_time': self.waiting_time.percentiles(),
+            'pickup_latency': self.pickup_latency.percentiles(),
+            'delivery_time': self.delivery_time.percentiles(),
+        }
+        self.file.write(json.dumps(row) + '\n')
+        self._tick_counts = dict.fromkeys(self.totals, 0)
+
+    def _on_tick(self, fields):
+        self._write_row(fields['tick'], 1)
+
+    def _on_skip(self, fields):
+        # A skipped stretch only moves agents, it is written as a single row covering all of its ticks
+        self._write_row(fields['to_tick'] - 1, fields['to_tick'] - fields['from_tick'])
+
+    def summary(self) -> dict:
+        return {
+            **self.totals,
+            'backlog': list(self.backlog),
+            'waiting_time': self.waiting_time.percentiles(),
+            'pickup_latency': self.pickup_latency.percentiles(),
+            'delivery_time': self.delivery_time.percentiles(),
+        }
+
+    def close(self) -> None:
+        if self in events.bus.sinks:
+            events.bus.remove_sink(self)
+        if self.file is not None and not self.file.closed:
+            self.file.close()
@@ -1,40 +1,48 @@
-from pathfinding.core.diagonal_movement import DiagonalMovement
-from pathfinding.core.grid import Grid
-from pathfinding.finder.a_star import AStarFinder
+from typing import TYPE_CHECKING
 
-from src.simulation.base.grid import PickupStation, DeliveryStation, Obstacle
+from src.utils import profiling
+
+if TYPE_CHECKING:
+    from pathfinding.core.grid import Grid
+
+# The pathfinding library is imported with the first search, so that importing the simulation stays cheap
+_finder = None
+
+
+def _astar():
+    global _finder
+    if _finder is None:
+        from pathfinding.core.diagonal_movement import DiagonalMovement
+        from pathfinding.finder.a_star import AStarFinder
+        _finder = AStarFinder(diagonal_movement=DiagonalMovement.never)
+    return _finder
 
 
 def find_shortest_path(state, agent_pos, station_pos):
-    rows, cols = state.grid_size
-
-    def get_matrix_element(x, y):
-        if any(isinstance(item, Obstacle) for item in state.board[x][y]):
-            return 1
-        else:
-            return 0
-
-    matrix = [[get_matrix_element(y, x) for y in range(cols)] for x in range(rows)]
-    grid = Grid(matrix=matrix, width=cols, height=rows, inverse=True)
-    finder = AStarFinder(diagonal_movement=DiagonalMovement.never)
-    path, _ = finder.find_path(grid.node(agent_pos[0], agent_pos[1]), grid.node(station_pos[0], station_pos[1]), grid)
+    path = tsp_path(state, agent_pos, station_pos)
     next_node = path[1]
 
     return next_node.x, next_node.y
 
 
-def tsp_path(state, agent_pos, station_pos):
-    rows, cols = state.grid_size
+def walkable_grid(obstacle_layer) -> 'Grid':
+    from pathfinding.core.grid import Grid
 
-    def get_matrix_element(x, y):
-        if any(isinstance(item, Obstacle) for item in state.board[x][y]):
-            return 1
-        else:
-            return 0
+    dim_x, dim_y = obstacle_layer.shape
+    # The library indexes the matrix as [y][x]; inverse=True marks the non-zero (obstacle) cells as blocked
+    return Grid(matrix=obstacle_layer.T.tolist(), width=dim_x, height=dim_y, inverse=True)
 
-    matrix = [[get_matrix_element(y, x) for y in range(cols)] for x in range(rows)]
-    grid = Grid(matrix=matrix, width=cols, height=rows, inverse=True)
-    finder = AStarFinder(diagonal_movement=DiagonalMovement.never)
-    path, _ = finder.find_path(grid.node(agent_pos[0], agent_pos[1]), grid.node(station_pos[0], station_pos[1]), grid)
+
+def path_on(grid: 'Grid', agent_pos, station_pos):
+    """A* over a walkable grid that is reused between searches, e.g. by a worker that keeps one for the whole run"""
+    grid.cleanup()
+    path, runs = _astar().find_path(grid.node(agent_pos[0], agent_pos[1]),
+                                    grid.node(station_pos[0], station_pos[1]), grid)
+    profiling.count('astar_calls')
+    profiling.count('nodes_expanded', runs)
 
     return path
+
+
+def tsp_path(state, agent_pos, station_pos):
+    return path_on(walkable_grid(state.obstacle_layer), agent_pos, station_pos)
@@ -0,0 +1,101 @@
+"""Parallel decision phase.
+
+Deciding on a move is the expensive part of an agent's intention, and a pure function of the map, the agent position and
+its target. The planners here take a frozen view of those for all busy agents at the start of the tick, compute the next
+steps concurrently in worker processes and gather them back in the order of the agents, so the intentions, and with them
+the whole run, are the same as when every agent decides on its own."""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+
+from src.simulation.base.grid import Grid, Agent
+from src.simulation.pathfinding import walkable_grid, path_on
+
+
+class PlanRequest(NamedTuple):
+    agent_index: int
+    position: tuple[int, int]
+    target: tuple[int, int]
+
+
+def freeze(agents: list[Agent], selfishness: bool) -> list[PlanRequest]:
+    """The per-tick view the planners work from: position and target of every agent that still has a way to go"""
+    view = []
+    for agent_index, agent in enumerate(agents):
+        target = agent.target_position(selfishness)
+        if target != agent.position:
+            view.append(PlanRequest(agent_index, tuple(agent.position), tuple(target)))
+    return view
+
+
+def plan_steps(grid, requests: list[PlanRequest]) -> list[tuple[int, tuple[int, int]]]:
+    plans = []
+    for agent_index, position, target in requests:
+        path = path_on(grid, position, target)
+        # Leave agents without a next step to the agent itself, which reports them as before
+        if len(path) > 1:
+            plans.append((agent_index, (path[1].x, path[1].y)))
+    return plans
+
+
+def gather(agents: list[Agent], replies) -> dict:
+    next_nodes = {}
+    for plans in replies:
+        for agent_index, next_node in plans:
+            next_nodes[agents[agent_index].id] = next_node
+    return next_nodes
+
+
+_worker_grid = None
+
+
+def _initialize_worker(obstacle_layer: np.ndarray) -> None:
+    global _worker_grid
+    _worker_grid = walkable_grid(obstacle_layer)
+
+
+def _plan_chunk(requests: list[PlanRequest]) -> list[tuple[int, tuple[int, int]]]:
+    return plan_steps(_worker_grid, requests)
+
+
+class PooledPlanner:
+    """Plans the moves of the busy agents in a pool of `workers` processes, splitting them into equal chunks"""
+
+    def __init__(self, state: Grid, workers: int):
+        self.state = state
+        self.workers = workers
+        self.map_version = None
+        self.executor = None
+
+    def _start(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown()
+        self.map_version = self.state.map_version
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_initialize_worker,
+                                            initargs=(self.state.obstacle_layer.copy(),))
+
+    def next_nodes(self, agents: list[Agent], selfishness: bool) -> dict:
+        """Next step of every agent that is not at its target yet, by agent id"""
+        # The workers keep the map from their start, so a changed map needs a fresh pool
+        if self.map_version != self.state.map_version:
+            self._start()
+
+        view = freeze(agents, selfishness)
+        if not view:
+            return {}
+        chunk_size = -(-len(view) // self.workers)
+        chunks = [view[start:start + chunk_size] for start in range(0, len(view), chunk_size)]
+        return gather(agents, self.executor.map(_plan_chunk, chunks))
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
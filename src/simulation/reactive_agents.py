@@ -1,14 +1,26 @@
 from typing import Any
 from itertools import combinations
 
+from src.simulation.base import snapshots
 from src.simulation.base.grid import Grid, Agent, PickupStation, DeliveryStation
 from src.simulation.base.intentions import Intention, Move, Pickup, Deliver
 from src.simulation.base.item import ItemStatus, Item
 from src.simulation.pathfinding import find_shortest_path, tsp_path
-from src.utils import logging_utils
+from src.simulation.routing import Stop
+from src.utils import events, logging_utils
 
-# setup logger
-logger = logging_utils.setup_logger('ReactiveAgentLogger', 'reactive_agent.log')
+# declare the logger, which is set up with its first record
+logging_utils.declare_logger('ReactiveAgentLogger', 'reactive_agent.log')
+
+AGENT_DELIVERING = events.EventType('agent_delivering', 'ReactiveAgentLogger', "Agent {agent_id} is delivering item "
+                                                                               "{item_id}")
+AGENT_MOVING_TO_DELIVERY = events.EventType('agent_moving_to_delivery', 'ReactiveAgentLogger',
+                                            "Agent {agent_id} is moving towards the DS position in {position}")
+AGENT_PICKING_UP = events.EventType('agent_picking_up', 'ReactiveAgentLogger',
+                                    "Agent {agent_id} is picking up an item at the pickup station position in "
+                                    "{position}")
+AGENT_MOVING_TO_PICKUP = events.EventType('agent_moving_to_pickup', 'ReactiveAgentLogger',
+                                          "Agent {agent_id} is moving towards the target station")
 
 
 class ItemPath:
@@ -79,8 +91,30 @@ class TopCongestionAgent(Agent):
 
         return visited_nodes, total_path_length
 
+    def _routed_bids(self, available_items: list[Item], state: Grid) -> list[dict]:
+        """Bids costing what each bundle adds to the agent's planned pickup and delivery route"""
+        carried = self.get_carried_items()
+        assigned = [item for item in self.items if item.status == ItemStatus.ASSIGNED_TO_AGENT]
+        _, committed_length = state.route_planner.plan(self.position, carried, assigned, self.capacity)
+        bids = []
+        for i in range(1, len(available_items) + 1):
+            for subset in combinations(available_items, i):
+                if self.current_capacity >= len(subset):
+                    route, route_length = state.route_planner.plan(self.position, carried, assigned + list(subset),
+                                                                   self.capacity)
+                    in_subset = {id(item) for item in subset}
+                    bids.append({
+                        "ordered_bundle": [stop.item for stop in route if stop.pickup and id(stop.item) in in_subset],
+                        "costs": round(max(route_length - committed_length, 0) / self.capacity),
+                        "agent": self,
+                        "route": route
+                    })
+        return bids
+
     # Get the list of items and returns the list of bundles
     def receive_auction_information(self, available_items: list[Item], state: Grid):
+        if state.route_planner is not None:
+            return self._routed_bids(available_items, state)
         bundle = []
         for i in range(1, len(available_items) + 1):
             for subset in combinations(available_items, i):
@@ -105,6 +139,7 @@ class TopCongestionAgent(Agent):
         return None
 
     def update_position(self, new_position: tuple[int, int]):
+        snapshots.touch(self)
         self.position = new_position
 
     def is_on_delivery_station(self, grid: Grid) -> DeliveryStation | None:
@@ -113,7 +148,26 @@ class TopCongestionAgent(Agent):
                 return delivery_station
         return None
 
-    def make_selfish_intention(self, grid: Grid) -> Intention:
+    def is_delivering(self, selfishness: bool) -> bool:
+        """Whether the next intention serves a carried item rather than one still to be picked up. Selfish agents
+        collect their whole bundle first, cooperative ones deliver as soon as they carry something"""
+        return self.no_more_items_to_pickup if selfishness else self.is_carrying_item
+
+    def next_stop(self) -> Stop | None:
+        """The first stop of the planned route still to be served, None without a route or once it is driven"""
+        return next((stop for stop in self.route if not stop.done), None)
+
+    def target_position(self, selfishness: bool):
+        """Position of the station the agent is heading to, the same one make_intention acts on"""
+        stop = self.next_stop()
+        if stop is not None:
+            return stop.position
+        if self.is_delivering(selfishness):
+            return min(self.get_carried_items(), key=lambda item: item.priority).destination.position
+        items_assigned = [item for item in self.items if item.status == ItemStatus.ASSIGNED_TO_AGENT]
+        return min(items_assigned, key=lambda item: item.priority).source.position
+
+    def make_selfish_intention(self, grid: Grid, next_node: tuple[int, int] = None) -> Intention:
         if self.no_more_items_to_pickup:
             items_in_transit = self.get_carried_items()
 
@@ -126,15 +180,14 @@ class TopCongestionAgent(Agent):
 
             # If the agent carrying on an item and is on a DeliveryStation, deliver the item
             if destination_station_position == self.position:
-                logger.info(f"Agent {self.id} is delivering item {highest_priority_item.id}")  # log info message
-                print(f"Agent {self.id} is delivering item {highest_priority_item.id}")
+                events.emit(AGENT_DELIVERING, agent_id=self.id, item_id=highest_priority_item.id)
                 return Deliver(self.id, highest_priority_item.id)
             # If the agent is carrying an item and is not on a DeliveryStation, move towards the destination
             else:
-                next_node = find_shortest_path(grid, self.position, destination_station_position)
+                if next_node is None:
+                    next_node = find_shortest_path(grid, self.position, destination_station_position)
                 # ... existing code to find the path to the target station ...
-                logger.info(f"Agent {self.id} is moving towards the DS position in {destination_station_position}")
-                print(f"Agent {self.id} is moving towards the DS position in {destination_station_position}")
+                events.emit(AGENT_MOVING_TO_DELIVERY, agent_id=self.id, position=destination_station_position)
                 return Move(self.id, (next_node[0] - self.position[0], next_node[1] - self.position[1]))
 
         # If there are still items to pick up
@@ -150,19 +203,16 @@ class TopCongestionAgent(Agent):
 
             # If agent on a PickupStation of an assigned item, pick up the item
             if target_station_position == self.position:
-                logger.info(f"Agent {self.id} is picking up an item at the pickup station position in "
-                            f"{target_station_position}")
-                print(f"Agent {self.id} is picking up an item at the pickup station "
-                      f"position in {target_station_position}")
+                events.emit(AGENT_PICKING_UP, agent_id=self.id, position=target_station_position)
                 return Pickup(self.id, highest_priority_item.id)
             # If the agent is not on a PickupStation of an assigned, move towards the target station
             else:
-                next_node = find_shortest_path(grid, self.position, target_station_position)
-                logger.info(f"Agent {self.id} is moving towards the target station")  # log info message
-                print(f"Agent {self.id} is moving towards the target station")
+                if next_node is None:
+                    next_node = find_shortest_path(grid, self.position, target_station_position)
+                events.emit(AGENT_MOVING_TO_PICKUP, agent_id=self.id, position=target_station_position)
                 return Move(self.id, (next_node[0] - self.position[0], next_node[1] - self.position[1]))
 
-    def make_cooperative_intention(self, grid: Grid) -> Intention:
+    def make_cooperative_intention(self, grid: Grid, next_node: tuple[int, int] = None) -> Intention:
         if self.is_carrying_item:
             items_in_transit = self.get_carried_items()
 
@@ -175,15 +225,14 @@ class TopCongestionAgent(Agent):
 
             # If the agent carrying on an item and is on a DeliveryStation, deliver the item
             if destination_station_position == self.position:
-                logger.info(f"Agent {self.id} is delivering item {highest_priority_item.id}")  # log info message
-                print(f"Agent {self.id} is delivering item {highest_priority_item.id}")
+                events.emit(AGENT_DELIVERING, agent_id=self.id, item_id=highest_priority_item.id)
                 return Deliver(self.id, highest_priority_item.id)
             # If the agent is carrying an item and is not on a DeliveryStation, move towards the destination
             else:
-                next_node = find_shortest_path(grid, self.position, destination_station_position)
+                if next_node is None:
+                    next_node = find_shortest_path(grid, self.position, destination_station_position)
                 # ... existing code to find the path to the target station ...
-                logger.info(f"Agent {self.id} is moving towards the DS position in {destination_station_position}")
-                print(f"Agent {self.id} is moving towards the DS position in {destination_station_position}")
+                events.emit(AGENT_MOVING_TO_DELIVERY, agent_id=self.id, position=destination_station_position)
                 return Move(self.id, (next_node[0] - self.position[0], next_node[1] - self.position[1]))
 
         # If there are still items to pick up
@@ -199,20 +248,37 @@ class TopCongestionAgent(Agent):
 
             # If agent on a PickupStation of an assigned item, pick up the item
             if target_station_position == self.position:
-                logger.info(f"Agent {self.id} is picking up an item at the pickup station position in "
-                            f"{target_station_position}")
-                print(f"Agent {self.id} is picking up an item at the pickup station "
-                      f"position in {target_station_position}")
+                events.emit(AGENT_PICKING_UP, agent_id=self.id, position=target_station_position)
                 return Pickup(self.id, highest_priority_item.id)
             # If the agent is not on a PickupStation of an assigned, move towards the target station
             else:
-                next_node = find_shortest_path(grid, self.position, target_station_position)
-                logger.info(f"Agent {self.id} is moving towards the target station")  # log info message
-                print(f"Agent {self.id} is moving towards the target station")
+                if next_node is None:
+                    next_node = find_shortest_path(grid, self.position, target_station_position)
+                events.emit(AGENT_MOVING_TO_PICKUP, agent_id=self.id, position=target_station_position)
                 return Move(self.id, (next_node[0] - self.position[0], next_node[1] - self.position[1]))
 
-    def make_intention(self, grid: Grid, selfishness: bool) -> Intention:
+    def make_route_intention(self, grid: Grid, stop: Stop, next_node: tuple[int, int] = None) -> Intention:
+        """Serve the next stop of the planned route, or move towards it"""
+        if tuple(self.position) == tuple(stop.position):
+            if stop.pickup:
+                events.emit(AGENT_PICKING_UP, agent_id=self.id, position=stop.position)
+                return Pickup(self.id, stop.item.id)
+            events.emit(AGENT_DELIVERING, agent_id=self.id, item_id=stop.item.id)
+            return Deliver(self.id, stop.item.id)
+        if next_node is None:
+            next_node = find_shortest_path(grid, self.position, stop.position)
+        if stop.pickup:
+            events.emit(AGENT_MOVING_TO_PICKUP, agent_id=self.id, position=stop.position)
+        else:
+            events.emit(AGENT_MOVING_TO_DELIVERY, agent_id=self.id, position=stop.position)
+        return Move(self.id, (next_node[0] - self.position[0], next_node[1] - self.position[1]))
+
+    def make_intention(self, grid: Grid, selfishness: bool, next_node: tuple[int, int] = None) -> Intention:
+        # Agents with a planned route drive it in its order, whether selfish or not
+        stop = self.next_stop()
+        if stop is not None:
+            return self.make_route_intention(grid, stop, next_node)
         if selfishness:
-            return self.make_selfish_intention(grid)
+            return self.make_selfish_intention(grid, next_node)
         else:
-            return self.make_cooperative_intention(grid)
+            return self.make_cooperative_intention(grid, next_node)
@@ -0,0 +1,257 @@
+"""Rendering of runs, kept out of the simulation process.
+
+The simulation only captures a compact Frame per tick (agent positions and loads, the backlog of every pickup station)
+and writes it into a FrameSlot, a single frame in shared memory guarded by a sequence counter. Writing never waits:
+a Renderer process reads the slot at its own frame rate, so the frames written in between are dropped, and draws the
+newest one with blitting, redrawing only the artists that change over the static map.
+
+Recorded runs are rendered offline: the ticks of a trace are split into chunks, every worker process replays its chunk
+and saves one PNG per frame, and ffmpeg encodes the frames into a video.
+
+matplotlib is only imported inside the renderer and the offline workers."""
+
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Process, shared_memory
+from typing import NamedTuple
+
+import numpy as np
+
+from src.simulation.base import snapshots
+from src.simulation.base.environment import TICK_COMPLETED, TICKS_SKIPPED
+from src.simulation.base.grid import Grid
+from src.simulation.trace import TraceReader
+from src.utils import events
+
+
+class RenderError(Exception):
+    pass
+
+
+class Layout(NamedTuple):
+    """The static part of the picture, sent to the renderer once"""
+    obstacles: np.ndarray  # Obstacle layer of the grid
+    pickup_stations: np.ndarray  # (stations, 2) positions
+    delivery_stations: np.ndarray
+    capacity: int  # Largest agent capacity, the top of the load color scale
+
+
+class Frame(NamedTuple):
+    tick: int
+    positions: np.ndarray  # (agents, 2) positions
+    loads: np.ndarray  # Items each agent is assigned or carries
+    backlog: np.ndarray  # Items waiting at each pickup station
+
+
+def capture_layout(state: Grid) -> Layout:
+    return Layout(state.obstacle_layer.copy(),
+                  np.array([station.position for station in state.pickup_stations], dtype=np.int32).reshape(-1, 2),
+                  np.array([station.position for station in state.delivery_stations], dtype=np.int32).reshape(-1, 2),
+                  max((agent.capacity for agent in state.agents), default=1))
+
+
+def capture_frame(state: Grid, tick: int) -> Frame:
+    if state.agent_store is not None:
+        positions = state.agent_store.positions.astype(np.int32)
+    else:
+        positions = np.array([agent.position for agent in state.agents], dtype=np.int32).reshape(-1, 2)
+    return Frame(tick, positions,
+                 np.array([agent.capacity - agent.current_capacity for agent in state.agents], dtype=np.int32),
+                 np.array([len(station.items) for station in state.pickup_stations], dtype=np.int32))
+
+
+class FrameSlot:
+    """The latest frame of a run in shared memory. The writer bumps the sequence number to odd before and to even after
+    writing, and readers retry while it is odd or changed under them, so neither side ever waits for the other"""
+
+    def __init__(self, agents: int, stations: int, name: str = None):
+        self.agents = agents
+        self.stations = stations
+        size = 8 * 2 + 4 * (agents * 3 + stations)
+        self.memory = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self.name = self.memory.name
+        self._owner = name is None
+        self.header = np.ndarray(2, dtype=np.int64, buffer=self.memory.buf)  # Sequence number, tick
+        body = np.ndarray(agents * 3 + stations, dtype=np.int32, buffer=self.memory.buf, offset=16)
+        self.positions = body[:agents * 2].reshape(agents, 2)
+        self.loads = body[agents * 2:agents * 3]
+        self.backlog = body[agents * 3:]
+        if self._owner:
+            self.header[:] = (0, -1)
+
+    def write(self, frame: Frame) -> None:
+        self.header[0] += 1
+        self.header[1] = frame.tick
+        self.positions[:] = frame.positions
+        self.loads[:] = frame.loads
+        self.backlog[:] = frame.backlog
+        self.header[0] += 1
+
+    def read(self) -> Frame | None:
+        """The latest frame, None before the first one was written"""
+        while True:
+            sequence = int(self.header[0])
+            if sequence % 2:
+                continue
+            frame = Frame(int(self.header[1]), self.positions.copy(), self.loads.copy(), self.backlog.copy())
+            if int(self.header[0]) == sequence:
+                return frame if frame.tick >= 0 else None
+
+    def close(self) -> None:
+        # The arrays are views into the shared memory, which can only be closed without them
+        del self.header, self.positions, self.loads, self.backlog
+        self.memory.close()
+        if self._owner:
+            self.memory.unlink()
+
+
+def _figure(layout: Layout, agents: int, animated: bool):
+    import matplotlib.pyplot as plt
+
+    figure, axes = plt.subplots(figsize=(8, 8))
+    width, height = layout.obstacles.shape
+    axes.imshow(layout.obstacles.T, cmap='Greys', origin='lower', extent=(-0.5, width - 0.5, -0.5, height - 0.5))
+    axes.scatter(layout.pickup_stations[:, 0], layout.pickup_stations[:, 1], marker='s', c='tab:blue',
+                 label='pickup')
+    axes.scatter(layout.delivery_stations[:, 0], layout.delivery_stations[:, 1], marker='s', c='tab:green',
+                 label='delivery')
+    axes.set(xlim=(-0.5, width - 0.5), ylim=(-0.5, height - 0.5), aspect='equal')
+    axes.legend(loc='upper right')
+
+    artists = {
+        'agents': axes.scatter(np.zeros(agents), np.zeros(agents), c=np.zeros(agents), cmap='autumn_r', vmin=0,
+                               vmax=layout.capacity, edgecolors='black', zorder=3, animated=animated),
+        'backlog': [axes.text(x, y + 0.6, '', ha='center', fontsize=8, animated=animated)
+                    for x, y in layout.pickup_stations],
+        'tick': axes.set_title('', animated=animated),
+    }
+    return figure, axes, artists
+
+
+def _update(artists: dict, frame: Frame) -> list:
+    artists['agents'].set_offsets(frame.positions)
+    artists['agents'].set_array(frame.loads)
+    for text, backlog in zip(artists['backlog'], frame.backlog):
+        text.set_text(str(backlog))
+    artists['tick'].set_text(f"Tick {frame.tick}")
+    return [artists['agents'], *artists['backlog'], artists['tick']]
+
+
+def _display(layout: Layout, slot_name: str, agents: int, stations: int, fps: float) -> None:
+    import matplotlib.pyplot as plt
+
+    slot = FrameSlot(agents, stations, slot_name)
+    figure, axes, artists = _figure(layout, agents, animated=True)
+    canvas = figure.canvas
+    background = None
+
+    def on_draw(_):
+        # Full redraws (the first one, resizing) invalidate the saved background
+        nonlocal background
+        background = canvas.copy_from_bbox(figure.bbox)
+
+    canvas.mpl_connect('draw_event', on_draw)
+    plt.show(block=False)
+    plt.pause(0.1)
+
+    last_tick = None
+    period = 1 / fps
+    while plt.fignum_exists(figure.number):
+        started = time.perf_counter()
+        frame = slot.read()
+        if frame is not None and frame.tick != last_tick and background is not None:
+            canvas.restore_region(background)
+            for artist in _update(artists, frame):
+                axes.draw_artist(artist)
+            canvas.blit(figure.bbox)
+            last_tick = frame.tick
+        canvas.flush_events()
+        time.sleep(max(period - (time.perf_counter() - started), 0))
+    slot.close()
+
+
+class Renderer(events.Sink):
+    """Shows a run of the given grid in a window drawn by a separate process at `fps` frames per second. Ticks of
+    rollouts on snapshots are not shown, as they are undone"""
+
+    def __init__(self, state: Grid, fps: float = 20):
+        super().__init__(events.INFO)
+        self.state = state
+        self.slot = FrameSlot(len(state.agents), len(state.pickup_stations))
+        self.slot.write(capture_frame(state, 0))
+        self.process = Process(target=_display, args=(capture_layout(state), self.slot.name, self.slot.agents,
+                                                      self.slot.stations, fps), daemon=True)
+        self.process.start()
+        events.bus.add_sink(self)
+
+    def handle(self, event: events.Event) -> None:
+        if snapshots.journaling():
+            return
+        if event.type is TICK_COMPLETED:
+            self.slot.write(capture_frame(self.state, event['tick'] + 1))
+        elif event.type is TICKS_SKIPPED:
+            self.slot.write(capture_frame(self.state, event['to_tick']))
+
+    def close(self, linger: float = 0) -> None:
+        """Stop publishing frames and close the window once it was closed or `linger` seconds have passed"""
+        if self in events.bus.sinks:
+            events.bus.remove_sink(self)
+        self.process.join(linger)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.slot.close()
+
+
+def chunks(start: int, end: int, step: int, workers: int) -> list[list[int]]:
+    """The ticks to render, split into contiguous chunks of about the same size"""
+    ticks = list(range(start, end, step))
+    size = -(-len(ticks) // workers) if ticks else 1
+    return [ticks[index:index + size] for index in range(0, len(ticks), size)]
+
+
+def frame_path(directory: str, tick: int) -> str:
+    return os.path.join(directory, f"frame_{tick:08d}.png")
+
+
+def _render_chunk(trace_file: str, directory: str, ticks: list[int]) -> int:
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    reader = TraceReader(trace_file)
+    wanted = set(ticks)
+    figure = artists = None
+    rendered = 0
+    for tick, state in reader.states(ticks[0], ticks[-1] + 1):
+        if tick not in wanted:
+            continue
+        if figure is None:
+            figure, _, artists = _figure(capture_layout(state.grid), len(state.grid.agents), animated=False)
+        _update(artists, capture_frame(state.grid, state.tick))
+        figure.savefig(frame_path(directory, tick))
+        rendered += 1
+    if figure is not None:
+        plt.close(figure)
+    return rendered
+
+
+def render_frames(trace_file: str, directory: str, start: int = 0, end: int = None, step: int = 1,
+                  workers: int = None) -> int:
+    """Render the states of a recorded run from `start` up to `end` (the end of the trace by default) into PNG files,
+    in parallel. Returns the number of frames"""
+    end = TraceReader(trace_file).last_tick + 1 if end is None else end
+    os.makedirs(directory, exist_ok=True)
+    work = chunks(start, end, step, workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(_render_chunk, [trace_file] * len(work), [directory] * len(work), work))
+
+
+def encode_video(directory: str, output: str, fps: float = 20) -> None:
+    if shutil.which('ffmpeg') is None:
+        raise RenderError("ffmpeg is needed to encode videos, the frames are in " + directory)
+    subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-framerate', str(fps), '-pattern_type', 'glob', '-i',
+                    os.path.join(directory, 'frame_*.png'), '-pix_fmt', 'yuv420p', output], check=True)
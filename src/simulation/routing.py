@@ -0,0 +1,149 @@
+"""Pickup and delivery routing of bundles.
+
+By default an agent costs a bundle by visiting its pickup stations nearest first, which leaves out the way to the
+delivery stations. A RoutePlanner set as the grid's `route_planner` plans the whole route instead: every pickup and
+delivery stop of the items the agent carries, has been assigned and bids for, each item picked up before it is
+delivered and never more items on board than the agent's capacity. Bids cost what a bundle adds to the agent's route,
+and the agent drives the route of the bundles it wins, stop by stop.
+
+Distances come from a table of breadth-first distance fields, one per station, computed on first use. A field holds the
+length of the shortest path from every cell to its station, so every distance between stations, and from an agent to a
+station, is a single lookup. Bundles of up to EXACT_ITEMS items are routed exactly, larger ones by always driving to the
+nearest stop that can be served next."""
+
+from typing import NamedTuple
+
+import numpy as np
+
+from src.simulation.base.grid import Grid
+from src.simulation.base.item import Item, ItemStatus
+
+EXACT_ITEMS = 6
+# Distance to cells that cannot reach a station, large enough that routes avoid them and small enough to add up
+UNREACHABLE = np.iinfo(np.int32).max // 64
+STEPS = np.array([[1, 0], [-1, 0], [0, 1], [0, -1]])
+
+
+class Stop(NamedTuple):
+    item: Item
+    pickup: bool  # Picking the item up at its source, otherwise delivering it at its destination
+
+    @property
+    def position(self):
+        return (self.item.source if self.pickup else self.item.destination).position
+
+    @property
+    def done(self) -> bool:
+        if self.pickup:
+            return self.item.status in (ItemStatus.IN_TRANSIT, ItemStatus.DELIVERED)
+        return self.item.status == ItemStatus.DELIVERED
+
+
+def distance_field(obstacle_layer: np.ndarray, target: tuple[int, int]) -> np.ndarray:
+    """Length of the shortest path from every cell to `target` without diagonal moves, UNREACHABLE where there is none"""
+    dim_x, dim_y = obstacle_layer.shape
+    field = np.full((dim_x, dim_y), UNREACHABLE, dtype=np.int32)
+    field[target] = 0
+    frontier = np.array([target], dtype=np.int64)
+    distance = 0
+    while len(frontier):
+        distance += 1
+        neighbours = (frontier[:, None, :] + STEPS[None, :, :]).reshape(-1, 2)
+        x, y = neighbours[:, 0], neighbours[:, 1]
+        inside = (x >= 0) & (x < dim_x) & (y >= 0) & (y < dim_y)
+        x, y = x[inside], y[inside]
+        new = ~obstacle_layer[x, y] & (field[x, y] == UNREACHABLE)
+        cells = np.unique(x[new] * dim_y + y[new])
+        field.flat[cells] = distance
+        frontier = np.stack(np.divmod(cells, dim_y), axis=1)
+    return field
+
+
+class DistanceTable:
+    """Shortest path lengths to stations over a fixed map, one distance field per station"""
+
+    def __init__(self, obstacle_layer: np.ndarray, map_version: int = None):
+        self.obstacle_layer = obstacle_layer.copy()
+        self.map_version = map_version
+        self.fields = {}
+
+    def distance(self, position, target: tuple[int, int]) -> int:
+        field = self.fields.get(target)
+        if field is None:
+            field = self.fields[target] = distance_field(self.obstacle_layer, target)
+        return int(field[position[0], position[1]])
+
+
+class RoutePlanner:
+    def __init__(self, state: Grid):
+        self.state = state
+        self.table = None
+
+    def distances(self) -> DistanceTable:
+        # The table keeps the map it was built on, so a changed map needs a fresh one
+        if self.table is None or self.table.map_version != self.state.map_version:
+            self.table = DistanceTable(self.state.obstacle_layer, self.state.map_version)
+        return self.table
+
+    def plan(self, start, carried: list[Item], assigned: list[Item], capacity: int) -> tuple[list[Stop], int]:
+        """The shortest route from `start` that delivers the `carried` items and picks up and delivers the `assigned`
+        ones, with its length"""
+        items = list(carried) + list(assigned)
+        stops = [(Stop(item, True), Stop(item, False)) for item in items]
+        positions = [(tuple(pickup.position), tuple(delivery.position)) for pickup, delivery in stops]
+        table = self.distances()
+        everything = (1 << len(items)) - 1
+        picked_up = (1 << len(carried)) - 1
+
+        def options(picked: int, delivered: int):
+            """The stops that can be served next, as (item index, pickup)"""
+            on_board = bin(picked & ~delivered).count('1')
+            for index in range(len(items)):
+                bit = 1 << index
+                if not picked & bit:
+                    if on_board < capacity:
+                        yield index, True
+                elif not delivered & bit:
+                    yield index, False
+
+        def after(index: int, pickup: bool, picked: int, delivered: int) -> tuple[int, int]:
+            bit = 1 << index
+            return (picked | bit, delivered) if pickup else (picked, delivered | bit)
+
+        route = []
+        at, picked, delivered = tuple(start), picked_up, 0
+        if len(items) > EXACT_ITEMS:
+            length = 0
+            while delivered != everything:
+                index, pickup = min(options(picked, delivered), key=lambda option: table.distance(
+                    at, positions[option[0]][0 if option[1] else 1]))
+                target = positions[index][0 if pickup else 1]
+                length += table.distance(at, target)
+                route.append(stops[index][0 if pickup else 1])
+                at, (picked, delivered) = target, after(index, pickup, picked, delivered)
+            return route, length
+
+        memo = {}
+
+        def remaining(at, picked: int, delivered: int) -> tuple[int, tuple | None]:
+            """Length of the best route on from `at` and the stop it starts with"""
+            if delivered == everything:
+                return 0, None
+            key = (at, picked, delivered)
+            if key not in memo:
+                best = (None, None)
+                for index, pickup in options(picked, delivered):
+                    target = positions[index][0 if pickup else 1]
+                    length = table.distance(at, target) + remaining(target, *after(index, pickup, picked,
+                                                                                   delivered))[0]
+                    if best[0] is None or length < best[0]:
+                        best = (length, (index, pickup))
+                memo[key] = best
+            return memo[key]
+
+        length = remaining(at, picked, delivered)[0]
+        while delivered != everything:
+            index, pickup = remaining(at, picked, delivered)[1]
+            route.append(stops[index][0 if pickup else 1])
+            at, (picked, delivered) = positions[index][0 if pickup else 1], after(index, pickup, picked, delivered)
+        return route, length
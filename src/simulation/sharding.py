@@ -0,0 +1,314 @@
+"""Spatially sharded simulation.
+
+The grid is partitioned into vertical strips of columns, the regions, each owned by a worker process. A worker keeps a
+replica of the map and the stations, and owns the agents standing in its region and the items waiting at its pickup
+stations. Every tick it generates the intentions of its busy agents, validates them, resolves their conflicts and enacts
+them on its replica, concurrently with the other regions. Agents that left the region are handed off at the tick
+barrier, together with the items they carry or have been assigned, and the environment process passes them on to their
+new owner with the next tick.
+
+The environment process keeps the whole warehouse for the arrivals and the auction, which see every station and agent.
+At the barrier it merges what the regions enacted into it, in the order of the agents, which also emits the events the
+sinks listen to. In turn it sends every region the items that arrived at its stations and the agents whose bundles the
+auction or the archive changed. When the state changed in other ways, e.g. by skipping ticks or restoring a snapshot,
+the regions are filled anew from the state.
+
+A region resolves conflicting pickups with a random generator seeded from the tick and the region, so a run is
+deterministic for a given seed and number of shards. The agents decide in the workers, so their decision events are not
+emitted."""
+
+import bisect
+import multiprocessing
+import random
+import uuid
+from typing import NamedTuple
+
+import numpy as np
+
+from src.simulation.base.grid import Grid, Agent, PickupStation, DeliveryStation, create_empty_board
+from src.simulation.base.intentions import Intention
+from src.simulation.base.item import Item, ItemStatus
+from src.simulation.routing import Stop
+from src.utils import events, profiling
+
+AGENT_HANDED_OFF = events.EventType('agent_handed_off', 'EnvironmentLogger',
+                                    "Agent {agent_id} moved from region {from_region} to region {to_region} with "
+                                    "{items} items", level=events.DEBUG)
+
+
+class ItemRecord(NamedTuple):
+    id: bytes
+    created_tick: int
+    pickup_tick: int | None
+    delivered_tick: int | None
+    agent_id: bytes | None
+    source: int  # Index of the pickup station, -1 for none
+    destination: int  # Index of the delivery station, -1 for none
+    status: int
+    priority: int
+
+
+class AgentRecord(NamedTuple):
+    id: bytes
+    cls: type
+    position: tuple[int, int] | list[int]
+    capacity: int
+    total_cost: int
+    items: list[ItemRecord]
+    bids: list[tuple[int, list[bytes]]]  # Costs and item ids of every winner bid
+    route: list[tuple[bytes, bool]]  # Item id and whether it is a pickup, for the stops still to be served
+
+
+class RegionStep(NamedTuple):
+    tick: int
+    selfishness: bool
+    seed: int
+    reset: bool  # Drop all agents and items, the ones sent along are all there are
+    obstacle_layer: np.ndarray | None  # The new map, if it changed
+    arrivals: list[ItemRecord]
+    agents: list[AgentRecord]
+
+
+def partition(dim_x: int, regions: int) -> list[int]:
+    """First column of every region after the first, splitting the columns as evenly as possible"""
+    return [round(dim_x * region / regions) for region in range(1, regions)]
+
+
+def _station_indices(stations) -> dict:
+    return {id(station): index for index, station in enumerate(stations)}
+
+
+def item_record(item: Item, pickup_indices: dict, delivery_indices: dict) -> ItemRecord:
+    return ItemRecord(item.id.bytes, item.created_tick, item.pickup_tick, item.delivered_tick,
+                      item.agent_id.bytes if item.agent_id is not None else None,
+                      pickup_indices.get(id(item.source), -1), delivery_indices.get(id(item.destination), -1),
+                      item.status.value, item.priority)
+
+
+def agent_record(agent: Agent, pickup_indices: dict, delivery_indices: dict) -> AgentRecord:
+    return AgentRecord(agent.id.bytes, type(agent), agent.position, agent.capacity, agent.total_cost,
+                       [item_record(item, pickup_indices, delivery_indices) for item in agent.items],
+                       [(bid['costs'], [item.id.bytes for item in bid['ordered_bundle']]) for bid in agent.winner_bids],
+                       [(stop.item.id.bytes, stop.pickup) for stop in agent.route if not stop.done])
+
+
+class Region:
+    """The replica a worker keeps of its region: the map and all stations, with the agents in its columns and the
+    items at its pickup stations"""
+
+    def __init__(self, environment_class: type, obstacle_layer: np.ndarray, grid_size, pickup_stations: list,
+                 delivery_stations: list, columns: range):
+        dim_x, dim_y = obstacle_layer.shape
+        self.grid = Grid(create_empty_board(dim_x, dim_y), grid_size)
+        self.grid.load_obstacle_map(obstacle_layer)
+        for cls, stations in ((PickupStation, pickup_stations), (DeliveryStation, delivery_stations)):
+            for station_id, position in stations:
+                station = cls(position)
+                station.id = uuid.UUID(bytes=station_id)
+                self.grid.add_board_object(station)
+        self.pickup_indices = _station_indices(self.grid.pickup_stations)
+        self.delivery_indices = _station_indices(self.grid.delivery_stations)
+        self.environment = environment_class(self.grid)
+        self.columns = columns
+        self.agents = {}
+
+    def _load_map(self, obstacle_layer: np.ndarray) -> None:
+        self.grid.map_layer = None
+        self.grid.obstacle_layer[:] = False
+        self.grid.load_obstacle_map(obstacle_layer)
+
+    def _clear(self) -> None:
+        for agent in self.grid.agents:
+            self.grid.remove_board_object(agent, agent.position)
+        self.grid.agents.clear()
+        self.agents.clear()
+        for station in self.grid.pickup_stations:
+            station.items.clear()
+
+    def _known_items(self) -> dict:
+        known = {item.id: item for station in self.grid.pickup_stations for item in station.items}
+        known.update((item.id, item) for agent in self.grid.agents for item in agent.items)
+        return known
+
+    def _item(self, record: ItemRecord, known: dict) -> Item:
+        """The item of the record, the one the region already has if any, with the fields of the record"""
+        item_id = uuid.UUID(bytes=record.id)
+        item = known.get(item_id)
+        if item is None:
+            item = Item(record.created_tick,
+                        self.grid.pickup_stations[record.source] if record.source >= 0 else None,
+                        self.grid.delivery_stations[record.destination] if record.destination >= 0 else None)
+            item.id = item_id
+            known[item_id] = item
+        item.pickup_tick = record.pickup_tick
+        item.delivered_tick = record.delivered_tick
+        item.agent_id = uuid.UUID(bytes=record.agent_id) if record.agent_id is not None else None
+        item.status = ItemStatus(record.status)
+        item.priority = record.priority
+        return item
+
+    def _receive(self, record: AgentRecord, known: dict) -> None:
+        agent_id = uuid.UUID(bytes=record.id)
+        agent = self.agents.get(agent_id)
+        if agent is None:
+            agent = record.cls(record.position)
+            agent.id = agent_id
+            self.grid.add_board_object(agent)
+            self.agents[agent_id] = agent
+        agent.capacity = record.capacity
+        agent.total_cost = record.total_cost
+        agent.items = [self._item(item, known) for item in record.items]
+        items = {item.id.bytes: item for item in agent.items}
+        agent.winner_bids = [{'ordered_bundle': [items[item_id] for item_id in item_ids], 'costs': costs,
+                              'agent': agent} for costs, item_ids in record.bids]
+        agent.route = [Stop(items[item_id], pickup) for item_id, pickup in record.route]
+
+    def _hand_off(self, agent: Agent) -> AgentRecord:
+        record = agent_record(agent, self.pickup_indices, self.delivery_indices)
+        self.grid.remove_board_object(agent, agent.position)
+        self.grid.agents.remove(agent)
+        del self.agents[agent.id]
+        return record
+
+    def step(self, message: RegionStep) -> tuple[list[Intention], list[AgentRecord]]:
+        """Enact a tick of the agents in the region, and return their intentions and the agents that left it"""
+        if message.obstacle_layer is not None:
+            self._load_map(message.obstacle_layer)
+        if message.reset:
+            self._clear()
+        known = self._known_items()
+        for record in message.arrivals:
+            self.grid.pickup_stations[record.source].items.append(self._item(record, known))
+        for record in message.agents:
+            self._receive(record, known)
+
+        random.seed(message.seed)
+        intentions = self.environment._consistent_intentions(self.grid, message.selfishness)
+        self.grid = self.environment._enact_valid_intentions(intentions, self.grid, message.tick)
+
+        departed = [self._hand_off(agent) for agent in list(self.grid.agents) if agent.position[0] not in self.columns]
+        return intentions, departed
+
+
+def _region_worker(connection, *region) -> None:
+    # A forked worker inherits the sinks and the profiler of the environment process, its work is reported by that one
+    events.headless()
+    profiling.disable()
+    region = Region(*region)
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        try:
+            connection.send(region.step(message))
+        except Exception as e:
+            connection.send(e)
+
+
+class RegionWorkers:
+    """Runs the agents of an environment in `regions` worker processes that own a strip of columns each, see the
+    module documentation"""
+
+    def __init__(self, environment, regions: int):
+        state = environment.state
+        dim_x = state.board_dimensions()[0]
+        self.boundaries = partition(dim_x, regions)
+        self.pickup_indices = _station_indices(state.pickup_stations)
+        self.delivery_indices = _station_indices(state.delivery_stations)
+        self.station_regions = [self.region_of(station.position) for station in state.pickup_stations]
+        self.next_tick = None
+        self.map_version = state.map_version
+        # Items at the stations and items of every agent as the regions last got them
+        self.posted = set()
+        self.signatures = {}
+        self.departed = []
+
+        stations = [[(station.id.bytes, station.position) for station in stations]
+                    for stations in (state.pickup_stations, state.delivery_stations)]
+        self.connections = []
+        self.workers = []
+        for start, stop in zip([0] + self.boundaries, self.boundaries + [dim_x]):
+            connection, worker_connection = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=_region_worker, args=(
+                worker_connection, type(environment), state.obstacle_layer.copy(), list(state.grid_size), *stations,
+                range(start, stop)), daemon=True)
+            worker.start()
+            worker_connection.close()
+            self.connections.append(connection)
+            self.workers.append(worker)
+
+    def region_of(self, position) -> int:
+        return bisect.bisect_right(self.boundaries, position[0])
+
+    def _messages(self, state: Grid, tick: int, selfishness: bool) -> list[RegionStep]:
+        reset = tick != self.next_tick
+        obstacle_layer = None
+        if reset or self.map_version != state.map_version:
+            self.map_version = state.map_version
+            obstacle_layer = state.obstacle_layer.copy()
+        if reset:
+            self.posted, self.signatures, self.departed = set(), {}, []
+
+        arrivals = [[] for _ in self.workers]
+        at_stations = set()
+        for index, station in enumerate(state.pickup_stations):
+            for item in station.items:
+                at_stations.add(item.id)
+                if item.id not in self.posted:
+                    arrivals[self.station_regions[index]].append(
+                        item_record(item, self.pickup_indices, self.delivery_indices))
+        self.posted = at_stations
+
+        # Agents handed off at the last barrier first, then the ones whose bundles changed since, which may be the same
+        agents = [[] for _ in self.workers]
+        for record in self.departed:
+            agents[self.region_of(record.position)].append(record)
+        self.departed = []
+        for agent in state.agents:
+            signature = tuple(item.id for item in agent.items)
+            if self.signatures.get(agent.id) != signature:
+                self.signatures[agent.id] = signature
+                agents[self.region_of(agent.position)].append(
+                    agent_record(agent, self.pickup_indices, self.delivery_indices))
+
+        return [RegionStep(tick, selfishness, tick * len(self.workers) + region, reset, obstacle_layer,
+                           arrivals[region], agents[region]) for region in range(len(self.workers))]
+
+    def step(self, state: Grid, tick: int, selfishness: bool) -> list[Intention]:
+        """Let every region enact the tick of its agents, and return the intentions they enacted in the order of the
+        agents in the state"""
+        # Send every region its message before waiting on any of them, so the regions work concurrently
+        for connection, message in zip(self.connections, self._messages(state, tick, selfishness)):
+            connection.send(message)
+        replies = [connection.recv() for connection in self.connections]
+        for reply in replies:
+            if isinstance(reply, Exception):
+                # The regions no longer match the state
+                self.next_tick = None
+                raise reply
+
+        intentions = []
+        for region, (region_intentions, departed) in enumerate(replies):
+            intentions.extend(region_intentions)
+            for record in departed:
+                events.emit(AGENT_HANDED_OFF, agent_id=uuid.UUID(bytes=record.id), from_region=region,
+                            to_region=self.region_of(record.position), items=len(record.items))
+            self.departed.extend(departed)
+        self.next_tick = tick + 1
+
+        agent_indices = state.get_agent_indices_by_id()
+        return sorted(intentions, key=lambda intention: agent_indices[intention.agent_id])
+
+    def close(self) -> None:
+        for connection, worker in zip(self.connections, self.workers):
+            connection.send(None)
+            worker.join()
+            connection.close()
+        self.connections = []
+        self.workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
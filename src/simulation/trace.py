@@ -0,0 +1,388 @@
+"""Compact binary traces of simulation runs.
+
+A TraceRecorder listens on the event bus and appends one fixed-width record per enacted intention, item transition and
+auction result. Every `keyframe_interval` ticks it also stores a full keyframe of the state in a sidecar file, so that a
+TraceReader can rebuild the Grid at any tick from the nearest preceding keyframe, without re-running agent decisions or
+auctions. Ticks an event driven run skips are recorded like stepped ones, with the cells the agents walked through."""
+
+import os
+import pickle
+import struct
+import uuid
+
+from src.simulation.base import snapshots
+from src.simulation.base.environment import Environment, TICK_COMPLETED, TICKS_SKIPPED, ITEMS_GENERATED
+from src.simulation.base.grid import Grid, Obstacle, PickupStation, DeliveryStation, create_empty_board
+from src.simulation.base.item import Item, ItemStatus, ITEM_CREATED, ITEM_PICKED_UP, ITEM_DELIVERED
+from src.simulation.environments.broker import AUCTION_WON, ITEM_ASSIGNED
+from src.simulation.environments.common import AGENT_MOVED
+from src.simulation.environments.top_congestion_environment import ITEM_PICKED_UP_BY_AGENT, \
+    ITEM_DELIVERED_BY_AGENT, AGENT_PAID
+from src.simulation.maps import pack_layer, unpack_layer
+from src.simulation.reactive_agents import TopCongestionAgent
+from src.utils import events
+
+MAGIC = b'MATTRACE'
+VERSION = 1
+HEADER = struct.Struct('<8sI')
+# kind, tick, subject id, object id, two integer arguments
+RECORD = struct.Struct('<B3xQ16s16sii')
+KEYFRAME = struct.Struct('<QQI')  # tick, index of the first record after the keyframe, payload length
+
+TICK = 0
+MOVE = 1
+PICKUP = 2
+DELIVER = 3
+ITEM_CREATE = 4
+ITEM_STATUS = 5
+AUCTION = 6
+PAYMENT = 7
+ARRIVAL = 8
+
+NO_ID = bytes(16)
+
+
+class TraceError(Exception):
+    pass
+
+
+def _id_bytes(identifier) -> bytes:
+    return identifier.bytes if isinstance(identifier, uuid.UUID) else NO_ID
+
+
+def keyframe_path(path: str) -> str:
+    return path + '.keyframes'
+
+
+def capture_keyframe(environment: Environment, tick: int, positions: dict = None) -> dict:
+    """The state of the environment as a keyframe at `tick`, with agents at the given `positions` by agent id instead
+    of their own"""
+    state = environment.state
+    positions = positions or {}
+    items = {}
+    for station in state.pickup_stations:
+        for item in station.items:
+            items[item.id] = item
+    for agent in state.agents:
+        for item in agent.items:
+            items[item.id] = item
+
+    pickup_indices = {station.id: index for index, station in enumerate(state.pickup_stations)}
+    delivery_indices = {station.id: index for index, station in enumerate(state.delivery_stations)}
+
+    return {
+        'tick': tick,
+        'items_added': environment.items_added,
+        'grid_size': list(state.grid_size),
+        'dimensions': state.board_dimensions(),
+        'obstacles': [(obstacle.id.bytes, obstacle.position) for obstacle in state.obstacles],
+        'obstacle_map': pack_layer(state.map_layer) if state.map_layer is not None else None,
+        'pickup_stations': [(station.id.bytes, station.position, [item.id.bytes for item in station.items])
+                            for station in state.pickup_stations],
+        'delivery_stations': [(station.id.bytes, station.position) for station in state.delivery_stations],
+        'agents': [(agent.id.bytes, list(positions.get(agent.id, agent.position)), agent.capacity, agent.total_cost,
+                    [item.id.bytes for item in agent.items],
+                    [(bid['costs'], [item.id.bytes for item in bid['ordered_bundle']]) for bid in agent.winner_bids])
+                   for agent in state.agents],
+        'items': [(item.id.bytes, item.created_tick, item.pickup_tick, item.delivered_tick, _id_bytes(item.agent_id),
+                   pickup_indices.get(getattr(item.source, 'id', None), -1),
+                   delivery_indices.get(getattr(item.destination, 'id', None), -1),
+                   item.status.value, item.priority)
+                  for item in items.values()],
+    }
+
+
+class TraceRecorder(events.Sink):
+    """Records a run of an Environment into `path`. Events of rollouts on snapshots are left out, as their ticks are
+    undone"""
+
+    def __init__(self, path: str, environment: Environment, keyframe_interval: int = 1000,
+                 buffer_size: int = 1 << 20):
+        super().__init__(events.DEBUG)
+        self.environment = environment
+        self.keyframe_interval = keyframe_interval
+        self.records_written = 0
+        # Moves of the current tick, written with its tick record as a skip replaces them by the walked paths
+        self._moves = []
+        self.file = open(path, 'wb', buffering=buffer_size)
+        self.file.write(HEADER.pack(MAGIC, VERSION))
+        self.keyframes = open(keyframe_path(path), 'wb', buffering=buffer_size)
+
+        state = environment.state
+        self._pickup_indices = {station.id: index for index, station in enumerate(state.pickup_stations)}
+        self._delivery_indices = {station.id: index for index, station in enumerate(state.delivery_stations)}
+        self._handlers = {
+            AGENT_MOVED: self._on_move,
+            ITEM_PICKED_UP_BY_AGENT: self._on_pickup,
+            ITEM_DELIVERED_BY_AGENT: self._on_deliver,
+            ITEM_CREATED: self._on_item_created,
+            ITEMS_GENERATED: self._on_arrival,
+            ITEM_ASSIGNED: self._on_assigned,
+            ITEM_PICKED_UP: self._on_picked_up,
+            ITEM_DELIVERED: self._on_delivered,
+            AUCTION_WON: self._on_auction,
+            AGENT_PAID: self._on_payment,
+            TICK_COMPLETED: self._on_tick,
+            TICKS_SKIPPED: self._on_skip,
+        }
+
+        self.write_keyframe(environment.tick)
+        events.bus.add_sink(self)
+
+    def _write(self, kind: int, subject: bytes = NO_ID, obj: bytes = NO_ID, a: int = 0, b: int = 0,
+               tick: int = None):
+        self.file.write(RECORD.pack(kind, self.environment.tick if tick is None else tick, subject, obj, a, b))
+        self.records_written += 1
+
+    def _write_moves(self):
+        for subject, x, y in self._moves:
+            self._write(MOVE, subject, a=x, b=y)
+        self._moves.clear()
+
+    def write_keyframe(self, tick: int, positions: dict = None):
+        payload = pickle.dumps(capture_keyframe(self.environment, tick, positions), protocol=pickle.HIGHEST_PROTOCOL)
+        self.keyframes.write(KEYFRAME.pack(tick, self.records_written, len(payload)))
+        self.keyframes.write(payload)
+
+    def handle(self, event: events.Event) -> None:
+        if snapshots.journaling():
+            return
+        handler = self._handlers.get(event.type)
+        if handler is not None:
+            handler(event.fields)
+
+    def _on_move(self, fields):
+        x, y = fields['position']
+        self._moves.append((fields['agent_id'].bytes, x, y))
+
+    def _on_pickup(self, fields):
+        self._write(PICKUP, fields['agent_id'].bytes, fields['item'].id.bytes)
+
+    def _on_deliver(self, fields):
+        self._write(DELIVER, fields['agent_id'].bytes, fields['item_id'].bytes)
+
+    def _on_item_created(self, fields):
+        source = self._pickup_indices.get(getattr(fields['source'], 'id', None), -1)
+        destination = self._delivery_indices.get(getattr(fields['destination'], 'id', None), -1)
+        self._write(ITEM_CREATE, fields['item_id'].bytes, a=source, b=destination)
+
+    def _on_arrival(self, fields):
+        self._write(ARRIVAL, fields['pickup_station_id'].bytes, a=fields['count'])
+
+    def _on_assigned(self, fields):
+        self._write(ITEM_STATUS, fields['item_id'].bytes, fields['agent_id'].bytes,
+                    ItemStatus.ASSIGNED_TO_AGENT.value, fields['priority'])
+
+    def _on_picked_up(self, fields):
+        self._write(ITEM_STATUS, fields['item_id'].bytes, _id_bytes(fields['agent_id']), ItemStatus.IN_TRANSIT.value)
+
+    def _on_delivered(self, fields):
+        self._write(ITEM_STATUS, fields['item_id'].bytes, _id_bytes(fields['agent_id']), ItemStatus.DELIVERED.value)
+
+    def _on_auction(self, fields):
+        self._write(AUCTION, fields['agent_id'].bytes, a=fields['costs'], b=fields['size'])
+
+    def _on_payment(self, fields):
+        self._write(PAYMENT, fields['agent_id'].bytes, a=fields['costs'])
+
+    def _on_tick(self, fields):
+        self._write_moves()
+        self._write(TICK, a=fields['tick'])
+        # The environment increments its tick after this event, the keyframe describes the start of the next tick
+        if (fields['tick'] + 1) % self.keyframe_interval == 0:
+            self.write_keyframe(fields['tick'] + 1)
+
+    def _on_skip(self, fields):
+        # The pending moves are to the end of the skip, every skipped tick gets the cells walked in it instead
+        self._moves.clear()
+        paths = fields['paths']
+        for tick in range(fields['from_tick'], fields['to_tick']):
+            step = tick - fields['from_tick']
+            for agent_id, path in paths.items():
+                self._write(MOVE, agent_id.bytes, a=path[step].x, b=path[step].y, tick=tick)
+            self._write(TICK, a=tick, tick=tick)
+            if (tick + 1) % self.keyframe_interval == 0:
+                self.write_keyframe(tick + 1, {agent_id: (path[step].x, path[step].y)
+                                               for agent_id, path in paths.items()})
+
+    def close(self) -> None:
+        self._write_moves()
+        if self in events.bus.sinks:
+            events.bus.remove_sink(self)
+        self.file.close()
+        self.keyframes.close()
+
+
+class ReplayState:
+    """A Grid rebuilt from a keyframe, which trace records are then applied to"""
+
+    def __init__(self, keyframe: dict):
+        self.tick = keyframe['tick']
+        self.items_added = keyframe['items_added']
+        dim_x, dim_y = keyframe['dimensions']
+        self.grid = Grid(create_empty_board(dim_x, dim_y), keyframe['grid_size'])
+        self.items = {}
+        self.agents = {}
+
+        if keyframe.get('obstacle_map') is not None:
+            self.grid.load_obstacle_map(unpack_layer(keyframe['obstacle_map'], (dim_x, dim_y)))
+        for obstacle_id, position in keyframe['obstacles']:
+            self._add(Obstacle(position), obstacle_id)
+        for station_id, position, _ in keyframe['pickup_stations']:
+            self._add(PickupStation(position), station_id)
+        for station_id, position in keyframe['delivery_stations']:
+            self._add(DeliveryStation(position), station_id)
+
+        for item_id, created, pickup, delivered, agent_id, source, destination, status, priority in keyframe['items']:
+            item = self._create_item(item_id, created, source, destination)
+            item.pickup_tick = pickup
+            item.delivered_tick = delivered
+            item.agent_id = uuid.UUID(bytes=agent_id) if agent_id != NO_ID else None
+            item.status = ItemStatus(status)
+            item.priority = priority
+
+        for station, (_, _, item_ids) in zip(self.grid.pickup_stations, keyframe['pickup_stations']):
+            station.items = [self.items[item_id] for item_id in item_ids]
+
+        for agent_id, position, capacity, total_cost, item_ids, winner_bids in keyframe['agents']:
+            agent = self._add(TopCongestionAgent(position, capacity), agent_id)
+            agent.total_cost = total_cost
+            agent.items = [self.items[item_id] for item_id in item_ids]
+            agent.winner_bids = [{'ordered_bundle': [self.items[item_id] for item_id in bundle], 'costs': costs,
+                                  'agent': agent} for costs, bundle in winner_bids]
+            self.agents[agent_id] = agent
+
+    def _add(self, obj, identifier: bytes):
+        obj.id = uuid.UUID(bytes=identifier)
+        self.grid.add_board_object(obj)
+        return obj
+
+    def _create_item(self, item_id: bytes, created_tick: int, source: int, destination: int) -> Item:
+        item = Item(created_tick, self.grid.pickup_stations[source] if source >= 0 else None,
+                    self.grid.delivery_stations[destination] if destination >= 0 else None)
+        item.id = uuid.UUID(bytes=item_id)
+        self.items[item_id] = item
+        return item
+
+    def apply(self, kind: int, tick: int, subject: bytes, obj: bytes, a: int, b: int) -> None:
+        if kind == TICK:
+            self.tick = a + 1
+        elif kind == MOVE:
+            agent = self.agents[subject]
+            self.grid.remove_board_object(agent, agent.position)
+            self.grid.board[a][b].append(agent)
+            agent.update_position([a, b])
+        elif kind == ITEM_CREATE:
+            item = self._create_item(subject, tick, a, b)
+            if item.source is not None:
+                item.source.items.append(item)
+        elif kind == ARRIVAL:
+            self.items_added += a
+        elif kind == AUCTION:
+            self.agents[subject].winner_bids.append({'ordered_bundle': [], 'costs': a, 'agent': self.agents[subject]})
+        elif kind == ITEM_STATUS:
+            item = self.items[subject]
+            status = ItemStatus(a)
+            if status == ItemStatus.ASSIGNED_TO_AGENT:
+                agent = self.agents[obj]
+                agent.items.append(item)
+                agent.winner_bids[-1]['ordered_bundle'].append(item)
+                item.agent_id = agent.id
+                item.priority = b
+                item.status = status
+            elif status == ItemStatus.IN_TRANSIT:
+                item.source.items.remove(item)
+                item.status = status
+                item.pickup_tick = tick
+            elif status == ItemStatus.DELIVERED:
+                item.status = status
+                item.delivered_tick = tick
+        elif kind == PAYMENT:
+            self.agents[subject].total_cost += a
+
+
+def _check_tick(state: ReplayState, tick: int) -> None:
+    # Traces written before skipped ticks were recorded one by one jump over them
+    if state.tick != tick:
+        raise TraceError(f"The trace holds no state at tick {tick}, it goes on at tick {state.tick}")
+
+
+class TraceReader:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as file:
+            magic, version = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise TraceError(f"{path} is not a version {VERSION} simulation trace")
+
+        # Index of the keyframes: (tick, first record after the keyframe, payload offset, payload length)
+        self.keyframes = []
+        with open(keyframe_path(path), 'rb') as file:
+            while header := file.read(KEYFRAME.size):
+                tick, record_index, length = KEYFRAME.unpack(header)
+                self.keyframes.append((tick, record_index, file.tell(), length))
+                file.seek(length, os.SEEK_CUR)
+        if not self.keyframes:
+            raise TraceError(f"{path} has no keyframes")
+
+    @property
+    def number_of_records(self) -> int:
+        return (os.path.getsize(self.path) - HEADER.size) // RECORD.size
+
+    def records(self, start: int = 0, chunk_size: int = 4096):
+        """Iterate (kind, tick, subject, object, a, b) records from the given record index on"""
+        with open(self.path, 'rb') as file:
+            file.seek(HEADER.size + start * RECORD.size)
+            while chunk := file.read(chunk_size * RECORD.size):
+                yield from RECORD.iter_unpack(chunk[:len(chunk) - len(chunk) % RECORD.size])
+
+    def _load_keyframe(self, offset: int, length: int) -> dict:
+        with open(keyframe_path(self.path), 'rb') as file:
+            file.seek(offset)
+            return pickle.loads(file.read(length))
+
+    @property
+    def last_tick(self) -> int:
+        """The tick of the last record, the last tick the trace has a state at the start of"""
+        records = self.number_of_records
+        if not records:
+            return self.keyframes[-1][0]
+        kind, tick, _, _, a, _ = next(self.records(records - 1))
+        return a + 1 if kind == TICK else tick
+
+    def _replay_from(self, tick: int) -> tuple[ReplayState, int]:
+        candidates = [keyframe for keyframe in self.keyframes if keyframe[0] <= tick]
+        if not candidates:
+            raise TraceError(f"Tick {tick} is before the start of the trace")
+        _, record_index, offset, length = candidates[-1]
+        return ReplayState(self._load_keyframe(offset, length)), record_index
+
+    def state_at(self, tick: int) -> ReplayState:
+        """Rebuild the state at the start of the given tick"""
+        state, record_index = self._replay_from(tick)
+        for record in self.records(record_index):
+            if state.tick >= tick:
+                break
+            state.apply(*record)
+        if state.tick < tick:
+            raise TraceError(f"Trace ends at tick {state.tick}, before tick {tick}")
+        _check_tick(state, tick)
+        return state
+
+    def states(self, start: int, end: int):
+        """Iterate (tick, state) at the start of every tick from `start` up to `end`, or the end of the trace. The state
+        is rebuilt once and then stepped forward, so the same object is yielded every time, changed in between"""
+        state, record_index = self._replay_from(start)
+        tick = start
+        for record in self.records(record_index):
+            while tick < end and state.tick >= tick:
+                _check_tick(state, tick)
+                yield tick, state
+                tick += 1
+            if tick >= end:
+                return
+            state.apply(*record)
+        while tick < end and state.tick >= tick:
+            _check_tick(state, tick)
+            yield tick, state
+            tick += 1
@@ -0,0 +1,125 @@
+"""Startup cost of the simulation: how long a fresh interpreter takes to import a module, which imports dominate, what
+importing leaves behind (files in the working directory, running threads) and how long a pool of worker processes
+takes until every worker has imported its module and answered.
+
+Importing is meant to be free of side effects: loggers are only declared at import time and set up with their first
+record, and optional subsystems (tracing, rendering, the metrics endpoint, worker pools) are imported when used.
+
+    python -m src.startup src.main src.batch --repeats 5 --workers 4
+"""
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_MODULES = ('src.main', 'src.batch')
+
+# Run in a fresh interpreter inside an empty directory: imports the module and reports what it cost and left behind
+_PROBE = """
+import json, os, threading, time
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+print(json.dumps({{'seconds': seconds, 'files': sorted(os.listdir('.')), 'threads': threading.active_count() - 1}}))
+"""
+
+
+def _root() -> str:
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run(arguments: list[str], directory: str) -> subprocess.CompletedProcess:
+    environment = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [_root(), os.environ.get('PYTHONPATH')]))}
+    return subprocess.run([sys.executable, *arguments], cwd=directory, env=environment, capture_output=True,
+                          text=True, check=True)
+
+
+def measure_import(module: str, repeats: int = 5) -> dict:
+    """Best import and whole process time of `module` over `repeats` fresh interpreters, with the files it created
+    in the working directory and the threads it left running"""
+    best = None
+    for _ in range(repeats):
+        with tempfile.TemporaryDirectory() as directory:
+            started = time.perf_counter()
+            probe = json.loads(_run(['-c', _PROBE.format(module=module)], directory).stdout)
+            probe['process_seconds'] = time.perf_counter() - started
+        if best is None or probe['process_seconds'] < best['process_seconds']:
+            best = probe
+    return {'module': module, **best}
+
+
+def import_breakdown(module: str) -> dict[str, float]:
+    """Seconds every module imported along with `module` took, including its own imports"""
+    with tempfile.TemporaryDirectory() as directory:
+        lines = _run(['-X', 'importtime', '-c', f'import {module}'], directory).stderr.splitlines()
+    cumulative = {}
+    for line in lines:
+        if line.startswith('import time:') and '|' in line:
+            _, total, name = line.split('|')
+            if total.strip().isdigit():
+                cumulative[name.strip()] = int(total) / 1e6
+    return cumulative
+
+
+def _import(module: str) -> int:
+    importlib.import_module(module)
+    return os.getpid()
+
+
+def measure_spinup(module: str, workers: int = 2, start_method: str = None) -> float:
+    """Seconds from creating a pool of `workers` processes until each of them imported `module` and answered"""
+    context = multiprocessing.get_context(start_method)
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        # One task per worker is not guaranteed to reach every worker, a few more rounds make it likely
+        pids = set()
+        while len(pids) < workers and time.perf_counter() - started < 60:
+            pids.update(executor.map(_import, [module] * workers))
+        return time.perf_counter() - started
+
+
+def main(args) -> list[dict]:
+    results = []
+    for module in args.modules:
+        result = measure_import(module, args.repeats)
+        breakdown = import_breakdown(module)
+        result['slowest_imports'] = sorted(((name, seconds) for name, seconds in breakdown.items()
+                                            if name != module and ('.' not in name or name.startswith('src.'))),
+                                           key=lambda entry: -entry[1])[:args.top]
+        result['spinup_seconds'] = {method: measure_spinup(module, args.workers, method)
+                                    for method in args.start_methods}
+        results.append(result)
+
+        print(f"{module}: import {result['seconds'] * 1000:.1f} ms, process {result['process_seconds'] * 1000:.1f} ms")
+        for method, seconds in result['spinup_seconds'].items():
+            print(f"  {args.workers} {method} workers ready in {seconds * 1000:.1f} ms")
+        for name, seconds in result['slowest_imports']:
+            print(f"  {name:<60}{seconds * 1000:>10.1f} ms")
+        if result['files'] or result['threads']:
+            print(f"  side effects: files {result['files']}, {result['threads']} threads")
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=1)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure the import time and worker spin-up of the simulation.")
+    parser.add_argument('modules', nargs='*', default=list(DEFAULT_MODULES), help="Modules to import.")
+    parser.add_argument('--repeats', type=int, default=5, help="Fresh interpreters per module, the fastest counts.")
+    parser.add_argument('--workers', type=int, default=2, help="Processes in the worker pool.")
+    parser.add_argument('--start-methods', nargs='+', choices=multiprocessing.get_all_start_methods(),
+                        default=['fork', 'spawn'] if 'fork' in multiprocessing.get_all_start_methods() else ['spawn'],
+                        help="Start methods the worker spin-up is measured with.")
+    parser.add_argument('--top', type=int, default=10, help="Number of slowest imports to list.")
+    parser.add_argument('--output', help="Write the measurements as JSON to this file.")
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,12 @@
+import pytest
+
+from src.utils import events
+
+
+@pytest.fixture(autouse=True)
+def headless_events():
+    """Run every test without console output and log files, tests that check them install their own sinks"""
+    sinks = list(events.bus.sinks)
+    events.headless()
+    yield
+    events.bus.set_sinks(sinks)
@@ -0,0 +1,112 @@
+import random
+import unittest
+
+import numpy as np
+
+from src.main import setup_simulation, run_simulation
+from src.simulation.base.grid import Grid, create_empty_board
+from src.simulation.base.intentions import Move
+from src.simulation.environments.common import enact_move_intentions
+from src.simulation.environments.top_congestion_environment import TopCongestionEnvironment
+from src.simulation.reactive_agents import TopCongestionAgent
+
+CONFIG = {
+    'grid_size': [12, 12],
+    'obstacles': [[4, 4], [5, 4], [6, 4]],
+    'pickup_stations': [[0, 1], [1, 1]],
+    'delivery_stations': [[11, 11], [10, 3]],
+    'agents': [[2, 8], [9, 2], [6, 6]],
+}
+
+
+def run_summary(environment) -> dict:
+    state = environment.state
+    return {
+        'agents': [(agent.position, agent.total_cost, len(agent.winner_bids)) for agent in state.agents],
+        'items': [[(item.created_tick, item.pickup_tick, item.delivered_tick, item.status, item.priority)
+                   for item in agent.items] for agent in state.agents],
+        'random': random.random(),
+    }
+
+
+class TestAgentStore(unittest.TestCase):
+    def test_run_with_store_matches_run_without(self):
+        for selfishness in (True, False):
+            random.seed(8)
+            expected = run_summary(run_simulation(setup_simulation(CONFIG), 80, selfishness))
+
+            random.seed(8)
+            environment = setup_simulation(CONFIG)
+            environment.state.use_agent_store()
+            self.assertEqual(run_summary(run_simulation(environment, 80, selfishness)), expected)
+
+    def test_agents_are_views_into_the_store(self):
+        grid = Grid(create_empty_board(5, 5), [5, 5])
+        agent = TopCongestionAgent((1, 1))
+        grid.add_board_object(agent)
+        store = grid.use_agent_store()
+        later_agent = TopCongestionAgent([3, 3])
+        grid.add_board_object(later_agent)
+
+        self.assertEqual(agent.position, (1, 1))
+        self.assertEqual(later_agent.position, [3, 3])
+        self.assertEqual(grid.board[1][1], [])
+        self.assertEqual(store.occupancy.sum(), 2)
+
+        agent.update_position([1, 2])
+        self.assertEqual(store.positions[0].tolist(), [1, 2])
+        self.assertEqual(store.occupancy[1, 2], 1)
+        self.assertEqual(store.occupancy[1, 1], 0)
+
+    def test_moves_of_a_tick_are_applied_at_once(self):
+        grid = Grid(create_empty_board(50, 50), [50, 50])
+        agents = [TopCongestionAgent([x, y]) for x in range(0, 50, 2) for y in range(0, 50, 2)]
+        for agent in agents:
+            grid.add_board_object(agent)
+        store = grid.use_agent_store()
+        before = store.positions.copy()
+
+        enact_move_intentions([Move(agent.id, (1, 0) if index % 2 else (0, 1)) for index, agent in enumerate(agents)],
+                              grid)
+
+        directions = np.array([(1, 0) if index % 2 else (0, 1) for index in range(len(agents))])
+        np.testing.assert_array_equal(store.positions, before + directions)
+        self.assertEqual(store.occupancy.sum(), len(agents))
+        self.assertEqual(agents[1].position, [before[1][0] + 1, before[1][1]])
+
+    def test_snapshot_restores_the_store(self):
+        random.seed(8)
+        environment = setup_simulation(CONFIG)
+        environment.state.use_agent_store()
+        run_simulation(environment, 5, True)
+        positions = [agent.position for agent in environment.state.agents]
+        occupancy = environment.state.agent_store.occupancy.copy()
+
+        with environment.rollout(10, True):
+            pass
+
+        self.assertEqual([agent.position for agent in environment.state.agents], positions)
+        np.testing.assert_array_equal(environment.state.agent_store.occupancy, occupancy)
+
+    def test_snapshots_journal_the_cells_the_store_writes(self):
+        grid = Grid(create_empty_board(400, 300), [400, 300])
+        agents = [TopCongestionAgent([x, 7]) for x in range(20)]
+        for agent in agents:
+            grid.add_board_object(agent)
+        store = grid.use_agent_store()
+        occupancy = store.occupancy.copy()
+
+        snapshot = TopCongestionEnvironment(grid).snapshot()
+        enact_move_intentions([Move(agent.id, (0, 1)) for agent in agents], grid)
+        agents[0].update_position([3, 3])
+        # Outgrows the arrays of the store
+        for x in range(40):
+            grid.add_board_object(TopCongestionAgent([x, 9]))
+        journal = snapshot._journal
+        copied = [copy for _, _, copies in journal.saved_objects.values() for copy in copies.values()]
+        self.assertFalse(any(getattr(copy, 'size', 0) >= 400 * 300 for copy in copied))
+
+        snapshot.restore()
+        self.assertEqual(len(store), 20)
+        self.assertEqual([agent.position for agent in agents], [[x, 7] for x in range(20)])
+        np.testing.assert_array_equal(store.occupancy, occupancy)
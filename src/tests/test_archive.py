@@ -0,0 +1,101 @@
+import os
+import random
+import tempfile
+import unittest
+
+from src.main import setup_simulation, run_simulation, analyze_results, average_delivery_time_per_step
+from src.simulation.archive import Archive, ArchiveError, read_archive
+from src.simulation.base.item import ItemStatus
+from src.simulation.checkpoint import save_checkpoint, load_checkpoint
+from src.tests.test_checkpoint import CONFIG
+from src.utils import events
+
+LONG_CONFIG = {**CONFIG, 'arrivals': {'interval': 2, 'batch': 1, 'max_items': 10 ** 6}}
+
+
+def archived_run(path: str, ticks: int, batch_size: int = 1024, seed: int = 7):
+    random.seed(seed)
+    environment = setup_simulation(LONG_CONFIG)
+    if path is not None:
+        environment.archive = Archive(path, batch_size)
+    return run_simulation(environment, ticks, False)
+
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'archive')
+        self.sinks = list(events.bus.sinks)
+        events.headless()
+
+    def tearDown(self):
+        events.bus.set_sinks(self.sinks)
+        self.directory.cleanup()
+
+    def test_archived_runs_report_the_same_results(self):
+        plain = archived_run(None, 200)
+        archived = archived_run(self.path, 200, batch_size=8)
+        self.assertEqual(analyze_results(archived, False), analyze_results(plain, False))
+        self.assertEqual(average_delivery_time_per_step(archived, False),
+                         average_delivery_time_per_step(plain, False))
+        self.assertEqual([agent.position for agent in archived.state.agents],
+                         [agent.position for agent in plain.state.agents])
+
+        # Only open bundles are live, everything else is on disk once the archive is closed
+        for agent in archived.state.agents:
+            for bid in agent.winner_bids:
+                self.assertFalse(all(item.status == ItemStatus.DELIVERED for item in bid['ordered_bundle']))
+        archived.archive.close()
+        tables = read_archive(self.path)
+        durations = sorted(item.delivered_tick - item.created_tick for agent in plain.state.agents
+                           for item in agent.items if item.status == ItemStatus.DELIVERED)
+        live = [item.delivered_tick - item.created_tick for agent in archived.state.agents for item in agent.items
+                if item.status == ItemStatus.DELIVERED]
+        self.assertEqual(sorted((tables['items']['delivered_tick'] - tables['items']['created_tick']).tolist() + live),
+                         durations)
+        self.assertEqual(len(tables['bundles']['costs']), sum(archived.archive.bundles_delivered))
+        self.assertTrue((tables['items']['bundle'] < len(tables['bundles']['costs'])).all())
+
+    def test_live_state_tracks_active_work(self):
+        environment = archived_run(self.path, 100)
+        capacity = sum(agent.capacity for agent in environment.state.agents)
+        for _ in range(400):
+            environment.simulation_step(False)
+            self.assertLessEqual(sum(len(agent.items) for agent in environment.state.agents), 2 * capacity)
+        self.assertGreater(sum(environment.archive.items_delivered), 2 * capacity)
+
+    def test_rollouts_leave_the_archive_alone(self):
+        environment = archived_run(self.path, 100, batch_size=1)
+        rows = dict(environment.archive.rows)
+        counters = environment.archive.config()
+        with environment.rollout(80, False):
+            self.assertEqual(environment.archive.rows, rows)
+            self.assertGreater(environment.archive.pending, 0)
+            with self.assertRaises(ArchiveError):
+                environment.archive.config()
+        self.assertEqual(environment.archive.config(), counters)
+        self.assertEqual(len(read_archive(self.path)['items']['id']), rows['items'])
+
+    def test_checkpoints_cut_the_archive_back(self):
+        environment = archived_run(self.path, 100, batch_size=4)
+        path = os.path.join(self.directory.name, 'checkpoint')
+        save_checkpoint(environment, path)
+        run_simulation(environment, 150, False)
+        environment.archive.close()
+        expected = read_archive(self.path)
+        results = analyze_results(environment, False)
+
+        restored = load_checkpoint(path)
+        self.assertLess(restored.archive.rows['items'], len(expected['items']['id']))
+        run_simulation(restored, 150, False)
+        restored.archive.close()
+        self.assertEqual(analyze_results(restored, False), results)
+        # Ids are random, so items that arrived after the checkpoint get other ones
+        for table, columns in read_archive(self.path).items():
+            for column, values in columns.items():
+                if column != 'id':
+                    self.assertEqual(values.tolist(), expected[table][column].tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import os
+import random
+import tempfile
+import unittest
+
+from src.main import setup_simulation, run_simulation
+from src.simulation.arrivals import Arrival, ArrivalError, PoissonArrivals, BurstyArrivals, TraceArrivals, \
+    arrival_source, read_arrivals, write_arrivals
+from src.simulation.checkpoint import save_checkpoint, load_checkpoint
+from src.tests.test_checkpoint import CONFIG, run_summary
+from src.utils import events
+
+
+def taken(source, ticks: int, pickup_stations: int = 2, delivery_stations: int = 2) -> list[Arrival]:
+    arrivals = []
+    for tick in range(ticks):
+        arrivals.extend(source.take(tick, pickup_stations, delivery_stations))
+    return arrivals
+
+
+class TestArrivals(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.sinks = list(events.bus.sinks)
+        events.headless()
+
+    def tearDown(self):
+        events.bus.set_sinks(self.sinks)
+        self.directory.cleanup()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory.name, name)
+
+    def test_poisson_rate_and_next_tick(self):
+        random.seed(1)
+        source = PoissonArrivals(0.5)
+        arrivals = []
+        for tick in range(4000):
+            next_tick = source.next_tick(tick)
+            ticks_arrivals = source.take(tick, 3, 2)
+            self.assertEqual(bool(ticks_arrivals), next_tick == tick)
+            arrivals.extend(ticks_arrivals)
+        self.assertAlmostEqual(len(arrivals) / 4000, 0.5, delta=0.05)
+        self.assertEqual({arrival.source for arrival in arrivals}, {0, 1, 2})
+
+        capped = PoissonArrivals(2, max_items=5)
+        self.assertEqual(len(taken(capped, 100)), 5)
+        self.assertIsNone(capped.next_tick(100))
+
+    def test_bursty_arrivals_come_in_bursts(self):
+        random.seed(2)
+        source = BurstyArrivals(calm_rate=0.05, burst_rate=3, calm_ticks=50, burst_ticks=5)
+        counts = [len(source.take(tick, 1, 1)) for tick in range(5000)]
+        # Far more spread out than a Poisson process of the same mean, whose variance equals its mean
+        mean = sum(counts) / len(counts)
+        variance = sum((count - mean) ** 2 for count in counts) / len(counts)
+        self.assertGreater(variance, 3 * mean)
+
+    def test_config_rebuilds_the_source_where_it_was(self):
+        random.seed(3)
+        for source in (PoissonArrivals(0.3, max_items=40), BurstyArrivals(0.1, 2, 20, 4)):
+            taken(source, 50)
+            rebuilt = arrival_source(source.config())
+            state = random.getstate()
+            expected = taken(source, 150)
+            random.setstate(state)
+            self.assertEqual(taken(rebuilt, 150), expected)
+            self.assertTrue(expected)
+        with self.assertRaises(ArrivalError):
+            arrival_source({'type': 'unknown'})
+        self.assertIsNone(arrival_source({'interval': 2}))
+
+    def test_traces_stream_from_csv_and_binary(self):
+        orders = [Arrival(0, 0, 1), Arrival(3, 1, 0, 2), Arrival(3, 0, 0), Arrival(7, 1, 1)]
+        for name in ('orders.csv', 'orders.bin'):
+            self.assertEqual(write_arrivals(self.path(name), iter(orders)), 4)
+            self.assertEqual(list(read_arrivals(self.path(name))), orders)
+            source = TraceArrivals(self.path(name))
+            self.assertEqual(source.take(0, 2, 2), orders[:1])
+            self.assertEqual(source.next_tick(1), 3)
+            self.assertEqual(taken(source, 5), orders[1:3])
+            self.assertEqual(source.next_tick(5), 7)
+            self.assertEqual(arrival_source(source.config()).take(7, 2, 2), [orders[3]])
+            source.close()
+
+        # Orders of ticks already passed arrive right away; stations have to exist
+        source = TraceArrivals(self.path('orders.csv'))
+        self.assertEqual(source.take(5, 2, 2), [arrival._replace(tick=5) for arrival in orders[:3]])
+        with self.assertRaises(ArrivalError):
+            source.take(7, 1, 1)
+        with open(self.path('other.bin'), 'wb') as file:
+            file.write(b'not a trace')
+        with self.assertRaises(ArrivalError):
+            TraceArrivals(self.path('other.bin'))
+
+    def test_trace_driven_runs_checkpoint_and_roll_back(self):
+        write_arrivals(self.path('orders.bin'), (Arrival(tick, tick % 2, (tick // 2) % 2, 1 + tick % 3)
+                                                 for tick in range(2, 120, 5)))
+        config = {**CONFIG, 'arrivals': {'type': 'trace', 'path': self.path('orders.bin')}}
+        random.seed(4)
+        environment = run_simulation(setup_simulation(config), 40, False)
+        path = self.path('checkpoint')
+        save_checkpoint(environment, path)
+
+        with environment.rollout(30, False):
+            pass
+        self.assertEqual(environment.tick, 40)
+        expected = run_summary(run_simulation(environment, 60, False))
+        self.assertEqual(environment.items_added, sum(1 + tick % 3 for tick in range(2, 100, 5)))
+
+        restored = load_checkpoint(path)
+        self.assertEqual(run_summary(run_simulation(restored, 60, False)), expected)
+
+    def test_event_driven_runs_match_stepped_ones(self):
+        config = {**CONFIG, 'arrivals': {'type': 'poisson', 'rate': 0.1, 'max_items': 12}}
+        summaries = []
+        for event_driven in (False, True):
+            random.seed(5)
+            summaries.append(run_summary(run_simulation(setup_simulation(config), 150, False,
+                                                        event_driven=event_driven)))
+        self.assertEqual(summaries[0], summaries[1])
+        self.assertEqual(summaries[0]['items_added'], 12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import csv
+import json
+import os
+import tempfile
+import unittest
+
+from src.batch import run_batch, run_experiment, write_rows, experiment_grid
+from src.utils import events
+
+CONFIG = {
+    'grid_size': [12, 12],
+    'obstacles': [[4, 4], [5, 4]],
+    'pickup_stations': [[0, 1], [1, 1]],
+    'delivery_stations': [[11, 11], [10, 3]],
+    'agents': [[2, 8], [9, 2]],
+}
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.default_sinks = events.bus.sinks
+        self.directory = tempfile.TemporaryDirectory()
+        self.config_file = os.path.join(self.directory.name, 'small.json')
+        with open(self.config_file, 'w') as file:
+            json.dump(CONFIG, file)
+
+    def tearDown(self):
+        events.bus.set_sinks(self.default_sinks)
+        self.directory.cleanup()
+
+    def test_experiment_grid_covers_every_combination(self):
+        experiments = experiment_grid(['a.json', 'b.json'], [1, 2, 3], [True, False], 10)
+        self.assertEqual(len(experiments), 12)
+        self.assertEqual(experiments[0], ('a.json', 1, True, 10))
+
+    def test_parallel_runs_match_sequential_runs(self):
+        rows = run_batch([self.config_file], [1, 2], [True, False], 40, workers=2)
+
+        self.assertEqual([(row['seed'], row['selfishness']) for row in rows],
+                         [(1, True), (1, False), (2, True), (2, False)])
+        sequential = run_experiment(self.config_file, 2, False, 40)
+        for key in ('items_delivered', 'total_costs', 'total_items_delivered_per_agent'):
+            self.assertEqual(rows[3][key], sequential[key])
+
+    def test_rows_are_written_as_csv(self):
+        rows = [run_experiment(self.config_file, 0, True, 10)]
+        output = os.path.join(self.directory.name, 'results.csv')
+        write_rows(rows, output)
+
+        with open(output, newline='') as file:
+            written = list(csv.DictReader(file))
+        self.assertEqual(len(written), 1)
+        self.assertEqual(written[0]['config'], 'small.json')
+        self.assertEqual(int(written[0]['rounds']), 10)
@@ -0,0 +1,91 @@
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from src import benchmark
+from src.simulation.pathfinding import find_shortest_path
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_configurations_sweep_one_parameter_at_a_time(self):
+        _, defaults, sweeps = benchmark.BENCHMARKS['auction_winners']
+        configurations = benchmark.configurations('auction_winners')
+
+        self.assertEqual(configurations[0], (None, defaults))
+        for parameter, params in configurations[1:]:
+            changed = [name for name in params if params[name] != defaults[name]]
+            self.assertEqual(changed, [parameter])
+            self.assertIn(params[parameter], sweeps[parameter])
+        self.assertEqual(len({benchmark.key('auction_winners', params) for _, params in configurations}),
+                         len(configurations))
+
+    def test_warehouse_stations_are_reachable(self):
+        state = benchmark.build_environment(16, agents=3, stations=2, items=4).state
+        self.assertEqual(len(state.agents), 3)
+        self.assertEqual(sum(len(station.items) for station in state.pickup_stations), 4)
+        for agent in state.agents:
+            for station in state.pickup_stations + state.delivery_stations:
+                self.assertTrue(find_shortest_path(state, agent.position, station.position))
+
+    def test_measure(self):
+        result = benchmark.measure('find_shortest_path', {'grid': 16}, repeats=1)
+        self.assertEqual(result['key'], 'find_shortest_path[grid=16]')
+        self.assertGreater(result['seconds'], 0)
+        self.assertGreater(result['peak_bytes'], 0)
+
+    def test_compare_flags_slowdowns_beyond_the_threshold(self):
+        baseline = [{'key': 'a', 'seconds': 0.1}, {'key': 'b', 'seconds': 0.1}, {'key': 'c', 'seconds': 0.0001}]
+        results = [{'key': 'a', 'seconds': 0.12}, {'key': 'b', 'seconds': 0.2}, {'key': 'c', 'seconds': 0.0003},
+                   {'key': 'new', 'seconds': 1.0}]
+
+        regressions = benchmark.compare(results, baseline, threshold=0.25)
+        self.assertEqual([regression['key'] for regression in regressions], ['b'])
+        self.assertAlmostEqual(regressions[0]['ratio'], 2.0)
+
+    def test_compare_flags_memory_growth_beyond_its_threshold(self):
+        baseline = [{'key': 'a', 'seconds': 0.1, 'peak_bytes': 1 << 20},
+                    {'key': 'b', 'seconds': 0.1, 'peak_bytes': 1 << 20},
+                    {'key': 'c', 'seconds': 0.1, 'peak_bytes': 1024}]
+        results = [{'key': 'a', 'seconds': 0.1, 'peak_bytes': 3 << 20},
+                   {'key': 'b', 'seconds': 0.3, 'peak_bytes': 1 << 20},
+                   {'key': 'c', 'seconds': 0.1, 'peak_bytes': 4096}]
+
+        regressions = benchmark.compare(results, baseline, threshold=0.25, memory_threshold=0.5)
+        self.assertEqual([(regression['key'], regression['figure']) for regression in regressions],
+                         [('a', 'peak_bytes'), ('b', 'seconds')])
+        self.assertAlmostEqual(regressions[0]['ratio'], 3.0)
+        self.assertEqual(benchmark.compare(results, baseline, threshold=0.25, memory_threshold=3), regressions[1:])
+
+    def test_default_configuration_is_on_every_curve(self):
+        results = [{'benchmark': 'find_shortest_path', 'swept': parameter, 'params': params, 'seconds': params['grid'],
+                    'peak_bytes': 0} for parameter, params in benchmark.configurations('find_shortest_path')]
+        curves = benchmark.scaling_curves(results)
+
+        points = curves['find_shortest_path']['grid']
+        self.assertEqual([point[0] for point in points], [16, 32, 64, 128])
+
+    def test_curves_without_matplotlib_still_compare_against_the_baseline(self):
+        results = [{'benchmark': 'find_shortest_path', 'swept': None, 'key': 'find_shortest_path[grid=16]',
+                    'params': {'grid': 16}, 'seconds': 0.2, 'peak_bytes': 0}]
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = os.path.join(directory, 'baseline.json')
+            with open(baseline, 'w') as file:
+                json.dump([{**results[0], 'seconds': 0.1}], file)
+            args = mock.Mock(benchmarks=None, repeats=1, output=None, curves=os.path.join(directory, 'curves'),
+                             baseline=baseline, threshold=0.25, memory_threshold=0.25)
+            output = io.StringIO()
+            with mock.patch.object(benchmark, 'run_suite', return_value=results), \
+                    mock.patch.dict(sys.modules, {'matplotlib': None}), contextlib.redirect_stdout(output), \
+                    contextlib.redirect_stderr(io.StringIO()):
+                self.assertEqual(benchmark.main(args), 1)
+            self.assertTrue(os.path.isfile(os.path.join(directory, 'curves', 'curves.json')))
+            self.assertIn('REGRESSION find_shortest_path[grid=16]', output.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
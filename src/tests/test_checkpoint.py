@@ -0,0 +1,115 @@
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+from src.main import setup_simulation, run_simulation
+from src.simulation.checkpoint import save_checkpoint, load_checkpoint, Checkpointer, latest_checkpoint, \
+    CheckpointError
+
+CONFIG = {
+    'grid_size': [12, 12],
+    'obstacles': [[4, 4], [5, 4], [6, 4]],
+    'pickup_stations': [[0, 1], [1, 1]],
+    'delivery_stations': [[11, 11], [10, 3]],
+    'agents': [[2, 8], [9, 2]],
+}
+
+
+def run_summary(environment) -> dict:
+    state = environment.state
+    return {
+        'tick': environment.tick,
+        'items_added': environment.items_added,
+        'agents': [(type(agent), agent.position, agent.total_cost, len(agent.winner_bids)) for agent in state.agents],
+        'items': [[(item.created_tick, item.pickup_tick, item.delivered_tick, item.status, item.priority)
+                   for item in agent.items] for agent in state.agents],
+        'stations': [[(item.created_tick, item.status) for item in station.items]
+                     for station in state.pickup_stations],
+        'random': random.random(),
+    }
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_restored_run_continues_identically(self):
+        random.seed(11)
+        environment = run_simulation(setup_simulation(CONFIG), 30, False)
+        path = os.path.join(self.directory.name, 'checkpoint')
+        save_checkpoint(environment, path)
+        expected = run_summary(run_simulation(environment, 50, False))
+
+        restored = load_checkpoint(path)
+        self.assertEqual(restored.tick, 30)
+        self.assertEqual(run_summary(run_simulation(restored, 50, False)), expected)
+
+    def test_restored_run_keeps_its_arrivals(self):
+        random.seed(3)
+        environment = run_simulation(setup_simulation({**CONFIG, 'arrivals': {'interval': 4, 'batch': 2,
+                                                                              'max_items': 20}}), 10, False)
+        path = os.path.join(self.directory.name, 'checkpoint')
+        save_checkpoint(environment, path)
+        expected = run_summary(run_simulation(environment, 30, False))
+
+        restored = load_checkpoint(path)
+        self.assertEqual((restored.arrival_interval, restored.arrival_batch, restored.max_items), (4, 2, 20))
+        self.assertEqual(run_summary(run_simulation(restored, 30, False)), expected)
+
+    def test_restore_keeps_identities_and_references(self):
+        random.seed(5)
+        environment = run_simulation(setup_simulation(CONFIG), 20, True)
+        path = os.path.join(self.directory.name, 'checkpoint')
+        save_checkpoint(environment, path)
+        restored = load_checkpoint(path)
+
+        self.assertEqual([agent.id for agent in restored.state.agents],
+                         [agent.id for agent in environment.state.agents])
+        for agent in restored.state.agents:
+            for bid in agent.winner_bids:
+                self.assertIs(bid['agent'], agent)
+                for item in bid['ordered_bundle']:
+                    self.assertIn(item, agent.items)
+                    self.assertIn(item.source, restored.state.pickup_stations)
+        self.assertTrue(restored.state.obstacle_layer[5, 4])
+
+    def test_checkpointer_keeps_the_latest_checkpoints(self):
+        random.seed(2)
+        checkpointer = Checkpointer(self.directory.name, 5, keep=2)
+        run_simulation(setup_simulation(CONFIG), 22, True, checkpointer)
+
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ['tick_000000000015', 'tick_000000000020'])
+        self.assertEqual(load_checkpoint(latest_checkpoint(self.directory.name)).tick, 20)
+
+    def test_interrupted_save_leaves_the_previous_checkpoint(self):
+        random.seed(7)
+        environment = run_simulation(setup_simulation(CONFIG), 10, False)
+        path = os.path.join(self.directory.name, 'tick_000000000010')
+        save_checkpoint(environment, path)
+        run_simulation(environment, 5, False)
+
+        replace = os.replace
+
+        def crash_before_the_new_checkpoint(source, destination):
+            if source.endswith('.tmp'):
+                raise KeyboardInterrupt
+            replace(source, destination)
+
+        with mock.patch('os.replace', crash_before_the_new_checkpoint), self.assertRaises(KeyboardInterrupt):
+            save_checkpoint(environment, path)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(latest_checkpoint(self.directory.name), path + '.old')
+        self.assertEqual(load_checkpoint(path).tick, 10)
+
+        save_checkpoint(environment, path)
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ['tick_000000000010'])
+        self.assertEqual(load_checkpoint(latest_checkpoint(self.directory.name)).tick, 15)
+
+    def test_missing_checkpoint_raises(self):
+        with self.assertRaises(CheckpointError):
+            load_checkpoint(self.directory.name)
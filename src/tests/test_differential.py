@@ -0,0 +1,52 @@
+import unittest
+
+from src.differential import Engine, ENGINES, compare_engine, compare_paths, first_difference, random_scenario, \
+    run_differential, shrink
+from src.utils import events
+
+
+def _extra_arrivals(environment):
+    environment.arrival_batch += 1
+
+
+class TestDifferential(unittest.TestCase):
+    def test_engines_agree_with_the_reference(self):
+        for seed in range(2):
+            scenario = random_scenario(seed)
+            for name, engine in ENGINES.items():
+                self.assertIsNone(compare_engine(engine, scenario, seed, 40, seed % 2 == 0), name)
+
+    def test_reused_grid_finds_the_same_paths(self):
+        self.assertIsNone(compare_paths(random_scenario(3), pairs=10))
+
+    def test_first_difference(self):
+        self.assertIsNone(first_difference({'a': [1, (2, 3)]}, {'a': [1, (2, 3)]}))
+        self.assertEqual(first_difference({'a': [1, {'b': 2}]}, {'a': [1, {'b': 3}]}), ('a[1].b', 2, 3))
+        self.assertEqual(first_difference([1, 2], [1, 2, 3]), ('', [1, 2], [1, 2, 3]))
+
+    def test_mismatch_is_shrunk(self):
+        engine = Engine(_extra_arrivals)
+        scenario = random_scenario(1)
+        mismatch = compare_engine(engine, scenario, 1, 60, True)
+        self.assertEqual(mismatch['field'], 'items_added')
+
+        shrunk, ticks, shrunk_mismatch = shrink(engine, scenario, 1, 60, True, mismatch)
+        self.assertEqual(ticks, mismatch['tick'])
+        self.assertEqual(len(shrunk['agents']), 1)
+        self.assertEqual(len(shrunk['pickup_stations']), 1)
+        self.assertEqual(len(shrunk['delivery_stations']), 1)
+        self.assertEqual(shrunk['obstacles'], [])
+        self.assertIsNotNone(compare_engine(engine, shrunk, 1, ticks, True))
+
+    def test_run_reports_failures(self):
+        sinks = list(events.bus.sinks)
+        try:
+            failures = run_differential(['broken', 'agent_store'], 1, 30, seed=2,
+                                        engine_table={**ENGINES, 'broken': Engine(_extra_arrivals)})
+        finally:
+            events.bus.set_sinks(sinks)
+        self.assertEqual([failure['engine'] for failure in failures], ['broken'])
+
+
+if __name__ == '__main__':
+    unittest.main()
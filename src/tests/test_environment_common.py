@@ -1,8 +1,8 @@
 import unittest
 from src.simulation.base.grid import Grid
-from src.simulation.base.intentions import Move
+from src.simulation.base.intentions import Move, Pickup
 from src.simulation.environments.common import find_position_after_move, check_for_out_of_bounds_moves, IllegalMove, \
-    enact_move_intention
+    enact_move_intention, IntentionBatch
 from src.simulation.reactive_agents import TopCongestionAgent
 
 
@@ -36,3 +36,28 @@ class TestEnvironmentCommon(unittest.TestCase):
         self.grid_size = None
         self.test_grid = None
         self.agent = None
+
+
+class TestIntentionBatch(unittest.TestCase):
+    def setUp(self):
+        self.board = [[[] for _ in range(10)] for _ in range(10)]
+        self.test_grid = Grid(self.board, [10, 10])
+
+        self.agent_1 = TopCongestionAgent((0, 0))
+        self.agent_2 = TopCongestionAgent((5, 5))
+        self.test_grid.add_board_object(self.agent_1)
+        self.test_grid.add_board_object(self.agent_2)
+
+    def test_batch_collects_intentions_into_columns(self):
+        intentions = [Move(self.agent_2.id, Move.UP), Pickup(self.agent_1.id, 42)]
+        batch = IntentionBatch(intentions, self.test_grid)
+
+        self.assertEqual(list(batch.agent_index), [1, 0])
+        self.assertEqual(list(batch.kind), [IntentionBatch.MOVE, IntentionBatch.PICKUP])
+        self.assertEqual(list(batch.new_y), [4, 0])
+        self.assertEqual(batch.item_id[1], 42)
+
+    def test_out_of_bounds_reports_first_offending_agent(self):
+        intentions = [Move(self.agent_2.id, Move.UP), Move(self.agent_1.id, Move.UP), Move(self.agent_1.id, Move.LEFT)]
+        with self.assertRaisesRegex(IllegalMove, f"Agent {self.agent_1.id} tried to move out of bounds"):
+            check_for_out_of_bounds_moves(IntentionBatch(intentions, self.test_grid), self.test_grid)
@@ -0,0 +1,71 @@
+import os
+import random
+import tempfile
+import unittest
+
+from src.main import setup_simulation, run_simulation
+from src.simulation.base.environment import TICKS_SKIPPED
+from src.simulation.checkpoint import Checkpointer, load_checkpoint, latest_checkpoint
+from src.utils import events
+
+CONFIG = {
+    'grid_size': [12, 12],
+    'obstacles': [[4, 4], [5, 4], [6, 4]],
+    'pickup_stations': [[0, 1], [1, 1]],
+    'delivery_stations': [[11, 11], [10, 3]],
+    'agents': [[2, 8], [9, 2]],
+}
+
+
+def run_summary(environment) -> dict:
+    state = environment.state
+    return {
+        'tick': environment.tick,
+        'items_added': environment.items_added,
+        'agents': [(agent.position, agent.total_cost, len(agent.winner_bids)) for agent in state.agents],
+        'items': [[(item.created_tick, item.pickup_tick, item.delivered_tick, item.status, item.priority)
+                   for item in agent.items] for agent in state.agents],
+        'stations': [[(item.created_tick, item.status) for item in station.items]
+                     for station in state.pickup_stations],
+        'random': random.random(),
+    }
+
+
+class TestEventDriven(unittest.TestCase):
+    def test_event_driven_run_matches_stepping_every_tick(self):
+        for selfishness in (True, False):
+            random.seed(4)
+            expected = run_summary(run_simulation(setup_simulation(CONFIG), 150, selfishness))
+
+            sink = events.bus.add_sink(events.MemorySink())
+            try:
+                random.seed(4)
+                environment = run_simulation(setup_simulation(CONFIG), 150, selfishness, event_driven=True)
+            finally:
+                events.bus.remove_sink(sink)
+
+            self.assertEqual(run_summary(environment), expected)
+            self.assertTrue(sink.of_type(TICKS_SKIPPED))
+
+    def test_no_skipping_while_items_arrive(self):
+        random.seed(1)
+        environment = run_simulation(setup_simulation(CONFIG), 10, True)
+        self.assertEqual(environment.skip_ahead(True, 100), 0)
+
+    def test_drained_simulation_skips_to_the_end(self):
+        environment = setup_simulation(CONFIG)
+        for station in environment.state.pickup_stations:
+            station.items.clear()
+        environment.items_added = 150
+
+        self.assertEqual(environment.skip_ahead(True, 1000), 1000)
+        self.assertEqual(environment.tick, 1000)
+
+    def test_checkpoints_are_taken_across_skipped_ticks(self):
+        with tempfile.TemporaryDirectory() as directory:
+            random.seed(2)
+            checkpointer = Checkpointer(directory, 25, keep=10)
+            run_simulation(setup_simulation(CONFIG), 200, False, checkpointer, event_driven=True)
+
+            self.assertEqual(len(os.listdir(directory)), 8)
+            self.assertEqual(load_checkpoint(latest_checkpoint(directory)).tick, 200)
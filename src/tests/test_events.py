@@ -0,0 +1,62 @@
+import unittest
+
+from src.simulation.base.grid import PickupStation, DeliveryStation
+from src.simulation.base.intentions import Move, MOVE_CREATED
+from src.simulation.base.item import Item, ItemStatus, ITEM_CREATED, ITEM_DELIVERED
+from src.utils import events
+
+
+class FormattingProbe:
+    def __init__(self):
+        self.formatted = 0
+
+    def __format__(self, format_spec):
+        self.formatted += 1
+        return 'probe'
+
+
+class TestEventBus(unittest.TestCase):
+    def setUp(self):
+        self.default_sinks = events.bus.sinks
+        self.sink = events.MemorySink()
+        events.bus.set_sinks([self.sink])
+
+    def tearDown(self):
+        events.bus.set_sinks(self.default_sinks)
+
+    def test_events_carry_structured_fields(self):
+        pickup_station = PickupStation((0, 0))
+        delivery_station = DeliveryStation((1, 1))
+        item = Item(3, pickup_station, delivery_station, ItemStatus.IN_TRANSIT)
+        item.set_status(ItemStatus.DELIVERED, 7)
+
+        created = self.sink.of_type(ITEM_CREATED)
+        delivered = self.sink.of_type(ITEM_DELIVERED)
+        self.assertEqual(len(created), 1)
+        self.assertEqual(created[0]['item_id'], item.id)
+        self.assertEqual(delivered[0]['tick'], 7)
+        self.assertEqual(delivered[0].message, f"Item {item.id} delivered at tick 7")
+
+    def test_messages_are_formatted_lazily(self):
+        probe = FormattingProbe()
+        events.emit(MOVE_CREATED, agent_id=probe, direction=Move.LEFT)
+        self.assertEqual(probe.formatted, 0)
+
+        self.assertIn('probe', self.sink.events[0].message)
+        self.assertEqual(probe.formatted, 1)
+
+    def test_events_below_every_sink_level_are_not_built(self):
+        self.sink.level = events.ERROR
+        events.bus.set_sinks([self.sink])
+
+        events.emit(MOVE_CREATED, agent_id=1, direction=Move.LEFT)
+        self.assertEqual(self.sink.events, [])
+        self.assertFalse(events.bus.enabled_for(events.INFO))
+
+    def test_headless_bus_has_no_sinks(self):
+        events.headless()
+        Move(1, Move.LEFT)
+
+        self.assertEqual(events.bus.sinks, [])
+        self.assertEqual(self.sink.events, [])
+        self.assertFalse(events.bus.enabled_for(events.ERROR))
@@ -0,0 +1,103 @@
+import random
+import unittest
+import urllib.error
+import urllib.request
+
+from src.main import setup_simulation, run_simulation, total_items_awaiting_pickup, total_items_delivered, \
+    total_items_in_transit
+from src.simulation.exposition import MetricsServer
+from src.utils import profiling
+
+CONFIG = {
+    'grid_size': [12, 12],
+    'obstacles': [[4, 4], [5, 4], [6, 4]],
+    'pickup_stations': [[0, 1], [1, 1]],
+    'delivery_stations': [[11, 11], [10, 3]],
+    'agents': [[2, 8], [9, 2]],
+}
+
+
+def scrape(server: MetricsServer) -> dict:
+    with urllib.request.urlopen(f"http://{server.host}:{server.port}/metrics") as response:
+        content_type = response.headers['Content-Type']
+        text = response.read().decode()
+    samples = {}
+    for line in text.splitlines():
+        if not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    samples['content_type'] = content_type
+    return samples
+
+
+class TestExposition(unittest.TestCase):
+    def tearDown(self):
+        profiling.disable()
+
+    def test_scrape_during_and_after_a_run(self):
+        random.seed(4)
+        environment = setup_simulation(CONFIG)
+        server = MetricsServer(environment, port=0)
+        try:
+            self.assertEqual(scrape(server)['simulation_tick'], 0)
+            run_simulation(environment, 40, False)
+            samples = scrape(server)
+        finally:
+            server.close()
+
+        self.assertTrue(samples['content_type'].startswith('text/plain; version=0.0.4'))
+        self.assertEqual(samples['simulation_tick'], 40)
+        self.assertGreater(samples['simulation_ticks_per_second'], 0)
+        self.assertGreater(samples['simulation_bids_total'], 0)
+        self.assertGreater(samples['simulation_auction_seconds_total'], 0)
+        self.assertEqual(samples['simulation_items_delivered_total'],
+                         sum(total_items_delivered(environment, verbose=False).values()))
+        self.assertEqual(samples['simulation_items_in_transit'], total_items_in_transit(environment, verbose=False))
+        self.assertEqual(samples['simulation_pickup_backlog_items{station="0"}'] +
+                         samples['simulation_pickup_backlog_items{station="1"}'],
+                         total_items_awaiting_pickup(environment, verbose=False))
+        self.assertEqual(samples['simulation_delivery_time_ticks_count'],
+                         samples['simulation_items_delivered_total'])
+        self.assertIn('simulation_delivery_time_ticks{quantile="0.99"}', samples)
+        # The server enabled its own profiler, and switches it off again
+        self.assertIsNone(profiling.active)
+
+    def test_unknown_path_is_not_found(self):
+        server = MetricsServer(setup_simulation(CONFIG), port=0)
+        try:
+            with self.assertRaises(urllib.error.HTTPError) as raised:
+                urllib.request.urlopen(f"http://{server.host}:{server.port}/other")
+            self.assertEqual(raised.exception.code, 404)
+        finally:
+            server.close()
+
+    def test_active_profiler_is_shared(self):
+        profiler = profiling.enable(profiling.Profiler())
+        server = MetricsServer(setup_simulation(CONFIG), port=0)
+        server.close()
+        self.assertIs(profiling.active, profiler)
+
+
+    def test_rollouts_are_not_served(self):
+        random.seed(4)
+        environment = setup_simulation(CONFIG)
+        server = MetricsServer(environment, port=0)
+        try:
+            run_simulation(environment, 30, False)
+            before = scrape(server)
+            with environment.rollout(30, False):
+                during = scrape(server)
+            after = scrape(server)
+        finally:
+            server.close()
+
+        for samples in (during, after):
+            for name in ('simulation_tick', 'simulation_items_delivered_total', 'simulation_bids_total',
+                         'simulation_delivery_time_ticks_count'):
+                self.assertEqual(samples[name], before[name], name)
+        # Ticks only publish plain figures, the histograms are copied by scrapes
+        self.assertNotIn('delivery_time', server.snapshot)
+
+
+if __name__ == '__main__':
+    unittest.main()
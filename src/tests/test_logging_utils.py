@@ -1,7 +1,8 @@
 import unittest
 import logging
+import logging.handlers
 import os
-from src.utils import logging_utils
+from src.utils import events, logging_utils
 from src.simulation.base.item import Item, ItemStatus
 
 
@@ -9,9 +10,13 @@ class TestItemLogging(unittest.TestCase):
     def setUp(self):
         self.log_file = os.path.join(os.getcwd(), 'item.log')
         self.logger = logging_utils.setup_logger('ItemLogger', self.log_file)
+        # Tests run headless, this one needs the events written to the log files
+        self.addCleanup(events.bus.set_sinks, list(events.bus.sinks))
+        events.bus.set_sinks([events.LoggingSink()])
 
     def test_item_creation_logs_message(self):
         Item(1, 1, 2, ItemStatus.AWAITING_PICKUP)
+        logging_utils.flush()
         with open(self.log_file, 'r') as f:
             log_messages = f.readlines()
         self.assertGreater(len(log_messages), 0)
@@ -28,5 +33,41 @@ class TestLoggingUtils(unittest.TestCase):
         self.assertEqual(self.logger.name, 'TestLogger')
         self.assertEqual(self.logger.level, logging.INFO)
         self.assertEqual(len(self.logger.handlers), 1)
-        self.assertIsInstance(self.logger.handlers[0], logging.FileHandler)
-        self.assertEqual(self.logger.handlers[0].baseFilename, self.log_file)
+        self.assertIsInstance(self.logger.handlers[0], logging.handlers.QueueHandler)
+        self.assertIsInstance(logging_utils.get_file_handler('TestLogger'), logging.FileHandler)
+        self.assertEqual(logging_utils.get_file_handler('TestLogger').baseFilename, self.log_file)
+
+    def test_setup_logger_is_idempotent(self):
+        logger = logging_utils.setup_logger('TestLogger', self.log_file)
+        other_logger = logging_utils.setup_logger('OtherTestLogger', self.log_file)
+
+        self.assertIs(logger, self.logger)
+        self.assertEqual(len(logger.handlers), 1)
+        self.assertIs(logging_utils.get_file_handler('OtherTestLogger'), logging_utils.get_file_handler('TestLogger'))
+
+    def test_records_are_written_once(self):
+        for _ in range(3):
+            logging_utils.setup_logger('TestLogger', self.log_file)
+        # The log file is appended to across runs, so look for a message unique to this one
+        message = f"written once {os.getpid()} {id(self)}"
+        self.logger.info(message)
+        logging_utils.flush()
+
+        with open(self.log_file, 'r') as f:
+            log_messages = f.readlines()
+        self.assertEqual(sum(message in log_message for log_message in log_messages), 1)
+
+    def test_declared_logger_is_set_up_on_first_use(self):
+        log_file = os.path.join(os.getcwd(), f'declared_{os.getpid()}.log')
+        self.addCleanup(lambda: os.path.exists(log_file) and os.remove(log_file))
+        logging_utils.declare_logger('DeclaredTestLogger', log_file)
+        self.assertIsNone(logging_utils.get_file_handler('DeclaredTestLogger'))
+
+        logger = logging_utils.get_logger('DeclaredTestLogger')
+        self.assertEqual(logging_utils.get_file_handler('DeclaredTestLogger').baseFilename, log_file)
+        # The file is only created with the first record
+        self.assertFalse(os.path.exists(log_file))
+        logger.info("first record")
+        logging_utils.flush()
+        with open(log_file) as f:
+            self.assertIn("first record", f.read())
@@ -0,0 +1,117 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.main import setup_simulation, read_config
+from src.scenarios import generate_scenario
+from src.simulation.base.grid import Grid, Obstacle, InvalidGrid, create_empty_board
+from src.simulation.checkpoint import save_checkpoint, load_checkpoint
+from src.simulation.maps import MapError, encode_rle, decode_rle, load_obstacle_map, save_obstacle_map, \
+    layer_from_positions
+from src.simulation.trace import TraceRecorder, TraceReader
+from src.utils import events
+
+
+class TestMaps(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.sinks = list(events.bus.sinks)
+        events.headless()
+
+    def tearDown(self):
+        events.bus.set_sinks(self.sinks)
+        self.directory.cleanup()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory.name, name)
+
+    def test_rle_round_trip(self):
+        layer = np.random.default_rng(0).random((13, 7)) < 0.3
+        rows = encode_rle(layer)
+        self.assertEqual(len(rows), 7)
+        np.testing.assert_array_equal(decode_rle(rows, (13, 7)), layer)
+        np.testing.assert_array_equal(decode_rle(['2.3#', '', '#'], (5, 3))[:, 0], [False, False, True, True, True])
+        with self.assertRaises(MapError):
+            decode_rle(['4#3.'], (6, 1))
+        with self.assertRaises(MapError):
+            decode_rle(['2x'], (6, 1))
+
+    def test_files_round_trip(self):
+        layer = np.random.default_rng(1).random((11, 6)) < 0.4
+        for name in ('map.npy', 'map.pbm'):
+            save_obstacle_map(layer, self.path(name))
+            np.testing.assert_array_equal(load_obstacle_map(self.path(name), (11, 6)), layer)
+        with self.assertRaises(MapError):
+            load_obstacle_map(self.path('map.npy'), (6, 11))
+
+        # An ASCII graymap: dark pixels are blocked, image rows are the y coordinate
+        with open(self.path('map.pgm'), 'w') as file:
+            file.write("P2\n# a comment\n3 2\n255\n0 255 255\n255 255 10\n")
+        np.testing.assert_array_equal(load_obstacle_map(self.path('map.pgm'), (3, 2)),
+                                      [[True, False], [False, False], [False, True]])
+
+    def test_map_needs_no_obstacle_objects(self):
+        grid = Grid(create_empty_board(4, 3), [4, 3])
+        layer = np.zeros((4, 3), dtype=bool)
+        layer[1, :] = True
+        grid.load_obstacle_map(layer)
+        self.assertEqual(grid.obstacles, [])
+        self.assertTrue(grid.obstacle_layer[1, 2])
+        with self.assertRaises(InvalidGrid):
+            grid.load_obstacle_map(np.zeros((3, 4), dtype=bool))
+
+        obstacle = grid.obstacle_at((1, 2))
+        self.assertIsInstance(obstacle, Obstacle)
+        self.assertIs(grid.obstacle_at((1, 2)), obstacle)
+        self.assertIsNone(grid.obstacle_at((0, 0)))
+
+        # Removing an object from a blocked cell keeps the cell blocked
+        placed = Obstacle((1, 1))
+        grid.add_board_object(placed)
+        grid.remove_board_object(placed, (1, 1))
+        self.assertTrue(grid.obstacle_layer[1, 1])
+
+    def test_mapped_scenario_runs_like_the_listed_one(self):
+        scenario = generate_scenario(20, 16, seed=5, layout='racks', agents=2)
+        layer = layer_from_positions(scenario['obstacles'], (20, 16))
+        save_obstacle_map(layer, self.path('racks.npy'))
+        mapped = {key: value for key, value in scenario.items() if key != 'obstacles'}
+        with open(self.path('mapped.json'), 'w') as file:
+            json.dump({**mapped, 'obstacle_map': 'racks.npy'}, file)
+        self.assertEqual(read_config(self.path('mapped.json'))['obstacle_map'], self.path('racks.npy'))
+
+        results = []
+        for config in (scenario, {**mapped, 'obstacle_map': self.path('racks.npy')},
+                       {**mapped, 'obstacle_map': {'rle': encode_rle(layer)}}):
+            random.seed(3)
+            environment = setup_simulation(config)
+            np.testing.assert_array_equal(environment.state.obstacle_layer, layer)
+            for _ in range(30):
+                environment.simulation_step(False)
+            results.append([tuple(agent.position) for agent in environment.state.agents])
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0], results[2])
+
+    def test_checkpoints_and_traces_keep_the_map(self):
+        scenario = generate_scenario(12, 12, seed=2, layout='aisles', agents=1)
+        layer = layer_from_positions(scenario.pop('obstacles'), (12, 12))
+        environment = setup_simulation({**scenario, 'obstacle_map': {'rle': encode_rle(layer)}})
+
+        save_checkpoint(environment, self.path('checkpoint'))
+        restored = load_checkpoint(self.path('checkpoint'))
+        np.testing.assert_array_equal(restored.state.obstacle_layer, layer)
+        self.assertEqual(restored.state.obstacles, [])
+
+        recorder = TraceRecorder(self.path('run.trace'), environment)
+        for _ in range(3):
+            environment.simulation_step(False)
+        recorder.close()
+        np.testing.assert_array_equal(TraceReader(self.path('run.trace')).state_at(2).grid.obstacle_layer, layer)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import json
+import os
+import random
+import tempfile
+import tracemalloc
+import unittest
+
+from src.main import setup_simulation, run_simulation
+from src.simulation.memory import MemoryTracker, MEMORY_LEAK_SUSPECTED, suspected_leaks, count_objects
+from src.utils import events
+
+CONFIG = {
+    'grid_size': [12, 12],
+    'obstacles': [[4, 4], [5, 4], [6, 4]],
+    'pickup_stations': [[0, 1], [1, 1]],
+    'delivery_stations': [[11, 11], [10, 3]],
+    'agents': [[2, 8], [9, 2]],
+    # Items keep arriving, but slowly enough for the agents to keep up
+    'arrivals': {'interval': 30, 'batch': 1, 'max_items': 10 ** 6},
+}
+
+
+def samples(workloads: list[int], counts: list[int]) -> list[dict]:
+    return [{'workload': workload, 'objects': {'items': count}} for workload, count in zip(workloads, counts)]
+
+
+class TestMemory(unittest.TestCase):
+    def test_growth_under_flat_workload_is_a_leak(self):
+        self.assertEqual(suspected_leaks(samples([3, 5, 2, 4, 4], [7, 7, 8, 9, 10])), ['items'])
+
+    def test_growth_with_the_workload_is_not_a_leak(self):
+        self.assertEqual(suspected_leaks(samples([10, 14, 18, 22, 26], [10, 14, 18, 22, 26])), [])
+
+    def test_counts_going_down_are_not_a_leak(self):
+        self.assertEqual(suspected_leaks(samples([3, 3, 3, 3, 3], [7, 9, 8, 9, 10])), [])
+        self.assertEqual(suspected_leaks(samples([3, 3, 3, 3, 3], [7, 7, 7, 7, 7])), [])
+
+    def test_short_history_is_not_judged(self):
+        self.assertEqual(suspected_leaks(samples([3, 3, 3], [7, 8, 9])), [])
+
+    def test_delivered_items_kept_by_agents_are_flagged(self):
+        sink = events.bus.add_sink(events.MemorySink(events.WARNING))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'memory.jsonl')
+            random.seed(1)
+            environment = setup_simulation(CONFIG)
+            tracker = MemoryTracker(path, environment, interval=25)
+            try:
+                run_simulation(environment, 260, False)
+            finally:
+                tracker.close()
+                events.bus.remove_sink(sink)
+            with open(path) as file:
+                rows = [json.loads(line) for line in file]
+
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertEqual([row['tick'] for row in rows], [0, 25, 50, 75, 100, 125, 150, 175, 200, 225, 250, 259])
+        self.assertEqual(rows[-1]['objects'], count_objects(environment))
+        self.assertIn('agent_items', tracker.leaks)
+        self.assertIn('winner_bids', tracker.leaks)
+        self.assertNotIn('log_handlers', tracker.leaks)
+        self.assertEqual({event['name'] for event in sink.of_type(MEMORY_LEAK_SUSPECTED)}, tracker.leaks)
+        self.assertTrue(any(row['growth'] for row in rows[1:]))
+        self.assertIn('suspected leaks', tracker.report())
+
+
+    def test_rollouts_are_not_sampled(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'memory.jsonl')
+            random.seed(1)
+            environment = setup_simulation(CONFIG)
+            tracker = MemoryTracker(path, environment, interval=10)
+            try:
+                run_simulation(environment, 15, False)
+                with environment.rollout(40, False):
+                    pass
+                run_simulation(environment, 10, False)
+            finally:
+                tracker.close()
+            with open(path) as file:
+                ticks = [json.loads(line)['tick'] for line in file]
+
+        self.assertEqual(ticks, [0, 10, 20, 24])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+
+from src.main import setup_simulation, run_simulation, total_items_delivered, total_items_awaiting_pickup
+from src.simulation.base.item import ItemStatus
+from src.simulation.metrics import Histogram, MetricsCollector
+
+CONFIG = {
+    'grid_size': [12, 12],
+    'obstacles': [[4, 4], [5, 4], [6, 4]],
+    'pickup_stations': [[0, 1], [1, 1]],
+    'delivery_stations': [[11, 11], [10, 3]],
+    'agents': [[2, 8], [9, 2]],
+}
+
+
+class TestHistogram(unittest.TestCase):
+    def test_small_values_are_exact(self):
+        histogram = Histogram()
+        for value in range(1, 11):
+            histogram.record(value)
+
+        self.assertEqual(histogram.count, 10)
+        self.assertEqual(histogram.percentile(50), 5)
+        self.assertEqual(histogram.percentile(95), 10)
+        self.assertEqual(histogram.percentile(99), 10)
+
+    def test_large_values_stay_within_the_bucket_precision(self):
+        histogram = Histogram()
+        values = list(range(1000, 50000, 7))
+        for value in values:
+            histogram.record(value)
+
+        exact = sorted(values)[int(0.95 * len(values)) - 1]
+        self.assertLessEqual(histogram.percentile(95), exact)
+        self.assertGreater(histogram.percentile(95), exact * 0.93)
+
+    def test_histograms_merge(self):
+        first, second = Histogram(), Histogram()
+        for value in range(100):
+            (first if value % 2 else second).record(value)
+
+        merged = Histogram.from_dict(first.to_dict()).merge(second)
+        self.assertEqual(merged.count, 100)
+        self.assertEqual(merged.total, sum(range(100)))
+        self.assertEqual(merged.percentile(50), Histogram.from_dict(merged.to_dict()).percentile(50))
+        self.assertIsNone(Histogram().percentile(50))
+
+
+class TestMetricsCollector(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'metrics.jsonl')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_streamed_metrics_agree_with_the_final_analysis(self):
+        for event_driven in (False, True):
+            random.seed(3)
+            environment = setup_simulation(CONFIG)
+            collector = MetricsCollector(self.path, environment)
+            run_simulation(environment, 150, False, event_driven=event_driven)
+            collector.close()
+
+            with open(self.path) as file:
+                rows = [json.loads(line) for line in file]
+            self.assertEqual(sum(row['ticks'] for row in rows), 150)
+            self.assertEqual(rows[-1]['tick'], 149)
+
+            delivered = sum(total_items_delivered(environment, verbose=False).values())
+            self.assertGreater(delivered, 0)
+            self.assertEqual(sum(row['delivered'] for row in rows), delivered)
+            self.assertEqual(collector.delivery_time.count, delivered)
+            self.assertEqual(sum(rows[-1]['backlog']), total_items_awaiting_pickup(environment, verbose=False))
+
+            delivery_times = sorted(item.delivered_tick - item.created_tick for agent in environment.state.agents
+                                    for item in agent.items if item.status == ItemStatus.DELIVERED)
+            median = delivery_times[(len(delivery_times) + 1) // 2 - 1]
+            self.assertLessEqual(collector.summary()['delivery_time']['p50'], median)
+            self.assertGreater(collector.summary()['delivery_time']['p50'], median * 0.93)
+
+            busy = sum(1 for agent in environment.state.agents if agent.is_assigned_item or agent.is_carrying_item)
+            self.assertEqual(rows[-1]['utilization'], busy / len(environment.state.agents))
+
+    def test_rollouts_are_not_counted(self):
+        random.seed(3)
+        environment = run_simulation(setup_simulation(CONFIG), 40, False)
+        collector = MetricsCollector(self.path, environment)
+        run_simulation(environment, 20, False)
+        totals = dict(collector.totals)
+        with environment.rollout(60, False):
+            pass
+        collector.close()
+
+        self.assertEqual(collector.totals, totals)
+        with open(self.path) as file:
+            self.assertEqual([json.loads(line)['tick'] for line in file], list(range(40, 60)))
+
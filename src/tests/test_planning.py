@@ -0,0 +1,65 @@
+import random
+import unittest
+
+from src.main import setup_simulation, run_simulation
+from src.simulation.base.grid import Obstacle
+from src.simulation.planning import PooledPlanner, freeze
+
+CONFIG = {
+    'grid_size': [12, 12],
+    'obstacles': [[4, 4], [5, 4], [6, 4], [7, 8], [7, 9]],
+    'pickup_stations': [[0, 1], [1, 1]],
+    'delivery_stations': [[11, 11], [10, 3]],
+    'agents': [[2, 8], [9, 2], [6, 6]],
+}
+
+
+def run_summary(environment) -> dict:
+    state = environment.state
+    return {
+        'agents': [(agent.position, agent.total_cost, len(agent.winner_bids)) for agent in state.agents],
+        'items': [[(item.created_tick, item.pickup_tick, item.delivered_tick, item.status, item.priority)
+                   for item in agent.items] for agent in state.agents],
+        'random': random.random(),
+    }
+
+
+class TestPlanning(unittest.TestCase):
+    def test_pooled_decisions_match_sequential_ones(self):
+        for selfishness in (True, False):
+            random.seed(6)
+            expected = run_summary(run_simulation(setup_simulation(CONFIG), 80, selfishness))
+
+            for workers in (1, 3):
+                random.seed(6)
+                environment = setup_simulation(CONFIG)
+                with PooledPlanner(environment.state, workers) as planner:
+                    environment.planner = planner
+                    run_simulation(environment, 80, selfishness)
+                self.assertEqual(run_summary(environment), expected, f"{workers} workers")
+
+    def test_view_leaves_out_agents_at_their_target(self):
+        random.seed(6)
+        environment = run_simulation(setup_simulation(CONFIG), 5, True)
+        agents = [agent for agent in environment.state.agents if agent.is_assigned_item or agent.is_carrying_item]
+        view = freeze(agents, True)
+
+        self.assertEqual([request.agent_index for request in view],
+                         [index for index, agent in enumerate(agents) if agent.target_position(True) != agent.position])
+        for request in view:
+            self.assertEqual(request.position, tuple(agents[request.agent_index].position))
+
+    def test_pool_restarts_when_the_map_changes(self):
+        random.seed(6)
+        environment = setup_simulation(CONFIG)
+        with PooledPlanner(environment.state, 2) as planner:
+            environment.planner = planner
+            run_simulation(environment, 5, True)
+            executor = planner.executor
+            run_simulation(environment, 5, True)
+            self.assertIs(planner.executor, executor)
+
+            environment.state.add_board_object(Obstacle((11, 0)))
+            run_simulation(environment, 5, True)
+            self.assertIsNot(planner.executor, executor)
+            self.assertEqual(planner.map_version, environment.state.map_version)
@@ -0,0 +1,79 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+
+from src.main import setup_simulation, run_simulation
+from src.simulation.pathfinding import tsp_path
+from src.utils import profiling
+
+CONFIG = {
+    'grid_size': [12, 12],
+    'obstacles': [[4, 4], [5, 4], [6, 4]],
+    'pickup_stations': [[0, 1], [1, 1]],
+    'delivery_stations': [[11, 11], [10, 3]],
+    'agents': [[2, 8], [9, 2]],
+}
+
+
+class TestProfiling(unittest.TestCase):
+    def tearDown(self):
+        profiling.disable()
+
+    def test_phases_and_counters_of_a_run(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'profile.jsonl')
+            profiler = profiling.enable(profiling.Profiler(path))
+            random.seed(4)
+            run_simulation(setup_simulation(CONFIG), 20, False)
+            profiling.disable()
+            profiler.close()
+
+            with open(path) as file:
+                rows = [json.loads(line) for line in file]
+
+        self.assertEqual([row['tick'] for row in rows], list(range(20)))
+        breakdown = profiler.breakdown()
+        self.assertEqual(breakdown['ticks'], 20)
+        for name in ('tick', 'bidding', 'winner_determination', 'assignment', 'intention_generation', 'validation',
+                     'conflict_resolution', 'enactment'):
+            self.assertIn(name, breakdown['phases'])
+        self.assertLessEqual(breakdown['phases']['bidding']['seconds'], breakdown['phases']['tick']['seconds'])
+        self.assertEqual(breakdown['counters']['intentions']['total'],
+                         sum(row['counters'].get('intentions', 0) for row in rows))
+        self.assertGreater(breakdown['counters']['bids']['total'], 0)
+        self.assertGreaterEqual(breakdown['counters']['nodes_expanded']['total'],
+                                breakdown['counters']['astar_calls']['total'])
+        self.assertIn('winner_determination', profiler.report())
+
+    def test_rollouts_are_not_profiled(self):
+        profiler = profiling.enable(profiling.Profiler())
+        random.seed(4)
+        environment = run_simulation(setup_simulation(CONFIG), 20, False)
+        ticks, phases, counters = profiler.ticks, dict(profiler.phases), dict(profiler.counters)
+        with environment.rollout(30, False):
+            pass
+
+        self.assertEqual(profiler.ticks, ticks)
+        self.assertEqual(profiler.phases, phases)
+        self.assertEqual(profiler.counters, counters)
+        self.assertFalse(profiler.tick_phases)
+        self.assertFalse(profiler.tick_counters)
+
+    def test_every_search_is_counted(self):
+        profiler = profiling.enable(profiling.Profiler())
+        state = setup_simulation(CONFIG).state
+        path = tsp_path(state, (0, 0), (11, 11))
+        tsp_path(state, (0, 0), (0, 3))
+        profiler.end_tick(0)
+
+        self.assertEqual(profiler.counters['astar_calls'], 2)
+        self.assertGreaterEqual(profiler.counters['nodes_expanded'], len(path))
+
+    def test_disabled_profiler_records_nothing(self):
+        profiler = profiling.Profiler()
+        random.seed(4)
+        run_simulation(setup_simulation(CONFIG), 3, True)
+        self.assertEqual(profiler.ticks, 0)
+        self.assertFalse(profiler.tick_phases)
@@ -0,0 +1,131 @@
+import importlib.util
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from src.main import setup_simulation, run_simulation
+from src.simulation.rendering import Frame, FrameSlot, Renderer, capture_frame, capture_layout, chunks, \
+    render_frames, frame_path
+from src.simulation.trace import TraceRecorder
+
+CONFIG = {
+    'grid_size': [12, 12],
+    'obstacles': [[4, 4], [5, 4], [6, 4]],
+    'pickup_stations': [[0, 1], [1, 1]],
+    'delivery_stations': [[11, 11], [10, 3]],
+    'agents': [[2, 8], [9, 2]],
+}
+
+
+def _write_frames(name: str, count: int) -> None:
+    slot = FrameSlot(2, 3, name)
+    for tick in range(count):
+        slot.write(Frame(tick, np.full((2, 2), tick), np.full(2, tick), np.full(3, tick)))
+    slot.close()
+
+
+def _window_left_open(*_) -> None:
+    time.sleep(60)
+
+
+class TestRendering(unittest.TestCase):
+    def test_frames_capture_positions_loads_and_backlog(self):
+        random.seed(2)
+        environment = run_simulation(setup_simulation(CONFIG), 15, False)
+        state = environment.state
+        frame = capture_frame(state, environment.tick)
+
+        self.assertEqual(frame.positions.tolist(), [list(agent.position) for agent in state.agents])
+        self.assertEqual(frame.loads.tolist(), [agent.capacity - agent.current_capacity for agent in state.agents])
+        self.assertEqual(frame.backlog.tolist(), [len(station.items) for station in state.pickup_stations])
+        state.use_agent_store()
+        self.assertEqual(capture_frame(state, environment.tick).positions.tolist(), frame.positions.tolist())
+
+        layout = capture_layout(state)
+        self.assertEqual(layout.pickup_stations.tolist(), CONFIG['pickup_stations'])
+        self.assertTrue(layout.obstacles[5, 4])
+
+    def test_slot_holds_the_latest_frame(self):
+        slot = FrameSlot(2, 3)
+        try:
+            reader = FrameSlot(2, 3, slot.name)
+            self.assertIsNone(reader.read())
+            for tick in (1, 2):
+                slot.write(Frame(tick, np.full((2, 2), tick), np.full(2, tick), np.arange(3)))
+            frame = reader.read()
+            self.assertEqual(frame.tick, 2)
+            self.assertEqual(frame.positions.tolist(), [[2, 2], [2, 2]])
+            self.assertEqual(frame.backlog.tolist(), [0, 1, 2])
+            reader.close()
+        finally:
+            slot.close()
+
+    def test_frames_read_while_written_by_another_process_are_whole(self):
+        slot = FrameSlot(2, 3)
+        writer = multiprocessing.Process(target=_write_frames, args=(slot.name, 20000))
+        writer.start()
+        try:
+            ticks = []
+            while writer.is_alive() or not ticks:
+                frame = slot.read()
+                if frame is not None:
+                    ticks.append(frame.tick)
+                    values = np.concatenate([frame.positions.ravel(), frame.loads, frame.backlog])
+                    self.assertTrue((values == frame.tick).all(), frame)
+            writer.join()
+            self.assertEqual(slot.read().tick, 19999)
+            self.assertEqual(ticks, sorted(ticks))
+        finally:
+            slot.close()
+
+    def test_closing_does_not_wait_for_the_window(self):
+        with mock.patch('src.simulation.rendering._display', _window_left_open):
+            renderer = Renderer(setup_simulation(CONFIG).state)
+        started = time.perf_counter()
+        renderer.close(0.2)
+        self.assertLess(time.perf_counter() - started, 10)
+        self.assertFalse(renderer.process.is_alive())
+
+    def test_rollouts_are_not_shown(self):
+        random.seed(2)
+        environment = setup_simulation(CONFIG)
+        with mock.patch('src.simulation.rendering._display', _window_left_open):
+            renderer = Renderer(environment.state)
+        try:
+            run_simulation(environment, 5, False)
+            frame = renderer.slot.read()
+            with environment.rollout(10, False):
+                self.assertEqual(renderer.slot.read().tick, frame.tick)
+            self.assertEqual(renderer.slot.read().positions.tolist(), frame.positions.tolist())
+        finally:
+            renderer.close(0)
+
+    def test_chunks(self):
+        self.assertEqual(chunks(0, 10, 1, 3), [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]])
+        self.assertEqual(chunks(0, 10, 4, 8), [[0], [4], [8]])
+        self.assertEqual(chunks(5, 5, 1, 2), [])
+
+    @unittest.skipUnless(importlib.util.find_spec('matplotlib'), "matplotlib is not installed")
+    def test_render_frames_of_a_trace(self):
+        with tempfile.TemporaryDirectory() as directory:
+            trace = os.path.join(directory, 'run.trace')
+            random.seed(2)
+            environment = setup_simulation(CONFIG)
+            recorder = TraceRecorder(trace, environment, 10)
+            run_simulation(environment, 12, False)
+            recorder.close()
+
+            frames = os.path.join(directory, 'frames')
+            self.assertEqual(render_frames(trace, frames, step=3, workers=2), 5)
+            for tick in (0, 3, 6, 9, 12):
+                self.assertTrue(os.path.isfile(frame_path(frames, tick)))
+
+
+if __name__ == '__main__':
+    unittest.main()
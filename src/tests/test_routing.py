@@ -0,0 +1,125 @@
+import itertools
+import os
+import random
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.main import setup_simulation, run_simulation, total_items_delivered
+from src.scenarios import generate_scenario
+from src.simulation.base.grid import Grid, Obstacle
+from src.simulation.base.item import Item, ItemStatus
+from src.simulation.checkpoint import save_checkpoint, load_checkpoint
+from src.simulation.pathfinding import tsp_path
+from src.simulation.routing import RoutePlanner, Stop, distance_field
+from src.tests.test_checkpoint import CONFIG, run_summary
+from src.utils import events
+
+
+def route_length(planner: RoutePlanner, start, route: list[Stop]) -> int:
+    length, at = 0, start
+    for stop in route:
+        length += planner.distances().distance(at, tuple(stop.position))
+        at = tuple(stop.position)
+    return length
+
+
+def feasible(route: list[Stop], carried: list[Item], capacity: int) -> bool:
+    on_board, picked = len(carried), {id(item) for item in carried}
+    for stop in route:
+        if stop.pickup:
+            on_board += 1
+            picked.add(id(stop.item))
+        elif id(stop.item) not in picked:
+            return False
+        else:
+            on_board -= 1
+        if on_board > capacity:
+            return False
+    return True
+
+
+class TestRouting(unittest.TestCase):
+    def setUp(self):
+        self.sinks = list(events.bus.sinks)
+        events.headless()
+
+    def tearDown(self):
+        events.bus.set_sinks(self.sinks)
+
+    def warehouse(self, seed: int) -> tuple[Grid, list[Item]]:
+        scenario = generate_scenario(16, 12, seed=seed, layout='racks', agents=1)
+        state = setup_simulation({**scenario, 'bundle_routing': 'pdp'}).state
+        rng = random.Random(seed)
+        items = [Item(0, rng.choice(state.pickup_stations), rng.choice(state.delivery_stations)) for _ in range(4)]
+        return state, items
+
+    def test_distances_match_shortest_paths(self):
+        state, _ = self.warehouse(1)
+        stations = state.pickup_stations + state.delivery_stations
+        for station in stations:
+            field = distance_field(state.obstacle_layer, tuple(station.position))
+            for other in stations:
+                self.assertEqual(field[other.position[0], other.position[1]],
+                                 len(tsp_path(state, other.position, station.position)) - 1)
+
+    def test_table_is_rebuilt_when_the_map_changes(self):
+        state, _ = self.warehouse(2)
+        planner = state.route_planner
+        table = planner.distances()
+        station = tuple(state.pickup_stations[0].position)
+        table.distance(tuple(state.agents[0].position), station)
+        self.assertEqual(table.fields[station].dtype, np.int32)
+        self.assertIs(planner.distances(), table)
+
+        free = tuple(int(value) for value in np.argwhere(~state.obstacle_layer & ~state.pickup_layer &
+                                                          ~state.delivery_layer)[-1])
+        state.add_board_object(Obstacle(free))
+        self.assertIsNot(planner.distances(), table)
+        self.assertTrue(planner.distances().obstacle_layer[free])
+
+    def test_routes_are_the_shortest_feasible_ones(self):
+        for seed in range(3):
+            state, items = self.warehouse(seed)
+            planner = state.route_planner
+            start = tuple(state.agents[0].position)
+            carried, assigned = items[:1], items[1:]
+            for capacity in (1, 2, 4):
+                route, length = planner.plan(start, carried, assigned, capacity)
+                self.assertEqual(length, route_length(planner, start, route))
+                self.assertTrue(feasible(route, carried, capacity))
+                self.assertEqual(len(route), 2 * len(assigned) + len(carried))
+
+                stops = [Stop(item, False) for item in carried] + \
+                        [Stop(item, pickup) for item in assigned for pickup in (True, False)]
+                best = min(route_length(planner, start, list(order)) for order in itertools.permutations(stops)
+                           if feasible(list(order), carried, capacity))
+                self.assertEqual(length, best)
+
+    def test_routed_runs_deliver_and_checkpoint(self):
+        config = {**CONFIG, 'agent_capacity': 2, 'bundle_routing': 'pdp'}
+        random.seed(8)
+        environment = run_simulation(setup_simulation(config), 60, False)
+        self.assertGreater(sum(total_items_delivered(environment, False).values()), 0)
+        self.assertTrue(any(agent.route for agent in environment.state.agents))
+        for agent in environment.state.agents:
+            pending = [stop for stop in agent.route if not stop.done]
+            self.assertTrue(feasible(pending, agent.get_carried_items(), agent.capacity))
+            self.assertEqual({id(stop.item) for stop in pending},
+                             {id(item) for item in agent.items if item.status != ItemStatus.DELIVERED})
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'checkpoint')
+            save_checkpoint(environment, path)
+            expected = run_summary(run_simulation(environment, 60, False))
+            restored = load_checkpoint(path)
+            self.assertIsNotNone(restored.state.route_planner)
+            self.assertEqual(run_summary(run_simulation(restored, 60, False)), expected)
+
+        with self.assertRaises(ValueError):
+            setup_simulation({**CONFIG, 'bundle_routing': 'fastest'})
+
+
+if __name__ == '__main__':
+    unittest.main()
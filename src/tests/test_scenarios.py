@@ -0,0 +1,62 @@
+import random
+import unittest
+
+import numpy as np
+
+from src.main import setup_simulation
+from src.scenarios import generate_scenario, largest_open_area, LAYOUTS, PLACEMENTS
+from src.simulation.pathfinding import tsp_path
+
+
+class TestScenarios(unittest.TestCase):
+    def test_same_seed_same_scenario(self):
+        self.assertEqual(generate_scenario(30, 20, seed=3, layout='random'),
+                         generate_scenario(30, 20, seed=3, layout='random'))
+        self.assertNotEqual(generate_scenario(30, 20, seed=3, layout='random')['obstacles'],
+                            generate_scenario(30, 20, seed=4, layout='random')['obstacles'])
+
+    def test_every_station_is_reachable_from_every_agent(self):
+        for layout in LAYOUTS:
+            for placement in PLACEMENTS:
+                scenario = generate_scenario(24, 18, seed=1, layout=layout, placement=placement,
+                                             obstacle_density=0.35, agents=4)
+                state = setup_simulation(scenario).state
+                for agent in state.agents:
+                    self.assertFalse(state.obstacle_layer[agent.position[0], agent.position[1]])
+                    for station in state.pickup_stations + state.delivery_stations:
+                        self.assertTrue(tsp_path(state, agent.position, station.position),
+                                        f"{layout}/{placement}: {station.position} unreachable")
+
+    def test_pockets_are_blocked(self):
+        blocked = np.zeros((5, 5), dtype=bool)
+        blocked[2, :] = True
+        blocked[3, 4] = True
+        open_area = largest_open_area(blocked)
+        self.assertEqual(open_area.sum(), 10)
+        self.assertTrue(open_area[0, 0])
+        self.assertFalse(open_area[4, 0])
+
+    def test_too_dense_layout_is_rejected(self):
+        with self.assertRaises(ValueError):
+            generate_scenario(10, 10, layout='random', obstacle_density=0.95, agents=20)
+
+    def test_capacity_and_arrivals_reach_the_environment(self):
+        scenario = generate_scenario(20, 20, seed=2, agents=1, capacity=2, arrival_interval=5, arrival_batch=2,
+                                     max_items=4)
+        environment = setup_simulation(scenario)
+        self.assertEqual(environment.state.agents[0].capacity, 2)
+
+        random.seed(0)
+        added = []
+        for _ in range(16):
+            environment.simulation_step(False)
+            added.append(environment.items_added)
+        # Two items at ticks 5 and 10, none after the fourth
+        self.assertEqual(added[4], 0)
+        self.assertEqual(added[5], 2)
+        self.assertEqual(added[10], 4)
+        self.assertEqual(added[15], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import random
+import unittest
+
+from src.main import setup_simulation, run_simulation
+from src.simulation.base.grid import Obstacle
+from src.simulation.base.item import ItemStatus
+from src.simulation.sharding import RegionWorkers, Region, RegionStep, partition, agent_record, AGENT_HANDED_OFF
+from src.utils import events
+
+CONFIG = {
+    'grid_size': [12, 12],
+    'obstacles': [[4, 4], [5, 4], [6, 4], [7, 8], [7, 9]],
+    'pickup_stations': [[0, 1], [1, 1]],
+    'delivery_stations': [[11, 11], [10, 3]],
+    'agents': [[2, 8], [9, 2], [6, 6]],
+}
+
+
+def run_summary(environment) -> dict:
+    state = environment.state
+    return {
+        'agents': [(list(agent.position), agent.total_cost, len(agent.winner_bids)) for agent in state.agents],
+        'items': [[(item.created_tick, item.pickup_tick, item.delivered_tick, item.status, item.priority)
+                   for item in agent.items] for agent in state.agents],
+        'stations': [[item.created_tick for item in station.items] for station in state.pickup_stations],
+        'random': random.random(),
+    }
+
+
+def run_sharded(shards: int, ticks: int, selfishness: bool, event_driven: bool = False):
+    environment = setup_simulation(CONFIG)
+    with RegionWorkers(environment, shards) as regions:
+        environment.regions = regions
+        run_simulation(environment, ticks, selfishness, event_driven=event_driven)
+    return environment
+
+
+class TestSharding(unittest.TestCase):
+    def test_partition_splits_columns_evenly(self):
+        self.assertEqual(partition(12, 1), [])
+        self.assertEqual(partition(12, 3), [4, 8])
+        self.assertEqual(partition(10, 4), [2, 5, 8])
+
+    def test_runs_are_deterministic_and_match_the_unsharded_run(self):
+        for selfishness in (True, False):
+            random.seed(9)
+            expected = run_summary(run_simulation(setup_simulation(CONFIG), 80, selfishness))
+
+            for shards in (1, 2, 3):
+                random.seed(9)
+                self.assertEqual(run_summary(run_sharded(shards, 80, selfishness)), expected, f"{shards} shards")
+
+    def test_regions_are_refilled_after_skipped_ticks(self):
+        random.seed(4)
+        expected = run_summary(run_simulation(setup_simulation(CONFIG), 120, False))
+        random.seed(4)
+        self.assertEqual(run_summary(run_sharded(3, 120, False, event_driven=True)), expected)
+
+    def test_agents_crossing_regions_are_handed_off(self):
+        random.seed(9)
+        sink = events.bus.add_sink(events.MemorySink(events.DEBUG))
+        try:
+            environment = run_sharded(3, 40, False)
+        finally:
+            events.bus.remove_sink(sink)
+
+        handoffs = sink.of_type(AGENT_HANDED_OFF)
+        self.assertTrue(handoffs)
+        agent_ids = {agent.id for agent in environment.state.agents}
+        for event in handoffs:
+            self.assertIn(event['agent_id'], agent_ids)
+            self.assertEqual(abs(event['from_region'] - event['to_region']), 1)
+
+    def test_region_enacts_its_agents_and_hands_off_the_ones_leaving(self):
+        environment = setup_simulation({**CONFIG, 'agents': [[6, 11]]})
+        state = environment.state
+        agent = state.agents[0]
+        station = state.pickup_stations[0]
+        item = station.items.pop(0)
+        item.agent_id = agent.id
+        item.set_status(ItemStatus.IN_TRANSIT, 0)
+        agent.items.append(item)
+
+        region = Region(type(environment), state.obstacle_layer.copy(), state.grid_size,
+                        [(station.id.bytes, station.position) for station in state.pickup_stations],
+                        [(station.id.bytes, station.position) for station in state.delivery_stations], range(0, 7))
+        record = agent_record(agent, {id(station): 0}, {id(item.destination): 0})
+        intentions, departed = region.step(RegionStep(0, False, 0, True, None, [], [record]))
+
+        # The agent heads for the delivery station at (11, 11), out of the columns of the region
+        self.assertEqual([intention.direction for intention in intentions], [(1, 0)])
+        self.assertEqual(region.grid.agents, [])
+        self.assertEqual([(record.id, list(record.position)) for record in departed], [(agent.id.bytes, [7, 11])])
+        self.assertEqual([item_record.status for item_record in departed[0].items], [ItemStatus.IN_TRANSIT.value])
+        self.assertEqual(region.step(RegionStep(1, False, 1, False, None, [], [])), ([], []))
+
+    def test_map_changes_reach_the_regions(self):
+        summaries = []
+        for shards in (0, 2):
+            random.seed(6)
+            environment = setup_simulation(CONFIG)
+            regions = environment.regions = RegionWorkers(environment, shards) if shards else None
+            try:
+                run_simulation(environment, 10, True)
+                for position in ((2, 0), (2, 1), (2, 2), (2, 3)):
+                    environment.state.add_board_object(Obstacle(position))
+                run_simulation(environment, 40, True)
+            finally:
+                if regions is not None:
+                    regions.close()
+            summaries.append(run_summary(environment))
+        self.assertEqual(summaries[1], summaries[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import unittest
+
+import numpy as np
+
+from src.simulation.base.grid import Grid, Obstacle, PickupStation, DeliveryStation, create_empty_board
+from src.simulation.base.item import Item, ItemStatus
+from src.simulation.base.snapshots import SnapshotError
+from src.simulation.environments.top_congestion_environment import TopCongestionEnvironment
+from src.simulation.reactive_agents import TopCongestionAgent
+
+
+class TestSnapshots(unittest.TestCase):
+    def setUp(self):
+        self.board = [[[] for _ in range(10)] for _ in range(10)]
+        self.grid = Grid(self.board, [10, 10])
+
+        self.agent = TopCongestionAgent((0, 0), 2)
+        # Moved agents hold list positions, so stations use lists as they do when read from a JSON config
+        self.pickup_station = PickupStation(position=[3, 0])
+        self.delivery_station = DeliveryStation(position=[6, 0])
+        self.item = Item(0, self.pickup_station, self.delivery_station, ItemStatus.AWAITING_PICKUP)
+        self.pickup_station.items.append(self.item)
+
+        self.grid.add_board_object(self.agent)
+        self.grid.add_board_object(self.pickup_station)
+        self.grid.add_board_object(self.delivery_station)
+
+        self.environment = TopCongestionEnvironment(self.grid)
+
+    def test_rollout_is_discarded_on_restore(self):
+        with self.environment.rollout(10, True):
+            self.assertEqual(self.item.status, ItemStatus.DELIVERED)
+            self.assertEqual(self.environment.tick, 10)
+            self.assertEqual(self.agent.total_cost, 2)
+
+        self.assertEqual(self.environment.tick, 0)
+        self.assertEqual(self.item.status, ItemStatus.AWAITING_PICKUP)
+        self.assertEqual(self.agent.position, (0, 0))
+        self.assertEqual(self.agent.items, [])
+        self.assertEqual(self.agent.winner_bids, [])
+        self.assertEqual(self.agent.total_cost, 0)
+        self.assertEqual(self.pickup_station.items, [self.item])
+        self.assertEqual(self.board[0][0], [self.agent])
+        self.assertEqual(self.board[6][0], [self.delivery_station])
+
+    def test_restored_state_replays_identically(self):
+        with self.environment.rollout(10, True):
+            pass
+        self.environment.simulation_step(True)
+        for _ in range(9):
+            self.environment.simulation_step(True)
+
+        self.assertEqual(self.item.status, ItemStatus.DELIVERED)
+        self.assertEqual(self.agent.total_cost, 2)
+        # Ten steps generate three items per step after the first one
+        self.assertEqual(self.environment.items_added, 27)
+
+    def test_released_snapshot_keeps_changes(self):
+        snapshot = self.environment.snapshot()
+        self.environment.simulation_step(True)
+        snapshot.release()
+
+        self.assertEqual(self.environment.tick, 1)
+        self.assertEqual(self.item.status, ItemStatus.ASSIGNED_TO_AGENT)
+
+    def test_nested_snapshots_restore_in_order(self):
+        outer = self.environment.snapshot()
+        self.environment.simulation_step(True)
+        inner = self.environment.snapshot()
+        self.environment.simulation_step(True)
+
+        with self.assertRaises(SnapshotError):
+            outer.restore()
+
+        inner.restore()
+        self.assertEqual(self.agent.position, [1, 0])
+        self.assertEqual(self.item.status, ItemStatus.ASSIGNED_TO_AGENT)
+
+        outer.restore()
+        self.assertEqual(self.item.status, ItemStatus.AWAITING_PICKUP)
+        self.assertEqual(self.environment.tick, 0)
+
+    def test_board_changes_journal_cells_not_layers(self):
+        grid = Grid(create_empty_board(400, 300), [400, 300])
+        blocked = Obstacle((5, 5))
+        grid.add_board_object(blocked)
+        layers = [grid.obstacle_layer.copy(), grid.pickup_layer.copy()]
+
+        snapshot = TopCongestionEnvironment(grid).snapshot()
+        grid.add_board_object(Obstacle((1, 2)))
+        grid.add_board_object(PickupStation([3, 4]))
+        grid.remove_board_object(blocked, (5, 5))
+        grid.load_obstacle_map(np.eye(400, 300, dtype=bool))
+        # The grid's layers and map are left to the cell journal, nothing of board size is copied
+        journal = snapshot._journal
+        copied = [copy for _, _, copies in journal.saved_objects.values() for copy in copies.values()]
+        self.assertFalse(any(getattr(copy, 'size', 0) >= 400 * 300 for copy in copied))
+        self.assertLess(sum(values.size for _, _, values in journal.saved_cells), 400 * 300)
+
+        snapshot.restore()
+        np.testing.assert_array_equal(grid.obstacle_layer, layers[0])
+        np.testing.assert_array_equal(grid.pickup_layer, layers[1])
+        self.assertEqual(grid.obstacles, [blocked])
+        self.assertEqual(grid.pickup_stations, [])
+        self.assertIsNone(grid.map_layer)
+
+    def test_map_version_follows_the_obstacle_layer(self):
+        grid = Grid(create_empty_board(8, 8), [8, 8])
+        version = grid.map_version
+        grid.add_board_object(PickupStation([1, 1]))
+        self.assertEqual(grid.map_version, version)
+        blocked = Obstacle((2, 2))
+        grid.add_board_object(blocked)
+        self.assertNotEqual(grid.map_version, version)
+
+        version = grid.map_version
+        snapshot = TopCongestionEnvironment(grid).snapshot()
+        grid.remove_board_object(blocked, (2, 2))
+        rollout_version = grid.map_version
+        self.assertNotEqual(rollout_version, version)
+        snapshot.restore()
+        self.assertEqual(grid.map_version, version)
+        # Versions are not handed out again, the map changed after the restore is not the rollout's
+        grid.load_obstacle_map(np.eye(8, dtype=bool))
+        self.assertNotIn(grid.map_version, (version, rollout_version))
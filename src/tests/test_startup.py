@@ -0,0 +1,25 @@
+import unittest
+
+from src.startup import measure_import, import_breakdown, measure_spinup
+
+
+class TestStartup(unittest.TestCase):
+    def test_importing_has_no_side_effects(self):
+        result = measure_import('src.main', repeats=1)
+        self.assertEqual(result['files'], [])
+        self.assertEqual(result['threads'], 0)
+        self.assertGreater(result['process_seconds'], result['seconds'])
+
+    def test_optional_dependencies_are_not_imported(self):
+        imported = import_breakdown('src.main')
+        self.assertIn('src.simulation.base.environment', imported)
+        for module in ('pathfinding.finder.a_star', 'logging.handlers', 'http.server', 'tracemalloc',
+                       'multiprocessing.shared_memory', 'concurrent.futures.process'):
+            self.assertNotIn(module, imported)
+
+    def test_worker_spinup(self):
+        self.assertGreater(measure_spinup('src.simulation.pathfinding', workers=1), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
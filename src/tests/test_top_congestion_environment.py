@@ -7,7 +7,8 @@ from src.simulation.environments.common import IllegalMove, IllegalPickup, Illeg
     group_intentions_by_item_to_pickup, IllegalDelivery
 from src.simulation.environments.top_congestion_environment import check_for_collisions_with_obstacles, \
     check_for_pickups_from_outside_station, check_for_deliveries_from_outside_station, \
-    check_if_intentions_come_from_unique_agents, conflicts_for_same_item, _enact_pickup_intention
+    check_if_intentions_come_from_unique_agents, conflicts_for_same_item, _enact_pickup_intention, \
+    TopCongestionEnvironment, overflowing_pickups
 from src.simulation.reactive_agents import TopCongestionAgent
 
 
@@ -168,3 +169,56 @@ class TestTopCongestionEnvironment(unittest.TestCase):
 
         _enact_pickup_intention(pickup_intention, self.grid, 0)
         self.assertEqual(len(self.pickup_station.items), 0)
+
+    def test_illegal_intentions_checks_moves_before_pickups(self):
+        self.board = [[[] for _ in range(11)] for _ in range(11)]
+        self.grid = Grid(self.board, [11, 11])
+
+        self.agent_1 = TopCongestionAgent((1, 0))
+        self.agent_2 = TopCongestionAgent((2, 3))
+        self.obstacle = Obstacle(position=(3, 3))
+        self.grid.add_board_object(self.agent_1)
+        self.grid.add_board_object(self.agent_2)
+        self.grid.add_board_object(self.obstacle)
+
+        intentions = [Pickup(self.agent_1.id, None), Move(self.agent_2.id, Move.RIGHT)]
+        environment = TopCongestionEnvironment(self.grid)
+
+        with self.assertRaisesRegex(IllegalMove, f"Agent {self.agent_2.id} tried to move into an"):
+            environment._illegal_intentions(intentions, self.grid)
+
+    def test_obstacle_layer_tracks_removed_obstacles(self):
+        self.board = [[[] for _ in range(11)] for _ in range(11)]
+        self.grid = Grid(self.board, [11, 11])
+
+        self.agent = TopCongestionAgent((2, 3))
+        self.obstacle = Obstacle(position=(3, 3))
+        self.grid.add_board_object(self.agent)
+        self.grid.add_board_object(self.obstacle)
+        self.grid.remove_board_object(self.obstacle, self.obstacle.position)
+
+        check_for_collisions_with_obstacles([Move(self.agent.id, Move.RIGHT)], self.grid)
+
+    def test_overflowing_pickups(self):
+        self.board = [[[] for _ in range(11)] for _ in range(11)]
+        self.grid = Grid(self.board, [11, 11])
+
+        # Positions read from a JSON config are lists, agents moved by the environment are lists as well
+        self.agent_1 = TopCongestionAgent([1, 1])
+        self.agent_2 = TopCongestionAgent((1, 1))
+        self.pickup_station = PickupStation(position=[1, 1])
+        self.delivery_station = DeliveryStation(position=(2, 2))
+        self.item = Item(0, self.pickup_station, self.delivery_station, ItemStatus.AWAITING_PICKUP)
+        self.pickup_station.items.append(self.item)
+
+        self.grid.add_board_object(self.agent_1)
+        self.grid.add_board_object(self.agent_2)
+        self.grid.add_board_object(self.pickup_station)
+        self.grid.add_board_object(self.delivery_station)
+
+        intentions = [Pickup(self.agent_1.id, None), Pickup(self.agent_2.id, None)]
+        grouped_intentions = group_intentions_by_item_to_pickup(intentions, self.grid)
+        overflowing = overflowing_pickups(grouped_intentions, self.grid)
+
+        self.assertEqual(len(overflowing), 1)
+        self.assertIn(overflowing[0], intentions)
@@ -0,0 +1,153 @@
+import os
+import random
+import tempfile
+import unittest
+
+from src.simulation.base.grid import Grid, PickupStation, DeliveryStation, Obstacle
+from src.simulation.base.item import Item, ItemStatus
+from src.simulation.environments.top_congestion_environment import TopCongestionEnvironment
+from src.simulation.reactive_agents import TopCongestionAgent
+from src.simulation.trace import TraceRecorder, TraceReader, TraceError, RECORD
+
+
+def state_summary(grid: Grid) -> dict:
+    return {
+        'agents': [(agent.id, list(agent.position), agent.total_cost, [item.id for item in agent.items],
+                    [(bid['costs'], [item.id for item in bid['ordered_bundle']]) for bid in agent.winner_bids])
+                   for agent in grid.agents],
+        'stations': [[(item.id, item.status, item.pickup_tick, item.delivered_tick) for item in station.items]
+                     for station in grid.pickup_stations],
+        'items': sorted((item.id, item.status, item.priority, item.pickup_tick, item.delivered_tick)
+                        for agent in grid.agents for item in agent.items),
+    }
+
+
+class TestTrace(unittest.TestCase):
+    def setUp(self):
+        random.seed(3)
+        self.board = [[[] for _ in range(10)] for _ in range(10)]
+        self.grid = Grid(self.board, [10, 10])
+
+        self.grid.add_board_object(TopCongestionAgent((0, 0), 2))
+        self.grid.add_board_object(TopCongestionAgent([9, 9], 1))
+        self.grid.add_board_object(Obstacle((4, 4)))
+        self.pickup_station = PickupStation(position=[3, 0])
+        self.grid.add_board_object(self.pickup_station)
+        self.grid.add_board_object(DeliveryStation(position=[6, 6]))
+        self.pickup_station.items.append(
+            Item(0, self.pickup_station, self.grid.delivery_stations[0], ItemStatus.AWAITING_PICKUP))
+
+        self.environment = TopCongestionEnvironment(self.grid)
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'run.trace')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_states_step_through_the_trace(self):
+        recorder = TraceRecorder(self.path, self.environment, keyframe_interval=8)
+        summaries = {}
+        for _ in range(20):
+            summaries[self.environment.tick] = state_summary(self.environment.state)
+            self.environment.simulation_step(True)
+        summaries[self.environment.tick] = state_summary(self.environment.state)
+        recorder.close()
+
+        reader = TraceReader(self.path)
+        self.assertEqual(reader.last_tick, 20)
+        stepped = {tick: state_summary(state.grid) for tick, state in reader.states(5, 100)}
+        self.assertEqual(list(stepped), list(range(5, 21)))
+        for tick, summary in stepped.items():
+            self.assertEqual(summary, summaries[tick], f"tick {tick}")
+
+    def test_replay_rebuilds_state_at_every_tick(self):
+        recorder = TraceRecorder(self.path, self.environment, keyframe_interval=8)
+        summaries = {}
+        for _ in range(40):
+            summaries[self.environment.tick] = state_summary(self.environment.state)
+            self.environment.simulation_step(True)
+        summaries[self.environment.tick] = state_summary(self.environment.state)
+        recorder.close()
+
+        reader = TraceReader(self.path)
+        self.assertEqual([keyframe[0] for keyframe in reader.keyframes], [0, 8, 16, 24, 32, 40])
+        self.assertGreater(reader.state_at(40).grid.agents[0].total_cost, 0)
+        for tick, summary in summaries.items():
+            replayed = reader.state_at(tick)
+            self.assertEqual(replayed.tick, tick)
+            self.assertEqual(state_summary(replayed.grid), summary, f"State differs at tick {tick}")
+
+    def test_replay_of_event_driven_run(self):
+        recorder = TraceRecorder(self.path, self.environment, keyframe_interval=16)
+        summaries = {}
+        while self.environment.tick < 120:
+            summaries[self.environment.tick] = state_summary(self.environment.state)
+            if not self.environment.skip_ahead(False, 120 - self.environment.tick):
+                self.environment.simulation_step(False)
+        summaries[self.environment.tick] = state_summary(self.environment.state)
+        recorder.close()
+
+        self.assertLess(len(summaries), 121)
+        reader = TraceReader(self.path)
+        for tick, summary in summaries.items():
+            replayed = reader.state_at(tick)
+            self.assertEqual(replayed.tick, tick)
+            self.assertEqual(state_summary(replayed.grid), summary, f"State differs at tick {tick}")
+
+        # Skipped ticks replay too, with agents a step further along their paths every tick
+        self.assertEqual([keyframe[0] for keyframe in reader.keyframes], list(range(0, 120, 16)))
+        previous = None
+        for tick, state in reader.states(0, 121):
+            summary = state_summary(state.grid)
+            self.assertEqual(state_summary(reader.state_at(tick).grid), summary, f"State differs at tick {tick}")
+            if tick in summaries:
+                self.assertEqual(summary, summaries[tick])
+            positions = [agent.position for agent in state.grid.agents]
+            if previous is not None:
+                for (x, y), (previous_x, previous_y) in zip(positions, previous):
+                    self.assertLessEqual(abs(x - previous_x) + abs(y - previous_y), 1)
+            previous = [list(position) for position in positions]
+
+    def test_rollouts_are_not_recorded(self):
+        recorder = TraceRecorder(self.path, self.environment, keyframe_interval=4)
+        for _ in range(5):
+            self.environment.simulation_step(True)
+        recorder.file.flush()
+        recorder.keyframes.flush()
+        records, keyframes = recorder.records_written, os.path.getsize(self.path + '.keyframes')
+        with self.environment.rollout(10, True):
+            pass
+        recorder.file.flush()
+        recorder.keyframes.flush()
+        self.assertEqual(recorder.records_written, records)
+        self.assertEqual(os.path.getsize(self.path + '.keyframes'), keyframes)
+
+        summaries = {}
+        for _ in range(5):
+            summaries[self.environment.tick] = state_summary(self.environment.state)
+            self.environment.simulation_step(True)
+        summaries[self.environment.tick] = state_summary(self.environment.state)
+        recorder.close()
+
+        reader = TraceReader(self.path)
+        self.assertEqual(reader.last_tick, 10)
+        for tick, summary in summaries.items():
+            self.assertEqual(state_summary(reader.state_at(tick).grid), summary, f"State differs at tick {tick}")
+
+    def test_records_have_fixed_width(self):
+        recorder = TraceRecorder(self.path, self.environment)
+        for _ in range(5):
+            self.environment.simulation_step(True)
+        recorder.close()
+
+        reader = TraceReader(self.path)
+        self.assertEqual(os.path.getsize(self.path), 12 + reader.number_of_records * RECORD.size)
+        self.assertEqual(sum(1 for record in reader.records() if record[0] == 0), 5)
+
+    def test_state_after_end_of_trace_raises(self):
+        recorder = TraceRecorder(self.path, self.environment)
+        self.environment.simulation_step(True)
+        recorder.close()
+
+        with self.assertRaises(TraceError):
+            TraceReader(self.path).state_at(5)
@@ -0,0 +1,169 @@
+"""Structured event bus for simulation instrumentation.
+
+Every module declares the typed events it emits, like it declares its logger. Emitting an event checks the level
+against the bus threshold before anything else happens, messages are only formatted when a sink asks for them, and sinks
+are pluggable, so a run without sinks pays essentially nothing for its instrumentation."""
+
+import json
+import logging
+
+from src.utils import logging_utils
+
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+# Threshold of a bus without sinks, above every level
+DISABLED = logging.CRITICAL + 1
+
+
+class EventType:
+    """A kind of event: the channel (logger name) it is routed to, its level and the template of its message.
+
+    :param bool console: whether the event is echoed to the console
+    :param bool log: whether the event is written to the log file of its channel"""
+
+    __slots__ = ('name', 'channel', 'template', 'level', 'console', 'log')
+
+    def __init__(self, name: str, channel: str, template: str, level: int = INFO, console: bool = True,
+                 log: bool = True):
+        self.name = name
+        self.channel = channel
+        self.template = template
+        self.level = level
+        self.console = console
+        self.log = log
+
+    def __repr__(self):
+        return f"EventType({self.name!r})"
+
+
+class Event:
+    __slots__ = ('type', 'fields', '_message')
+
+    def __init__(self, event_type: EventType, fields: dict):
+        self.type = event_type
+        self.fields = fields
+        self._message = None
+
+    @property
+    def message(self) -> str:
+        if self._message is None:
+            self._message = self.type.template.format(**self.fields)
+        return self._message
+
+    def __getitem__(self, field):
+        return self.fields[field]
+
+
+class Sink:
+    """Receives every event at or above its level"""
+
+    def __init__(self, level: int = INFO):
+        self.level = level
+
+    def handle(self, event: Event) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class ConsoleSink(Sink):
+    def handle(self, event: Event) -> None:
+        if event.type.console:
+            print(event.message)
+
+
+class LoggingSink(Sink):
+    """Forwards events to the standard logger named after their channel, which is set up with the first event on it"""
+
+    def __init__(self, level: int = INFO):
+        super().__init__(level)
+        self._loggers = {}
+
+    def handle(self, event: Event) -> None:
+        if event.type.log:
+            logger = self._loggers.get(event.type.channel)
+            if logger is None:
+                logger = self._loggers[event.type.channel] = logging_utils.get_logger(event.type.channel)
+            if logger.isEnabledFor(event.type.level):
+                logger.log(event.type.level, event.message)
+
+
+class MemorySink(Sink):
+    def __init__(self, level: int = INFO):
+        super().__init__(level)
+        self.events = []
+
+    def handle(self, event: Event) -> None:
+        self.events.append(event)
+
+    def of_type(self, event_type: EventType) -> list[Event]:
+        return [event for event in self.events if event.type is event_type]
+
+
+class FileSink(Sink):
+    """Writes one JSON line per event to a single file"""
+
+    def __init__(self, path: str, level: int = INFO):
+        super().__init__(level)
+        self.file = open(path, 'w')
+
+    def handle(self, event: Event) -> None:
+        record = {'event': event.type.name, 'channel': event.type.channel, 'message': event.message}
+        self.file.write(json.dumps(record) + '\n')
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class EventBus:
+    def __init__(self, sinks: list[Sink] = None):
+        self.sinks = []
+        self.threshold = DISABLED
+        for sink in sinks or []:
+            self.add_sink(sink)
+
+    def _update_threshold(self):
+        self.threshold = min((sink.level for sink in self.sinks), default=DISABLED)
+
+    def add_sink(self, sink: Sink) -> Sink:
+        self.sinks.append(sink)
+        self._update_threshold()
+        return sink
+
+    def remove_sink(self, sink: Sink) -> None:
+        self.sinks.remove(sink)
+        self._update_threshold()
+
+    def set_sinks(self, sinks: list[Sink]) -> None:
+        self.sinks = list(sinks)
+        self._update_threshold()
+
+    def enabled_for(self, level: int) -> bool:
+        return level >= self.threshold
+
+    def emit(self, event_type: EventType, **fields) -> None:
+        if event_type.level < self.threshold:
+            return
+        event = Event(event_type, fields)
+        for sink in self.sinks:
+            if event_type.level >= sink.level:
+                sink.handle(event)
+
+
+# By default events are printed and written to the per-channel log files, as the simulation always did
+bus = EventBus([ConsoleSink(), LoggingSink()])
+
+
+def emit(event_type: EventType, **fields) -> None:
+    if event_type.level < bus.threshold:
+        return
+    bus.emit(event_type, **fields)
+
+
+def headless() -> None:
+    """Switch off all instrumentation"""
+    bus.set_sinks([])
@@ -1,16 +1,122 @@
+import atexit
 import logging
+import os
+import queue
+import threading
+
+# All loggers enqueue their records here; a single background listener writes them to the log files, so the
+# simulation never blocks on disk
+_queue = queue.Queue()
+_file_handlers = {}  # log file path -> BatchingFileHandler
+_routes = {}  # logger name -> BatchingFileHandler
+_declared = {}  # logger name -> (log file path, level), set up on first use
+_lock = threading.Lock()
+_listener = None
+
+
+class BatchingFileHandler(logging.FileHandler):
+    """File handler that flushes its stream once every `batch_size` records instead of after every record"""
+
+    def __init__(self, filename, batch_size: int = 256):
+        # The file is only created once the first record is written
+        super().__init__(filename, delay=True)
+        self.batch_size = batch_size
+        self._pending = 0
+
+    def emit(self, record):
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(self.format(record) + self.terminator)
+            self._pending += 1
+            if self._pending >= self.batch_size:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        super().flush()
+        self._pending = 0
+
+
+class _RoutingHandler(logging.Handler):
+    """Runs on the listener thread and hands every record to the file handler of its logger"""
+
+    def handle(self, record):
+        handler = _routes.get(record.name)
+        if handler is not None and record.levelno >= handler.level:
+            handler.handle(record)
+        return True
+
+
+def _start_listener():
+    global _listener
+    if _listener is None:
+        import logging.handlers
+        _listener = logging.handlers.QueueListener(_queue, _RoutingHandler())
+        _listener.start()
 
 
 def setup_logger(name, log_file, level=logging.INFO):
-    """To set up as many loggers as you want"""
+    """To set up as many loggers as you want. Calling it again for the same logger does not add handlers, and loggers
+    writing to the same file share a single file handler"""
+    # logging.handlers pulls in sockets, which is only paid for once something is actually logged
+    import logging.handlers
 
     formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
+    path = os.path.abspath(log_file)
+
+    with _lock:
+        handler = _file_handlers.get(path)
+        if handler is None:
+            handler = BatchingFileHandler(path)
+            handler.setFormatter(formatter)
+            _file_handlers[path] = handler
+        _routes[name] = handler
 
-    handler = logging.FileHandler(log_file)
-    handler.setFormatter(formatter)
+        logger = logging.getLogger(name)
+        logger.setLevel(level)
+        if not any(isinstance(existing, logging.handlers.QueueHandler) for existing in logger.handlers):
+            logger.addHandler(logging.handlers.QueueHandler(_queue))
 
-    logger = logging.getLogger(name)
-    logger.setLevel(level)
-    logger.addHandler(handler)
+        _start_listener()
 
     return logger
+
+
+def declare_logger(name, log_file, level=logging.INFO):
+    """Declare the log file of a logger without setting it up: no file is opened and no thread started until the
+    logger is first asked for with get_logger. Modules declare their loggers at import time this way"""
+    _declared[name] = (os.path.abspath(log_file), level)
+
+
+def get_logger(name) -> logging.Logger:
+    """The logger of the given name, set up on its first use if it was declared"""
+    if name in _declared and name not in _routes:
+        setup_logger(name, *_declared[name])
+    return logging.getLogger(name)
+
+
+def get_file_handler(name) -> BatchingFileHandler | None:
+    """The file handler the records of a logger end up in"""
+    return _routes.get(name)
+
+
+def flush():
+    """Block until every queued record has been written and the log files are flushed"""
+    if _listener is not None:
+        _queue.join()
+    for handler in list(_file_handlers.values()):
+        handler.flush()
+
+
+def shutdown():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    for handler in list(_file_handlers.values()):
+        handler.flush()
+
+
+atexit.register(shutdown)
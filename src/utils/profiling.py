@@ -0,0 +1,119 @@
+"""Per-phase timers and counters of the simulation pipeline.
+
+The stages of a tick are wrapped in `with profiling.phase(name):` and the interesting operations call
+`profiling.count(name)`. Both do nothing beyond a global lookup until a Profiler is enabled. An enabled Profiler adds up
+the time spent per phase and the counters, both per tick and over the whole run, and can stream the per-tick figures as
+JSON lines to a file. Phases nest: the time of an inner phase is also part of the outer one.
+
+Work done in worker processes (see planning and sharding) is not counted, only the time the tick waited for it."""
+
+import json
+import time
+from collections import defaultdict
+
+active = None
+
+
+class _NoPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+
+class _Phase:
+    __slots__ = ('profiler', 'name', 'started')
+
+    def __init__(self, profiler: 'Profiler', name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.tick_phases[self.name] += time.perf_counter() - self.started
+        return False
+
+
+def phase(name: str):
+    return _NO_PHASE if active is None else _Phase(active, name)
+
+
+def count(name: str, value: int = 1) -> None:
+    if active is not None:
+        active.tick_counters[name] += value
+
+
+class Profiler:
+    def __init__(self, path: str = None):
+        self.file = open(path, 'w', buffering=1) if path else None
+        self.ticks = 0
+        self.phases = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.tick_phases = defaultdict(float)
+        self.tick_counters = defaultdict(int)
+
+    def end_tick(self, tick: int, ticks: int = 1) -> dict:
+        """Fold the figures of the tick that just ended into the run totals, and write them out if streaming"""
+        summary = {'tick': tick, 'ticks': ticks, 'phases': dict(self.tick_phases), 'counters': dict(self.tick_counters)}
+        for name, seconds in self.tick_phases.items():
+            self.phases[name] += seconds
+        for name, value in self.tick_counters.items():
+            self.counters[name] += value
+        self.ticks += ticks
+        self.tick_phases.clear()
+        self.tick_counters.clear()
+        if self.file is not None:
+            self.file.write(json.dumps(summary) + '\n')
+        return summary
+
+    def discard_tick(self) -> None:
+        """Drop the figures of the tick that just ended, e.g. one of a rollout that is undone again"""
+        self.tick_phases.clear()
+        self.tick_counters.clear()
+
+    def breakdown(self) -> dict:
+        tick_time = self.phases.get('tick', 0) + self.phases.get('skip', 0)
+        return {
+            'ticks': self.ticks,
+            'phases': {name: {'seconds': seconds, 'share': seconds / tick_time if tick_time else 0,
+                              'per_tick': seconds / self.ticks if self.ticks else 0}
+                       for name, seconds in self.phases.items()},
+            'counters': {name: {'total': value, 'per_tick': value / self.ticks if self.ticks else 0}
+                         for name, value in self.counters.items()},
+        }
+
+    def report(self) -> str:
+        breakdown = self.breakdown()
+        lines = [f"Profile of {breakdown['ticks']} ticks",
+                 f"{'phase':<24}{'total s':>12}{'share':>10}{'ms/tick':>12}"]
+        for name, figures in sorted(breakdown['phases'].items(), key=lambda entry: -entry[1]['seconds']):
+            lines.append(f"{name:<24}{figures['seconds']:>12.3f}{figures['share']:>10.1%}"
+                         f"{figures['per_tick'] * 1000:>12.3f}")
+        lines.append(f"{'counter':<24}{'total':>12}{'':>10}{'per tick':>12}")
+        for name, figures in sorted(breakdown['counters'].items()):
+            lines.append(f"{name:<24}{figures['total']:>12}{'':>10}{figures['per_tick']:>12.1f}")
+        return '\n'.join(lines)
+
+    def close(self) -> None:
+        if self.file is not None and not self.file.closed:
+            self.file.close()
+
+
+def enable(profiler: Profiler) -> Profiler:
+    global active
+    active = profiler
+    return profiler
+
+
+def disable() -> None:
+    global active
+    active = None